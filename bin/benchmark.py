@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""Benchmark a running stack against a fake Ollama and a fake webhook receiver.
+
+Both fakes are served from this process. Point the stack at them, e.g. in .env:
+
+    OLLAMA_URL=http://host.docker.internal:11437
+    WEBHOOK_URL=http://host.docker.internal:11436
+
+then run this to send jobs at a target rate (--rps) or concurrency (--concurrency)
+for --duration seconds, and wait for their webhooks. Intake latency, end-to-end
+job latency and throughput are reported, along with database transactions and
+broker commands per job given --database-url and --broker-url (these count
+everything else on the servers too, so use a dedicated stack). Results are saved
+to --output as JSON; pass an earlier run's results to --compare to flag
+regressions, e.g. between serving with and without WEB_ASGI.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import math
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterable, MutableMapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# Results compared by --compare, and whether higher is better.
+COMPARED_RESULTS = {
+    "intake_p50": False,
+    "intake_p99": False,
+    "end_to_end_p50": False,
+    "end_to_end_p99": False,
+    "jobs_per_second": True,
+    "database_transactions_per_job": False,
+    "broker_commands_per_job": False,
+}
+
+
+async def read_body(receive: Receive) -> bytes:
+    """Read a whole ASGI request body."""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def start_response(
+    send: Send, status: int, content_type: bytes = b"application/json"
+) -> None:
+    """Start an ASGI response."""
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type)],
+    })
+
+
+async def send_json(send: Send, status: int, data: Any) -> None:
+    """Send a whole JSON ASGI response."""
+    await start_response(send, status)
+    await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+
+@dataclass
+class FakeOllama:
+    """Respond to Ollama API requests after a delay, streaming tokens at a rate.
+
+    Time to first token follows a log-normal distribution. Some requests fail with
+    error_status instead, like an overloaded Ollama.
+    """
+
+    latency_median: float
+    latency_sigma: float
+    tokens: int
+    tokens_per_second: float
+    error_rate: float
+    error_status: int
+    requests: Counter[str] = field(default_factory=Counter)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request."""
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        self.requests[path] += 1
+        body = await read_body(receive)
+        try:
+            request = json.loads(body) if body else {}
+        except ValueError:
+            request = {}
+        model = request.get("model", "fake") if isinstance(request, dict) else "fake"
+
+        match path:
+            case "/api/tags" | "/api/ps":
+                await send_json(
+                    send, 200, {"models": [{"name": model, "digest": "fake"}]}
+                )
+                return
+            case "/api/embed" | "/api/embeddings":
+                await asyncio.sleep(self.latency())
+                await send_json(send, 200, {"model": model, "embeddings": [[0.0] * 8]})
+                return
+
+        if random.random() < self.error_rate:  # noqa: S311
+            await send_json(send, self.error_status, {"error": "Overloaded."})
+            return
+
+        await asyncio.sleep(self.latency())
+        if not request.get("stream", True):
+            await asyncio.sleep(self.tokens / self.tokens_per_second)
+            await send_json(send, 200, self.chunk(model, "token " * self.tokens))
+            return
+
+        await start_response(send, 200, b"application/x-ndjson")
+        for _ in range(self.tokens):
+            await send({
+                "type": "http.response.body",
+                "body": json.dumps(self.chunk(model, "token ")).encode() + b"\n",
+                "more_body": True,
+            })
+            await asyncio.sleep(1 / self.tokens_per_second)
+        await send({
+            "type": "http.response.body",
+            "body": json.dumps(self.chunk(model, "", done=True)).encode() + b"\n",
+        })
+
+    def latency(self) -> float:
+        """Pick how long to wait before responding."""
+        return random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+
+    @staticmethod
+    def chunk(model: str, response: str, *, done: bool = False) -> dict[str, Any]:
+        """Build a response chunk."""
+        return {"model": model, "response": response, "done": done}
+
+
+@dataclass
+class FakeWebhook:
+    """Record when each job's response content arrives."""
+
+    received: dict[str, float] = field(default_factory=dict)
+    requests: int = 0
+    arrived: asyncio.Event = field(default_factory=asyncio.Event)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request."""
+        if scope["type"] != "http":
+            return
+
+        self.requests += 1
+        body = await read_body(receive)
+        now = time.monotonic()
+        query = parse_qs(scope["query_string"].decode())
+        if "job" in query:
+            # Streamed parts come before the whole response content.
+            if "part" not in query:
+                self.received.setdefault(query["job"][0], now)
+        else:
+            # A batch, as a JSON array or NDJSON.
+            try:
+                items = json.loads(body)
+            except ValueError:
+                items = [json.loads(line) for line in body.splitlines() if line]
+            for item in items:
+                if item.get("part") is None:
+                    self.received.setdefault(item["job"], now)
+
+        self.arrived.set()
+        await start_response(send, 200, b"text/plain")
+        await send({"type": "http.response.body", "body": b"Thank you!"})
+
+    async def wait_for(self, jobs: Iterable[str], seconds: float) -> None:
+        """Wait until every job's response content has arrived, or for some seconds."""
+        waiting = set(jobs)
+        with contextlib.suppress(TimeoutError):
+            async with asyncio.timeout(seconds):
+                while waiting - self.received.keys():
+                    self.arrived.clear()
+                    await self.arrived.wait()
+
+
+@dataclass
+class Load:
+    """Send jobs to the stack, recording when each was sent and how it went."""
+
+    client: httpx.AsyncClient
+    url: str
+    model: str
+    stream: bool
+    sent: dict[str, float] = field(default_factory=dict)
+    intake: list[float] = field(default_factory=list)
+    statuses: Counter[int] = field(default_factory=Counter)
+    errors: int = 0
+
+    async def send_job(self) -> None:
+        """Send a job."""
+        started = time.monotonic()
+        try:
+            response = await self.client.post(
+                self.url,
+                json={
+                    "model": self.model,
+                    "prompt": "Tell me a joke.",
+                    "stream": self.stream,
+                },
+            )
+        except httpx.HTTPError:
+            self.errors += 1
+            return
+
+        self.intake.append(time.monotonic() - started)
+        self.statuses[response.status_code] += 1
+        if response.is_success:
+            self.sent[response.json()["job"]] = started
+
+    async def at_rate(self, rps: float, duration: float) -> None:
+        """Send jobs at a steady rate, however long each takes."""
+        tasks = set()
+        deadline = time.monotonic() + duration
+        next_job = time.monotonic()
+        while next_job < deadline:
+            task = asyncio.create_task(self.send_job())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_job += 1 / rps
+            await asyncio.sleep(max(0, next_job - time.monotonic()))
+        await asyncio.gather(*tasks)
+
+    async def at_concurrency(self, concurrency: int, duration: float) -> None:
+        """Send jobs from several loops at once, each waiting for the last."""
+        deadline = time.monotonic() + duration
+
+        async def loop() -> None:
+            while time.monotonic() < deadline:
+                await self.send_job()
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+
+
+def percentile(values: list[float], percent: int) -> float | None:
+    """Get a percentile of some values, if there are enough of them."""
+    if len(values) < 2:  # noqa: PLR2004
+        return values[0] if values else None
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def database_transactions(database_url: str) -> int:
+    """Count transactions committed or rolled back in the database so far."""
+    import psycopg
+
+    with psycopg.connect(database_url, autocommit=True) as connection:
+        row = connection.execute(
+            "SELECT xact_commit + xact_rollback FROM pg_stat_database"
+            " WHERE datname = current_database()"
+        ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def broker_commands(broker_url: str) -> int:
+    """Count commands processed by the Redis broker so far."""
+    import redis
+
+    with redis.Redis.from_url(broker_url) as broker:
+        return int(broker.info("stats")["total_commands_processed"])
+
+
+def git_commit() -> str | None:
+    """Get the commit being benchmarked, if this is a git checkout."""
+    try:
+        return subprocess.run(  # noqa: S603
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def serve(app: Any, port: int) -> tuple[uvicorn.Server, asyncio.Task[None]]:
+    """Start serving an ASGI app in the background."""
+    server = uvicorn.Server(
+        uvicorn.Config(
+            app,
+            host="0.0.0.0",  # noqa: S104
+            port=port,
+            lifespan="off",
+            log_level="warning",
+        )
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    """Run a benchmark, returning its results."""
+    ollama = FakeOllama(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        tokens=args.tokens,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    webhook = FakeWebhook()
+    servers = [
+        await serve(ollama, args.ollama_port),
+        await serve(webhook, args.webhook_port),
+    ]
+
+    transactions = database_transactions(args.database_url) if args.database_url else 0
+    commands = broker_commands(args.broker_url) if args.broker_url else 0
+    limits = httpx.Limits(max_connections=args.max_connections)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        load = Load(
+            client=client,
+            url=args.url.rstrip("/") + "/api/generate",
+            model=args.model,
+            stream=args.stream,
+        )
+        started = time.monotonic()
+        if args.rps:
+            await load.at_rate(args.rps, args.duration)
+        else:
+            await load.at_concurrency(args.concurrency, args.duration)
+
+        await webhook.wait_for(load.sent, args.drain_timeout)
+
+    for server, task in servers:
+        server.should_exit = True
+        await task
+
+    completed = {
+        job: webhook.received[job] - sent
+        for job, sent in load.sent.items()
+        if job in webhook.received
+    }
+    elapsed = (
+        max(webhook.received[job] for job in completed) - started if completed else 0
+    )
+    results: dict[str, Any] = {
+        "sent": sum(load.statuses.values()) + load.errors,
+        "accepted": len(load.sent),
+        "completed": len(completed),
+        "incomplete": len(load.sent) - len(completed),
+        "statuses": {str(status): count for status, count in load.statuses.items()},
+        "connection_errors": load.errors,
+        "intake_p50": percentile(load.intake, 50),
+        "intake_p99": percentile(load.intake, 99),
+        "end_to_end_p50": percentile(list(completed.values()), 50),
+        "end_to_end_p99": percentile(list(completed.values()), 99),
+        "jobs_per_second": len(completed) / elapsed if elapsed else None,
+        "ollama_requests": dict(ollama.requests),
+        "webhook_requests": webhook.requests,
+    }
+
+    # Database statistics are only published every so often.
+    await asyncio.sleep(1)
+    if args.database_url and completed:
+        results["database_transactions_per_job"] = (
+            database_transactions(args.database_url) - transactions
+        ) / len(completed)
+    if args.broker_url and completed:
+        results["broker_commands_per_job"] = (
+            broker_commands(args.broker_url) - commands
+        ) / len(completed)
+    return results
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    """Describe which results are worse than the baseline's by more than tolerance."""
+    regressions = []
+    for name, higher_is_better in COMPARED_RESULTS.items():
+        new, old = results.get(name), baseline.get(name)
+        if not new or not old:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:11435")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--stream", action="store_true", help="Ask for streaming.")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rps", type=float, help="Jobs to send per second.")
+    load.add_argument(
+        "--concurrency", type=int, default=8, help="Jobs to send at once."
+    )
+    parser.add_argument("--duration", type=float, default=30, help="Seconds.")
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=120,
+        help="Seconds to wait for webhooks once all jobs have been sent.",
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-connections", type=int, default=100)
+
+    fakes = parser.add_argument_group("fakes")
+    fakes.add_argument("--ollama-port", type=int, default=11437)
+    fakes.add_argument("--webhook-port", type=int, default=11436)
+    fakes.add_argument(
+        "--latency-median", type=float, default=0.2, help="Seconds to first token."
+    )
+    fakes.add_argument("--latency-sigma", type=float, default=0.5)
+    fakes.add_argument("--tokens", type=int, default=50)
+    fakes.add_argument("--tokens-per-second", type=float, default=100)
+    fakes.add_argument("--error-rate", type=float, default=0)
+    fakes.add_argument("--error-status", type=int, default=503)
+
+    parser.add_argument("--database-url", help="Count database transactions.")
+    parser.add_argument("--broker-url", help="Count Redis broker commands.")
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"))
+    parser.add_argument("--compare", type=Path, help="Earlier results to compare.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Fraction by which results can be worse before they're regressions.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run a benchmark, save its results and compare them."""
+    args = parse_args()
+    started_at = datetime.datetime.now(tz=datetime.UTC).isoformat()
+    results = asyncio.run(benchmark(args))
+    config = {
+        name: value
+        for name, value in vars(args).items()
+        if name not in {"database_url", "broker_url", "output", "compare"}
+    }
+    args.output.write_text(
+        json.dumps(
+            {
+                "started_at": started_at,
+                "commit": git_commit(),
+                "config": config,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    sys.stdout.write(json.dumps(results, indent=2) + "\n")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+        if regressions := compare(results, baseline, args.tolerance):
+            sys.stdout.write("Regressions:\n" + "\n".join(regressions) + "\n")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
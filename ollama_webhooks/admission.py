@@ -0,0 +1,142 @@
+"""Admission control, so the backlog of jobs (and so their latency) stays bounded.
+
+Each model's queued and running job counts are kept in Redis: jobs are counted as
+queued when they're admitted, and move to running when they're claimed. New jobs for
+a model are refused if its backlog (both counts together) would exceed
+ADMISSION_MAX_BACKLOG, and low priority jobs if it would exceed
+ADMISSION_SHED_BACKLOG.
+The counts are recounted from the Job table every minute, in case they've drifted.
+"""
+
+import logging
+from collections import Counter
+from collections.abc import Iterable, Sequence
+from http import HTTPStatus
+
+from django.conf import settings
+from django.db.models import Count
+
+from ollama_webhooks import factories, metrics, models
+
+logger = logging.getLogger(__name__)
+
+QUEUED_KEY = "admission-queued"
+RUNNING_KEY = "admission-running"
+
+
+class RejectedError(Exception):
+    """Jobs were refused, as their models' backlogs are too long."""
+
+    def __init__(self, status: HTTPStatus, retry_after: int) -> None:
+        """Create an error with the status to respond with."""
+        super().__init__(status.description)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def is_enabled() -> bool:
+    """Check whether admission control is enabled."""
+    return bool(
+        settings.REDIS_URL
+        and (
+            settings.ADMISSION_MAX_BACKLOG is not None
+            or settings.ADMISSION_SHED_BACKLOG is not None
+        )
+    )
+
+
+def _count(key: str, model_counts: Counter[str], sign: int = 1) -> None:
+    with factories.redis().pipeline(transaction=False) as pipe:
+        for model, count in model_counts.items():
+            pipe.hincrby(key, model, sign * count)
+        pipe.execute()
+
+
+def admit(new_jobs: Sequence[models.Job]) -> None:
+    """Count jobs as queued, or refuse them all if their models are too backlogged.
+
+    Over ADMISSION_MAX_BACKLOG, jobs are refused with 503 Service Unavailable. Over
+    ADMISSION_SHED_BACKLOG, jobs with a priority below ADMISSION_SHED_PRIORITY are
+    refused with 429 Too Many Requests.
+    """
+    if not is_enabled() or not new_jobs:
+        return
+
+    counts = Counter(job.model for job in new_jobs)
+    with factories.redis().pipeline(transaction=False) as pipe:
+        for model, count in counts.items():
+            pipe.hincrby(QUEUED_KEY, model, count)
+        pipe.hmget(RUNNING_KEY, list(counts))
+        *queued, running = pipe.execute()
+
+    # Backlogs include the new jobs.
+    backlogs = {
+        model: model_queued + int(model_running or 0)
+        for model, model_queued, model_running in zip(
+            counts, queued, running, strict=True
+        )
+    }
+    status = None
+    if settings.ADMISSION_MAX_BACKLOG is not None and any(
+        backlog > settings.ADMISSION_MAX_BACKLOG for backlog in backlogs.values()
+    ):
+        status = HTTPStatus.SERVICE_UNAVAILABLE
+    elif settings.ADMISSION_SHED_BACKLOG is not None and any(
+        backlogs[job.model] > settings.ADMISSION_SHED_BACKLOG
+        and job.priority < settings.ADMISSION_SHED_PRIORITY
+        for job in new_jobs
+    ):
+        status = HTTPStatus.TOO_MANY_REQUESTS
+
+    if status is not None:
+        _count(QUEUED_KEY, counts, sign=-1)
+        metrics.JOBS.labels("rejected").inc(len(new_jobs))
+        logger.warning("Refused %s jobs: %s", len(new_jobs), status.phrase)
+        raise RejectedError(status, settings.ADMISSION_RETRY_AFTER)
+
+
+def started(model_names: Iterable[str]) -> None:
+    """Move claimed jobs from queued to running."""
+    if is_enabled() and (counts := Counter(model_names)):
+        _count(QUEUED_KEY, counts, sign=-1)
+        _count(RUNNING_KEY, counts)
+
+
+def finished(model_names: Iterable[str]) -> None:
+    """Stop counting jobs as running."""
+    if is_enabled() and (counts := Counter(model_names)):
+        _count(RUNNING_KEY, counts, sign=-1)
+
+
+def requeued(model_names: Iterable[str]) -> None:
+    """Move running jobs back to queued."""
+    if is_enabled() and (counts := Counter(model_names)):
+        _count(RUNNING_KEY, counts, sign=-1)
+        _count(QUEUED_KEY, counts)
+
+
+def recount() -> None:
+    """Replace each model's counts with the number of queued and running jobs."""
+    if not is_enabled():
+        return
+
+    counts: dict[str, dict[str, int]] = {
+        models.Job.Status.QUEUED: {},
+        models.Job.Status.RUNNING: {},
+    }
+    for row in (
+        models.Job.objects.filter(status__in=list(counts))
+        .values("status", "model")
+        .annotate(count=Count("pk"))
+    ):
+        counts[row["status"]][row["model"]] = row["count"]
+
+    with factories.redis().pipeline() as pipe:
+        for key, status in (
+            (QUEUED_KEY, models.Job.Status.QUEUED),
+            (RUNNING_KEY, models.Job.Status.RUNNING),
+        ):
+            pipe.delete(key)
+            for model, count in counts[status].items():
+                pipe.hset(key, model, count)
+        pipe.execute()
@@ -7,3 +7,7 @@ class OllamaWebhooksConfig(AppConfig):
     """Ollama Webhooks application configuration."""
 
     name = "ollama_webhooks"
+
+    def ready(self) -> None:
+        """Register system checks."""
+        from ollama_webhooks import checks  # noqa: F401
@@ -0,0 +1,9 @@
+"""ASGI configuration."""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ollama_webhooks.settings")
+
+application = get_asgi_application()
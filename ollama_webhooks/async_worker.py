@@ -0,0 +1,271 @@
+"""Asyncio worker which runs many jobs concurrently in a single process."""
+
+import asyncio
+import functools
+import logging
+import tempfile
+import time
+from collections.abc import AsyncIterator, Callable, Coroutine
+from contextlib import aclosing, asynccontextmanager
+from typing import IO, Any, ParamSpec, TypeVar
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import close_old_connections
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from ollama_webhooks import (
+    bodies,
+    concurrency,
+    embeddings,
+    jobs,
+    models,
+    response_cache,
+    routing,
+    tasks,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a job's lease expires to give up on it, leaving time to fail it.
+LEASE_MARGIN = 30
+BODY_CHUNK_SIZE = 64 * 1024
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def _in_thread(func: Callable[P, R]) -> Callable[P, Coroutine[Any, Any, R]]:
+    """Make a blocking function awaitable, running it in a thread pool.
+
+    Calls don't wait for each other, unlike with thread-sensitive sync_to_async.
+    Like requests, each call starts and ends by closing database connections which
+    are broken or past CONN_MAX_AGE, as the pool's threads would otherwise keep them.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+async def _aiter_body(body: IO[bytes]) -> AsyncIterator[bytes]:
+    """Stream a body from a file without blocking."""
+    while chunk := await _in_thread(body.read)(BODY_CHUNK_SIZE):
+        yield chunk
+
+
+class Worker:
+    """Claim pending jobs and run them concurrently.
+
+    At most max_in_flight jobs are sent to each Ollama host at once, so up to
+    max_in_flight times the number of hosts are run at once altogether.
+
+    Jobs are run much as Celery runs them, using the response cache and streaming
+    to the webhook. Embedding jobs which can be combined are run by the Celery
+    pipeline itself, in a thread. Fair-share scheduling only applies to Celery, so
+    SCHEDULER_ENABLED is refused by a system check.
+    """
+
+    def __init__(self, max_in_flight: int, poll_interval: float) -> None:
+        """Create a worker."""
+        self.max_in_flight = max_in_flight
+        hosts = {urlsplit(url).netloc for url in settings.OLLAMA_URLS}
+        self.max_tasks = max_in_flight * len(hosts)
+        self.poll_interval = poll_interval
+        self._in_flight: dict[str, asyncio.Semaphore] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+        self.ollama: httpx.AsyncClient
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._in_flight:
+            self._in_flight[host] = asyncio.Semaphore(self.max_in_flight)
+        return self._in_flight[host]
+
+    async def run(self) -> None:
+        """Run jobs until cancelled."""
+        limits = httpx.Limits(
+            max_connections=self.max_tasks, max_keepalive_connections=self.max_tasks
+        )
+        async with httpx.AsyncClient(
+            limits=limits, timeout=settings.OLLAMA_TIMEOUT
+        ) as self.ollama:
+            try:
+                while True:
+                    await self._claim()
+            finally:
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _claim(self) -> None:
+        available = self.max_tasks - len(self._tasks)
+        claimed = []
+        if available:
+            claimed = await _in_thread(jobs.claim_pending)(available)
+        for job in claimed:
+            task = asyncio.create_task(self.run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._job_done)
+
+        if not claimed:
+            if self._tasks and not available:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+    def _job_done(self, task: asyncio.Task[None]) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and (exc := task.exception()):
+            logger.error("Job failed", exc_info=exc)
+
+    @asynccontextmanager
+    async def _ollama_request(
+        self, job: models.Job
+    ) -> AsyncIterator[tuple[str, httpx.Response]]:
+        """Stream a job's response from the best Ollama backend for its model.
+
+        Gives the backend which responded along with its response.
+
+        If a backend can't be connected to, it's ejected and the next best is tried.
+        Backends at their concurrency limits are skipped, or waited for if they all
+        are, for up to OLLAMA_CONCURRENCY_MAX_WAIT seconds. Backends on hosts this
+        worker is already sending max_in_flight jobs to are only waited for if every
+        backend's host is that busy.
+        """
+        error: httpx.ConnectError | None = None
+        candidates = await _in_thread(routing.candidates)(job.model)
+        # Fall over to backends whose hosts this worker has room for.
+        candidates.sort(key=lambda backend: self._semaphore(backend).locked())
+        async with aclosing(concurrency.aacquired(candidates)) as acquired:
+            async for backend, token in acquired:
+                async with self._semaphore(backend):
+                    routing_token = await _in_thread(routing.acquire)(backend)
+                    try:
+                        body = await _in_thread(bodies.open_body)(job, "request_body")
+                        request = self.ollama.build_request(
+                            job.request_method,
+                            jobs.ollama_url(job, backend),
+                            content=_aiter_body(body),
+                            headers=job.request_headers,
+                        )
+                        sent = time.monotonic()
+                        try:
+                            response = await self.ollama.send(request, stream=True)
+                        except httpx.ConnectError as exc:
+                            await _in_thread(routing.eject)(backend)
+                            error = exc
+                            continue
+                        except httpx.TimeoutException:
+                            await _in_thread(concurrency.record)(backend, None, None)
+                            raise
+                        finally:
+                            await _in_thread(body.close)()
+
+                        await _in_thread(concurrency.record)(
+                            backend, time.monotonic() - sent, response.status_code
+                        )
+                        try:
+                            yield backend, response
+                        finally:
+                            await response.aclose()
+                        return
+                    finally:
+                        await _in_thread(concurrency.release)(backend, token)
+                        await _in_thread(routing.release)(backend, routing_token)
+
+        if error:
+            raise error
+
+    async def run_job(self, job: models.Job) -> None:
+        """Run a job which has already been claimed, failing it if that goes wrong.
+
+        Jobs are given up on shortly before their leases expire, so they're never run
+        by two workers at once. If the worker's stopped first, the job's lease
+        expires, so it's queued again. If every Ollama backend stays at its
+        concurrency limit, the job's put back in the queue rather than failed.
+        """
+        try:
+            async with asyncio.timeout(
+                max(settings.JOB_LEASE_SECONDS - LEASE_MARGIN, 1)
+            ):
+                await self._run_job(job)
+        except concurrency.SaturatedError:
+            logger.warning(
+                "Every Ollama backend is at its concurrency limit, putting job %s back",
+                job.pk,
+            )
+            await _in_thread(jobs.unclaim)([job])
+            # Hold this job's place in the worker for a moment, rather than claiming
+            # it straight back.
+            await asyncio.sleep(settings.OLLAMA_CONCURRENCY_RETRY_DELAY)
+        except Exception:
+            await _in_thread(jobs.fail)(job)
+            raise
+
+    async def _run_job(self, job: models.Job) -> None:
+        if settings.EMBED_BATCH_MAX_SIZE > 1 and await _in_thread(embeddings.batch_key)(
+            job
+        ):
+            await _in_thread(tasks.run_embed_batch)(job)
+            return
+
+        request_key = await _in_thread(response_cache.request_key)(job)
+        if request_key and await _in_thread(tasks.respond_from_cache)(job, request_key):
+            return
+
+        async with self._ollama_request(job) as (backend, ollama_response):
+            with tempfile.SpooledTemporaryFile(
+                max_size=settings.OLLAMA_RESPONSE_SPOOL_SIZE
+            ) as response_content:
+                if ollama_response.is_error:
+                    content = await ollama_response.aread()
+                    try:
+                        ollama_response.raise_for_status()
+                    except httpx.HTTPStatusError as exc:
+                        exc.add_note("Response content: " + str(content))
+                        raise
+
+                if settings.WEBHOOK_STREAM and jobs.is_ndjson(ollama_response.headers):
+                    batcher = jobs.NDJSONBatcher(
+                        max_lines=settings.WEBHOOK_STREAM_BATCH_LINES,
+                        max_interval=settings.WEBHOOK_STREAM_BATCH_INTERVAL,
+                    )
+                    part = 0
+                    async with aclosing(
+                        batcher.abatches(ollama_response.aiter_bytes())
+                    ) as batches:
+                        async for batch in batches:
+                            response_content.write(batch)
+                            await _in_thread(tasks.queue_webhook)(job, batch, part=part)
+                            part += 1
+                else:
+                    async for chunk in ollama_response.aiter_bytes():
+                        response_content.write(chunk)
+
+                if request_key:
+                    await _in_thread(response_cache.store)(
+                        request_key,
+                        job.model,
+                        backend,
+                        response_content,
+                        ollama_response.headers,
+                    )
+                response_content.seek(0)
+                recorded = await _in_thread(jobs.record_response)(
+                    job,
+                    response_content,
+                    ollama_response.headers,
+                    cache_hit=False if request_key else None,
+                )
+
+        if recorded:
+            await _in_thread(tasks.queue_webhook)(job)
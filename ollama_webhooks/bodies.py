@@ -0,0 +1,241 @@
+"""Storage of job request and response bodies.
+
+Bodies larger than BODY_STORAGE_THRESHOLD are kept out of the Job table, in the
+"bodies" storage (a local directory by default, or any Django storage backend such
+as an S3-compatible bucket). Stored bodies are named by their SHA-256 hash, so
+identical bodies are only stored once; the job keeps the hash and size.
+
+Bodies are compressed with BODY_COMPRESSION, using a zstd dictionary trained on the
+same model and endpoint's bodies if there is one. The codec is recorded alongside
+each body, so bodies written with another codec (or none) can still be read.
+"""
+
+import gzip
+import hashlib
+import io
+import logging
+import shutil
+import tempfile
+from collections.abc import Iterable
+from contextlib import ExitStack
+from typing import IO, Any, Literal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files import File
+from django.core.files.storage import storages
+
+from ollama_webhooks import metrics, models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+BodyField = Literal["request_body", "response_content"]
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _name(digest: str) -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def _spool() -> IO[bytes]:
+    return tempfile.SpooledTemporaryFile(max_size=settings.OLLAMA_RESPONSE_SPOOL_SIZE)
+
+
+def save(fileobj: IO[bytes]) -> str:
+    """Save a body to storage, unless an identical body is already there.
+
+    Returns the body's hash.
+    """
+    sha256 = hashlib.sha256()
+    fileobj.seek(0)
+    while chunk := fileobj.read(CHUNK_SIZE):
+        sha256.update(chunk)
+    digest = sha256.hexdigest()
+
+    storage = storages["bodies"]
+    if not storage.exists(_name(digest)):
+        fileobj.seek(0)
+        storage.save(_name(digest), File(fileobj))
+    return digest
+
+
+def delete_unreferenced(digests: Iterable[str]) -> int:
+    """Delete stored bodies which no job refers to any more.
+
+    Bodies are shared by every job with the same body, so only those which no
+    remaining job has as its request body or response content are deleted. Returns
+    how many were.
+    """
+    digests = set(digests)
+    referenced: set[str] = set()
+    for field in ("request_body_hash", "response_content_hash"):
+        referenced.update(
+            models.Job.objects.filter(**{f"{field}__in": digests})
+            .exclude(**{field: ""})
+            .values_list(field, flat=True)
+            .distinct()
+        )
+
+    storage = storages["bodies"]
+    unreferenced = digests - referenced
+    for digest in unreferenced:
+        storage.delete(_name(digest))
+    return len(unreferenced)
+
+
+def codec() -> str:
+    """Get the codec new bodies are compressed with.
+
+    zstd falls back to gzip if zstandard isn't installed.
+    """
+    if settings.BODY_COMPRESSION == "zstd" and zstandard is None:
+        return "gzip"
+    return settings.BODY_COMPRESSION
+
+
+def dictionary(
+    field: BodyField, model: str, path: str
+) -> models.CompressionDictionary | None:
+    """Get the latest dictionary trained on a model and endpoint's bodies.
+
+    Looked up briefly in the default cache, as this happens for every body.
+    """
+    dictionary: models.CompressionDictionary | None = caches["default"].get_or_set(
+        f"compression-dictionary:{field}:{model}:{path}",
+        lambda: models.CompressionDictionary.objects.filter(
+            field=field, model=model, request_path=path
+        )
+        .order_by("-created_timestamp")
+        .first(),
+        settings.BODY_COMPRESSION_DICTIONARY_CACHE_TTL,
+    )
+    return dictionary
+
+
+def _dictionary_data(pk: int) -> "zstandard.ZstdCompressionDict":
+    cache_key = f"compression-dictionary-data:{pk}"
+    data: bytes | None = caches["default"].get(cache_key)
+    if data is None:
+        data = bytes(models.CompressionDictionary.objects.get(pk=pk).data)
+        caches["default"].set(cache_key, data, None)
+    return zstandard.ZstdCompressionDict(data)
+
+
+def target_codec(field: BodyField, model: str, path: str) -> str:
+    """Get the codec a model and endpoint's bodies would be compressed with now."""
+    body_codec = codec()
+    if body_codec == "zstd" and (trained := dictionary(field, model, path)):
+        return f"zstd:{trained.pk}"
+    return body_codec
+
+
+def compress(
+    src: IO[bytes], dst: IO[bytes], field: BodyField, model: str, path: str
+) -> str:
+    """Compress a body, returning the codec used."""
+    match codec():
+        case "zstd":
+            trained = dictionary(field, model, path)
+            compressor = zstandard.ZstdCompressor(
+                level=settings.BODY_COMPRESSION_LEVEL,
+                dict_data=_dictionary_data(trained.pk) if trained else None,
+            )
+            compressor.copy_stream(src, dst)
+            return f"zstd:{trained.pk}" if trained else "zstd"
+        case "gzip":
+            with gzip.GzipFile(
+                fileobj=dst, mode="wb", compresslevel=settings.BODY_COMPRESSION_LEVEL
+            ) as compressed:
+                shutil.copyfileobj(src, compressed)
+            return "gzip"
+    shutil.copyfileobj(src, dst)
+    return ""
+
+
+def decompress(src: IO[bytes], dst: IO[bytes], body_codec: str) -> None:
+    """Decompress a body compressed with the given codec."""
+    match body_codec.partition(":"):
+        case ("", _, _):
+            shutil.copyfileobj(src, dst)
+        case ("gzip", _, _):
+            with gzip.GzipFile(fileobj=src, mode="rb") as compressed:
+                shutil.copyfileobj(compressed, dst)
+        case ("zstd", _, dictionary_pk):
+            if zstandard is None:
+                msg = "zstandard must be installed to read zstd compressed bodies."
+                raise RuntimeError(msg)
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=_dictionary_data(int(dictionary_pk))
+                if dictionary_pk
+                else None
+            )
+            decompressor.copy_stream(src, dst)
+        case _:
+            msg = f"Unknown body codec {body_codec}."
+            raise ValueError(msg)
+
+
+def fields(
+    field: BodyField, content: bytes | IO[bytes], model: str, path: str
+) -> dict[str, Any]:
+    """Get the job field values which store a body.
+
+    Bodies are compressed if that makes them smaller. Small bodies are kept in the
+    job's own field; larger ones are saved to storage.
+    """
+    with ExitStack() as stack:
+        fileobj = io.BytesIO(content) if isinstance(content, bytes) else content
+        size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(0)
+        metrics.BODY_BYTES.labels(field).observe(size)
+
+        body_codec = ""
+        if codec() and size >= settings.BODY_COMPRESSION_MIN_SIZE:
+            compressed = stack.enter_context(_spool())
+            body_codec = compress(fileobj, compressed, field, model, path)
+            if compressed.tell() < size:
+                fileobj = compressed
+            else:
+                body_codec = ""
+        stored_size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(0)
+
+        values = {f"{field}_codec": body_codec, f"{field}_size": size}
+        if (
+            settings.BODY_STORAGE_THRESHOLD is None
+            or stored_size <= settings.BODY_STORAGE_THRESHOLD
+        ):
+            return {**values, field: fileobj.read(), f"{field}_hash": ""}
+
+        return {**values, field: b"", f"{field}_hash": save(fileobj)}
+
+
+def open_body(job: models.Job, field: BodyField) -> IO[bytes]:
+    """Open one of a job's bodies for reading."""
+    digest: str = getattr(job, f"{field}_hash")
+    body_codec: str = getattr(job, f"{field}_codec")
+    body: IO[bytes]
+    if digest:
+        body = storages["bodies"].open(_name(digest), "rb")
+    else:
+        body = io.BytesIO(bytes(getattr(job, field)))
+    if not body_codec:
+        return body
+
+    with body:
+        decompressed = _spool()
+        decompress(body, decompressed, body_codec)
+        decompressed.seek(0)
+        return decompressed
+
+
+def read(job: models.Job, field: BodyField) -> bytes:
+    """Read one of a job's bodies."""
+    with open_body(job, field) as body:
+        return body.read()
@@ -6,7 +6,7 @@ from typing import Any
 
 import celery
 import dotenv
-from celery.signals import setup_logging
+from celery.signals import setup_logging, worker_init
 
 dotenv.load_dotenv(verbose=True)
 
@@ -20,6 +20,14 @@ def config_loggers(*args: Any, **kwargs: Any) -> None:
     dictConfig(settings.LOGGING)
 
 
+@worker_init.connect
+def start_metrics_server(*args: Any, **kwargs: Any) -> None:
+    """Serve the worker's metrics, if METRICS_WORKER_PORT is set."""
+    from ollama_webhooks import metrics
+
+    metrics.start_worker_server()
+
+
 def monkeypatch() -> None:
     """
     Monkey patch Celery tasks so type stubs don't cause issues.
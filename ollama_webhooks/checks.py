@@ -0,0 +1,27 @@
+"""System checks."""
+
+from collections.abc import Sequence
+from typing import Any
+
+from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register()
+def check_job_runner(
+    *,
+    app_configs: Sequence[AppConfig] | None,  # noqa: ARG001
+    databases: Sequence[str] | None,  # noqa: ARG001
+    **kwargs: Any,
+) -> list[checks.CheckMessage]:
+    """Check that the job runner supports the features which are enabled."""
+    if settings.JOB_RUNNER != "celery" and settings.SCHEDULER_ENABLED:
+        return [
+            checks.Warning(
+                "Fair-share scheduling only applies to jobs run by Celery.",
+                hint="Set JOB_RUNNER to celery, or unset SCHEDULER_ENABLED.",
+                id="ollama_webhooks.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,167 @@
+"""Adaptive limits on how many requests each Ollama backend is sent at once.
+
+Each backend's limit is shared between workers in Redis, and adjusted by additive
+increase, multiplicative decrease (AIMD): every request Ollama copes with raises
+the limit by about one per limit's worth of requests, and a sign of overload (429 or
+503 responses, timeouts, or taking longer than OLLAMA_CONCURRENCY_LATENCY_TARGET to
+start responding) cuts it by OLLAMA_CONCURRENCY_DECREASE. Only one cut is made per
+OLLAMA_CONCURRENCY_DECREASE_INTERVAL, as a burst of overloaded responses all stem
+from the same excess. So requests in flight settle around what each backend can
+actually serve.
+
+Requests in flight are held as expiring entries in a sorted set per backend, so a
+worker which dies doesn't hold onto its slot for good.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import AsyncGenerator, Iterator, Sequence
+from http import HTTPStatus
+
+from django.conf import settings
+
+from asgiref.sync import sync_to_async
+
+from ollama_webhooks import factories
+
+logger = logging.getLogger(__name__)
+
+LIMITS_KEY = "ollama-concurrency-limits"
+OVERLOADED_STATUSES = {HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE}
+
+
+class SaturatedError(Exception):
+    """Every Ollama backend is at its concurrency limit."""
+
+
+def _in_flight_key(backend: str) -> str:
+    return f"ollama-concurrency-in-flight:{backend}"
+
+
+def _decreased_key(backend: str) -> str:
+    return f"ollama-concurrency-decreased:{backend}"
+
+
+def limit(backend: str) -> float:
+    """Get a backend's current limit."""
+    current = factories.redis().hget(LIMITS_KEY, backend)
+    return float(current) if current else settings.OLLAMA_CONCURRENCY_INITIAL
+
+
+def acquire(backend: str) -> str | None:
+    """Count a request to a backend as in flight, unless it's at its limit.
+
+    Returns a token to release it with, or None if the backend's at its limit.
+    """
+    if not settings.OLLAMA_CONCURRENCY_ADAPTIVE:
+        return ""
+
+    token = uuid.uuid4().hex
+    now = time.time()
+    with factories.redis().pipeline() as pipe:
+        pipe.zremrangebyscore(_in_flight_key(backend), "-inf", now)
+        # Entries expire once the request would have timed out anyway.
+        pipe.zadd(_in_flight_key(backend), {token: now + settings.OLLAMA_TIMEOUT})
+        pipe.expire(_in_flight_key(backend), settings.OLLAMA_TIMEOUT)
+        pipe.zcard(_in_flight_key(backend))
+        pipe.hget(LIMITS_KEY, backend)
+        *_, in_flight, current = pipe.execute()
+
+    backend_limit = float(current) if current else settings.OLLAMA_CONCURRENCY_INITIAL
+    if in_flight > max(int(backend_limit), 1):
+        release(backend, token)
+        return None
+    return token
+
+
+def release(backend: str, token: str) -> None:
+    """Stop counting a request to a backend as in flight."""
+    if settings.OLLAMA_CONCURRENCY_ADAPTIVE:
+        factories.redis().zrem(_in_flight_key(backend), token)
+
+
+def record(backend: str, latency: float | None, status_code: int | None) -> None:
+    """Adjust a backend's limit after it responded, or timed out.
+
+    latency is how long the backend took to start responding, or None if it timed
+    out.
+    """
+    if not settings.OLLAMA_CONCURRENCY_ADAPTIVE:
+        return
+
+    redis = factories.redis()
+    backend_limit = limit(backend)
+    if (
+        latency is None
+        or status_code in OVERLOADED_STATUSES
+        or (
+            settings.OLLAMA_CONCURRENCY_LATENCY_TARGET is not None
+            and latency > settings.OLLAMA_CONCURRENCY_LATENCY_TARGET
+        )
+    ):
+        if redis.set(
+            _decreased_key(backend),
+            1,
+            nx=True,
+            px=int(settings.OLLAMA_CONCURRENCY_DECREASE_INTERVAL * 1000),
+        ):
+            backend_limit = max(
+                backend_limit * settings.OLLAMA_CONCURRENCY_DECREASE,
+                settings.OLLAMA_CONCURRENCY_MIN,
+            )
+            redis.hset(LIMITS_KEY, backend, backend_limit)
+            logger.warning(
+                "Ollama backend %s is overloaded, limited to %.1f requests at once",
+                backend,
+                backend_limit,
+            )
+        return
+
+    if backend_limit < settings.OLLAMA_CONCURRENCY_MAX:
+        increased = redis.hincrbyfloat(LIMITS_KEY, backend, 1 / backend_limit)
+        if increased > settings.OLLAMA_CONCURRENCY_MAX:
+            redis.hset(LIMITS_KEY, backend, settings.OLLAMA_CONCURRENCY_MAX)
+
+
+def acquired(backends: Sequence[str]) -> Iterator[tuple[str, str]]:
+    """Acquire backends one at a time, best first, along with tokens to release them.
+
+    Callers go on to the next backend if one can't be used. If every backend left is
+    at its limit, SaturatedError is raised straight away, so callers can let go of
+    anything they hold before waiting for room.
+    """
+    remaining = list(backends)
+    while remaining:
+        for backend in remaining:
+            if (token := acquire(backend)) is not None:
+                remaining.remove(backend)
+                yield backend, token
+                break
+        else:
+            raise SaturatedError
+
+
+async def aacquired(
+    backends: Sequence[str],
+) -> AsyncGenerator[tuple[str, str], None]:
+    """Acquire backends one at a time, like acquired, without blocking.
+
+    If every backend left is at its limit, this waits for one to have room, for up
+    to OLLAMA_CONCURRENCY_MAX_WAIT seconds, before raising SaturatedError.
+    """
+    remaining = list(backends)
+    deadline = time.monotonic() + settings.OLLAMA_CONCURRENCY_MAX_WAIT
+    while remaining:
+        for backend in remaining:
+            if (
+                token := await sync_to_async(acquire, thread_sensitive=False)(backend)
+            ) is not None:
+                remaining.remove(backend)
+                yield backend, token
+                break
+        else:
+            if time.monotonic() >= deadline:
+                raise SaturatedError
+            await asyncio.sleep(settings.OLLAMA_CONCURRENCY_RETRY_DELAY)
@@ -0,0 +1,73 @@
+"""Coalesce many embedding jobs into one Ollama request."""
+
+import json
+import logging
+from collections.abc import Sequence
+from typing import Any
+
+from ollama_webhooks import bodies, models
+
+logger = logging.getLogger(__name__)
+
+EMBED_PATH = "/api/embed"
+
+
+def _body(job: models.Job) -> dict[str, Any] | None:
+    try:
+        body = json.loads(bodies.read(job, "request_body"))
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def _inputs(body: dict[str, Any]) -> list[str] | None:
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        return [inputs]
+    if isinstance(inputs, list) and all(isinstance(i, str) for i in inputs):
+        return inputs
+    return None
+
+
+def batch_key(job: models.Job) -> str | None:
+    """Get a key shared by all jobs which can be sent to Ollama in one request.
+
+    Returns None if this job can't be batched.
+    """
+    if job.request_method != "POST" or job.request_path != EMBED_PATH:
+        return None
+
+    body = _body(job)
+    if body is None or _inputs(body) is None:
+        return None
+
+    body.pop("input", None)
+    return json.dumps([job.request_query, body], sort_keys=True)
+
+
+def combine(jobs: Sequence[models.Job]) -> bytes:
+    """Combine the requests of jobs sharing a batch key into one request body."""
+    inputs: list[str] = []
+    for job in jobs:
+        inputs.extend(_inputs(_body(job) or {}) or [])
+    return json.dumps({**(_body(jobs[0]) or {}), "input": inputs}).encode()
+
+
+def split(jobs: Sequence[models.Job], content: bytes) -> list[bytes]:
+    """Split Ollama's response to a combined request into a response for each job.
+
+    Prompt evaluation counts can't be split between jobs, so are left out.
+    """
+    response = json.loads(content)
+    embeddings = response.pop("embeddings")
+    response.pop("prompt_eval_count", None)
+
+    contents = []
+    start = 0
+    for job in jobs:
+        end = start + len(_inputs(_body(job) or {}) or [])
+        contents.append(
+            json.dumps({**response, "embeddings": embeddings[start:end]}).encode()
+        )
+        start = end
+    return contents
@@ -1,14 +1,95 @@
 """Object factories."""
 
+import functools
 import logging
+import os
+import time
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
+import requests
 from ollama import Client as OllamaClient
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 logger = logging.getLogger(__name__)
 
+# Sessions are kept per process, along with when each was last used.
+_sessions: dict[str, tuple[requests.Session, float]] = {}
 
+
+@functools.cache
 def ollama() -> OllamaClient:
     """Get Ollama client."""
     return OllamaClient(host=settings.OLLAMA_URL)
+
+
+@functools.cache
+def redis() -> "Redis[bytes]":
+    """Get Redis client."""
+    if not settings.REDIS_URL:
+        msg = "REDIS_URL must be set."
+        raise ImproperlyConfigured(msg)
+    return Redis.from_url(settings.REDIS_URL)
+
+
+def async_redis() -> "AsyncRedis[bytes]":
+    """Get a new asyncio Redis client, for use in the current event loop only."""
+    if not settings.REDIS_URL:
+        msg = "REDIS_URL must be set."
+        raise ImproperlyConfigured(msg)
+    return AsyncRedis.from_url(settings.REDIS_URL)
+
+
+def session(name: str) -> requests.Session:
+    """Get a keep-alive HTTP session for this process.
+
+    Sessions which haven't been used for HTTP_POOL_IDLE_TIMEOUT seconds are closed
+    and replaced, so we don't try to reuse connections the server has dropped.
+    """
+    now = time.monotonic()
+    if name in _sessions:
+        http_session, last_used = _sessions[name]
+        if now - last_used < settings.HTTP_POOL_IDLE_TIMEOUT:
+            _sessions[name] = (http_session, now)
+            return http_session
+
+        logger.debug("Closing idle %s session", name)
+        http_session.close()
+
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        # Only retry failures to connect; anything else may have reached the server.
+        max_retries=Retry(
+            total=settings.HTTP_RETRIES,
+            connect=settings.HTTP_RETRIES,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=settings.HTTP_RETRY_BACKOFF_FACTOR,
+        ),
+    )
+    http_session = requests.Session()
+    http_session.mount("http://", adapter)
+    http_session.mount("https://", adapter)
+    _sessions[name] = (http_session, now)
+    return http_session
+
+
+def reset() -> None:
+    """Forget clients and sessions created in this process.
+
+    Called in child processes after a fork (e.g. Celery's prefork pool), which must
+    not share sockets with their parent. Sessions aren't closed, as that could
+    interfere with the parent's connections.
+    """
+    _sessions.clear()
+    ollama.cache_clear()
+    redis.cache_clear()
+
+
+os.register_at_fork(after_in_child=reset)
@@ -0,0 +1,317 @@
+"""Job lifecycle helpers shared by the Celery and asyncio workers."""
+
+import json
+import logging
+import time
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    Mapping,
+    Sequence,
+)
+from typing import IO
+from urllib.parse import urlsplit, urlunsplit
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F, Field
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from ollama_webhooks import (
+    admission,
+    bodies,
+    metrics,
+    models,
+    notifications,
+    scheduling,
+)
+
+logger = logging.getLogger(__name__)
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+# The only columns needed to show a job's status.
+STATUS_FIELDS = (
+    "id",
+    "status",
+    "created_timestamp",
+    "request_sent_timestamp",
+    "response_received_timestamp",
+    "webhook_url",
+)
+
+
+def ollama_url(job: models.Job, backend: str | None = None) -> str:
+    """Get the URL to send a job's request to on an Ollama backend."""
+    base_url = urlsplit(backend or settings.OLLAMA_URL)
+    return urlunsplit((
+        base_url.scheme,
+        base_url.netloc,
+        job.request_path,
+        job.request_query,
+        base_url.fragment,
+    ))
+
+
+def model_from_body(body: bytes) -> str:
+    """Get the model named in an Ollama request body, if any."""
+    try:
+        model = json.loads(body).get("model", "")
+    except (AttributeError, ValueError):
+        return ""
+    return model if isinstance(model, str) else ""
+
+
+def is_ndjson(headers: Mapping[str, str]) -> bool:
+    """Check whether response headers describe a streamed NDJSON response."""
+    return headers.get("Content-Type", "").startswith(NDJSON_CONTENT_TYPE)
+
+
+def is_complete(job: models.Job) -> bool:
+    """Check whether a job has finished running, one way or another."""
+    return job.status not in {models.Job.Status.QUEUED, models.Job.Status.RUNNING}
+
+
+def status_cache_key(pk: UUID) -> str:
+    """Get the cache key for a job's status."""
+    return f"job-status:{pk}"
+
+
+def forget_status(pks: Iterable[UUID]) -> None:
+    """Drop jobs' cached statuses, once they've changed."""
+    caches["default"].delete_many([status_cache_key(pk) for pk in pks])
+
+
+async def astatus(pk: UUID) -> models.Job:
+    """Get a job with only its status columns, from the cache if possible."""
+    cache_key = status_cache_key(pk)
+    job: models.Job | None = await caches["default"].aget(cache_key)
+    if job is None:
+        job = await models.Job.objects.only(*STATUS_FIELDS).aget(pk=pk)
+        await caches["default"].aset(cache_key, job, settings.JOB_STATUS_CACHE_TTL)
+    return job
+
+
+def set_status(pks: Iterable[UUID], status: models.Job.Status) -> None:
+    """Move jobs to a status."""
+    pks = list(pks)
+    models.Job.objects.filter(pk__in=pks).update(status=status)
+    forget_status(pks)
+
+
+def fail(job: models.Job) -> None:
+    """Give up on a job which went wrong while it was running.
+
+    Nothing happens if the job has been claimed again since, as its lease expired.
+    """
+    if models.Job.objects.filter(
+        pk=job.pk, status=models.Job.Status.RUNNING, attempts=job.attempts
+    ).update(status=models.Job.Status.FAILED, lease_expires_timestamp=None):
+        admission.finished([job.model])
+        metrics.JOBS.labels("failed").inc()
+    forget_status([job.pk])
+    notifications.publish(job.pk)
+
+
+def unclaim(claimed: Iterable[models.Job]) -> list[models.Job]:
+    """Put claimed jobs which haven't been sent to Ollama back in the queue.
+
+    They aren't counted as attempts. Jobs which have moved on since they were
+    claimed are left alone. Returns the jobs put back.
+    """
+    unclaimed = [
+        job
+        for job in claimed
+        if models.Job.objects.filter(
+            pk=job.pk, status=models.Job.Status.RUNNING, attempts=job.attempts
+        ).update(
+            status=models.Job.Status.QUEUED,
+            lease_expires_timestamp=None,
+            request_sent_timestamp=None,
+            attempts=F("attempts") - 1,
+        )
+    ]
+    forget_status(job.pk for job in unclaimed)
+    admission.requeued(job.model for job in unclaimed)
+    scheduling.requeued(job.client for job in unclaimed)
+    return unclaimed
+
+
+def _claim_sql(condition: str) -> str:
+    """Build an UPDATE which claims the jobs matching condition.
+
+    Only queued jobs are updated. Claimed jobs are running, leased for
+    JOB_LEASE_SECONDS, and are returned without their response content, which is
+    empty at this point anyway. The lease is the first query parameter.
+    """
+    qn = connection.ops.quote_name
+    columns = ", ".join(
+        qn(field.column)
+        for field in models.Job._meta.get_fields()
+        if isinstance(field, Field) and field.concrete
+        if field.name != "response_content"
+    )
+    return (
+        f"UPDATE {qn(models.Job._meta.db_table)}"  # noqa: S608
+        f" SET {qn('status')} = '{models.Job.Status.RUNNING}',"
+        f" {qn('request_sent_timestamp')} = now(),"
+        f" {qn('lease_expires_timestamp')} = now() + make_interval(secs => %s),"
+        f" {qn('attempts')} = {qn('attempts')} + 1"
+        f" WHERE {qn('status')} = '{models.Job.Status.QUEUED}' AND {condition}"
+        f" RETURNING {columns}"
+    )
+
+
+def _claimed(claimed: Sequence[models.Job]) -> None:
+    scheduling.dequeued(job.client for job in claimed)
+    for job in claimed:
+        forget_status([job.pk])
+        admission.started([job.model])
+        if job.request_sent_timestamp:
+            metrics.QUEUE_WAIT_SECONDS.labels(metrics.model_label(job.model)).observe(
+                (job.request_sent_timestamp - job.created_timestamp).total_seconds()
+            )
+
+
+def claim(pk: UUID) -> models.Job | None:
+    """Claim a job, unless it has already been claimed.
+
+    This is a single conditional UPDATE, so a job can't be run twice at once even if
+    its task is delivered twice.
+    """
+    sql = _claim_sql(f"{connection.ops.quote_name('id')} = %s")
+    job = next(
+        iter(models.Job.objects.raw(sql, [settings.JOB_LEASE_SECONDS, pk])), None
+    )
+    if job:
+        _claimed([job])
+    return job
+
+
+def claim_pending(limit: int, **filters: str) -> list[models.Job]:
+    """Claim up to limit queued jobs.
+
+    Only jobs whose columns equal the given filters are claimed. Rows locked by
+    another worker are skipped, so several workers can claim jobs concurrently
+    without claiming the same job twice.
+    """
+    qn = connection.ops.quote_name
+    conditions = "".join(f" AND {qn(column)} = %s" for column in filters)
+    sql = _claim_sql(
+        f"{qn('id')} IN ("  # noqa: S608
+        f"SELECT {qn('id')} FROM {qn(models.Job._meta.db_table)}"
+        f" WHERE {qn('status')} = '{models.Job.Status.QUEUED}'{conditions}"
+        f" ORDER BY {qn('priority')} DESC, {qn('created_timestamp')}"
+        " LIMIT %s FOR UPDATE SKIP LOCKED)"
+    )
+    claimed = list(
+        models.Job.objects.raw(
+            sql, [settings.JOB_LEASE_SECONDS, *filters.values(), limit]
+        )
+    )
+    _claimed(claimed)
+    return claimed
+
+
+def record_response(
+    job: models.Job,
+    content: bytes | IO[bytes],
+    headers: Mapping[str, str],
+    cache_hit: bool | None = None,
+) -> bool:
+    """Record Ollama's response to a job, updating only the response columns.
+
+    The response is only recorded if this is still the job's current run: if its
+    lease expired and it was claimed again, the other run records it instead.
+    Returns whether it was recorded.
+    """
+    recorded = models.Job.objects.filter(
+        pk=job.pk, status=models.Job.Status.RUNNING, attempts=job.attempts
+    ).update(
+        status=models.Job.Status.SUCCEEDED,
+        lease_expires_timestamp=None,
+        response_received_timestamp=Now(),
+        response_headers=dict(headers),
+        cache_hit=cache_hit,
+        **bodies.fields(
+            "response_content", content, model=job.model, path=job.request_path
+        ),
+    )
+    if not recorded:
+        logger.warning("Job %s is no longer this run's, not recording it", job.pk)
+        return False
+
+    forget_status([job.pk])
+    admission.finished([job.model])
+    notifications.publish(job.pk)
+    metrics.JOBS.labels("cached" if cache_hit else "succeeded").inc()
+    if job.request_sent_timestamp:
+        metrics.OLLAMA_SECONDS.labels(
+            metrics.model_label(job.model), metrics.path_label(job.request_path)
+        ).observe((timezone.now() - job.request_sent_timestamp).total_seconds())
+    return True
+
+
+class NDJSONBatcher:
+    """Group a stream of NDJSON chunks into batches of complete lines.
+
+    A batch is ready once it has max_lines lines, or once max_interval seconds have
+    passed since the last batch was ready.
+    """
+
+    def __init__(self, max_lines: int, max_interval: float) -> None:
+        """Create a batcher."""
+        self.max_lines = max_lines
+        self.max_interval = max_interval
+        self._partial_line = b""
+        self._lines: list[bytes] = []
+        self._last_batch = time.monotonic()
+
+    def feed(self, chunk: bytes) -> bytes | None:
+        """Add a chunk, returning a batch if one is ready."""
+        *lines, self._partial_line = (self._partial_line + chunk).split(b"\n")
+        self._lines.extend(line + b"\n" for line in lines)
+        if self._lines and (
+            len(self._lines) >= self.max_lines
+            or time.monotonic() - self._last_batch >= self.max_interval
+        ):
+            return self._batch()
+        return None
+
+    def batches(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Batch an entire stream of chunks."""
+        for chunk in chunks:
+            if batch := self.feed(chunk):
+                yield batch
+        if batch := self.flush():
+            yield batch
+
+    async def abatches(
+        self, chunks: AsyncIterator[bytes]
+    ) -> AsyncGenerator[bytes, None]:
+        """Batch an entire asynchronous stream of chunks."""
+        async for chunk in chunks:
+            if batch := self.feed(chunk):
+                yield batch
+        if batch := self.flush():
+            yield batch
+
+    def flush(self) -> bytes | None:
+        """Return whatever remains once the stream has ended."""
+        if self._partial_line:
+            self._lines.append(self._partial_line)
+            self._partial_line = b""
+        if self._lines:
+            return self._batch()
+        return None
+
+    def _batch(self) -> bytes:
+        batch = b"".join(self._lines)
+        self._lines = []
+        self._last_batch = time.monotonic()
+        return batch
@@ -0,0 +1,51 @@
+"""Create and drop job partitions."""
+
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils import timezone
+
+from ollama_webhooks import partitions
+
+
+class Command(BaseCommand):
+    """Create and drop job partitions."""
+
+    help = (
+        "Create job partitions ahead of time and drop those older than"
+        " JOB_RETENTION_DAYS."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help=(
+                "Convert the job table into a partitioned table first. This locks the"
+                " table while existing jobs are checked and indexed."
+            ),
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Create and drop partitions."""
+        if not settings.JOB_PARTITION_INTERVAL:
+            msg = "JOB_PARTITION_INTERVAL must be set to partition jobs."
+            raise CommandError(msg)
+
+        now = timezone.now()
+        if options["convert"]:
+            if partitions.is_partitioned():
+                msg = "Jobs are already partitioned."
+                raise CommandError(msg)
+            partitions.convert(now)
+            self.stdout.write("Partitioned jobs.")
+        elif not partitions.is_partitioned():
+            msg = "Jobs aren't partitioned yet; run with --convert first."
+            raise CommandError(msg)
+
+        for name in partitions.create_partitions(now):
+            self.stdout.write(f"Created {name}.")
+        for name in partitions.drop_expired(now):
+            self.stdout.write(f"Dropped {name}.")
@@ -0,0 +1,79 @@
+"""Recompress job bodies with the current codec."""
+
+from collections import defaultdict
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from ollama_webhooks import bodies, models
+
+FIELDS: list[bodies.BodyField] = ["request_body", "response_content"]
+
+
+class Command(BaseCommand):
+    """Recompress job bodies with the current codec."""
+
+    help = (
+        "Recompress job bodies which weren't compressed with the current codec and"
+        " dictionary, in batches. Jobs which are queued or running are left alone."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of jobs to load and update at once.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Recompress bodies."""
+        jobs = models.Job.objects.exclude(
+            status__in=[models.Job.Status.QUEUED, models.Job.Status.RUNNING]
+        ).order_by("pk")
+        recompressed = 0
+        while batch := list(jobs[: options["batch_size"]]):
+            # Only the columns of bodies which changed are updated.
+            changed: dict[tuple[bodies.BodyField, ...], list[models.Job]] = defaultdict(
+                list
+            )
+            for job in batch:
+                if changed_fields := tuple(
+                    field for field in FIELDS if self.recompress(job, field)
+                ):
+                    changed[changed_fields].append(job)
+            for changed_fields, changed_jobs in changed.items():
+                models.Job.objects.bulk_update(
+                    changed_jobs,
+                    [
+                        f"{field}{suffix}"
+                        for field in changed_fields
+                        for suffix in ("", "_hash", "_size", "_codec")
+                    ],
+                )
+                recompressed += len(changed_jobs)
+            jobs = jobs.filter(pk__gt=batch[-1].pk)
+
+        self.stdout.write(f"Recompressed bodies of {recompressed} jobs.")
+
+    def recompress(self, job: models.Job, field: bodies.BodyField) -> bool:
+        """Recompress one of a job's bodies, returning whether it changed."""
+        size = getattr(job, f"{field}_size")
+        if size is not None and size < settings.BODY_COMPRESSION_MIN_SIZE:
+            return False
+
+        current_codec = getattr(job, f"{field}_codec")
+        if current_codec == bodies.target_codec(field, job.model, job.request_path):
+            return False
+
+        values = bodies.fields(
+            field, bodies.read(job, field), model=job.model, path=job.request_path
+        )
+        if values[f"{field}_codec"] == current_codec:
+            return False
+
+        for name, value in values.items():
+            setattr(job, name, value)
+        return True
@@ -0,0 +1,35 @@
+"""Queue jobs from the outbox."""
+
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from ollama_webhooks import outbox
+
+
+class Command(BaseCommand):
+    """Queue jobs from the outbox."""
+
+    help = "Publish jobs waiting in the outbox to Celery, as they're created."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.OUTBOX_RELAY_BATCH_SIZE,
+            help="Maximum number of jobs to publish at once.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.OUTBOX_RELAY_POLL_INTERVAL,
+            help="Seconds to wait for new jobs before checking anyway.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Run the relay."""
+        outbox.run(
+            batch_size=options["batch_size"], poll_interval=options["poll_interval"]
+        )
@@ -0,0 +1,52 @@
+"""Replay webhook deliveries which were given up on."""
+
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db.models.functions import Now
+
+from ollama_webhooks import models, tasks
+
+
+class Command(BaseCommand):
+    """Replay webhook deliveries which were given up on."""
+
+    help = (
+        "Queue dead webhook deliveries to be sent again, with a fresh set of attempts."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--job",
+            action="append",
+            dest="jobs",
+            default=[],
+            help="Only replay deliveries for this job. May be given more than once.",
+        )
+        parser.add_argument(
+            "--delivered",
+            action="store_true",
+            help="Replay deliveries which were delivered, too.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Replay deliveries."""
+        statuses = [models.WebhookDelivery.Status.DEAD]
+        if options["delivered"]:
+            statuses.append(models.WebhookDelivery.Status.DELIVERED)
+
+        deliveries = models.WebhookDelivery.objects.filter(status__in=statuses)
+        if options["jobs"]:
+            deliveries = deliveries.filter(job_id__in=options["jobs"])
+
+        pks = list(deliveries.order_by("pk").values_list("pk", flat=True))
+        models.WebhookDelivery.objects.filter(pk__in=pks).update(
+            status=models.WebhookDelivery.Status.PENDING,
+            attempts=0,
+            # Due now, so they're only requeued if they're still pending long after.
+            next_attempt_timestamp=Now(),
+            delivered_timestamp=None,
+        )
+        tasks.queue_deliveries(pks)
+        self.stdout.write(f"Replaying {len(pks)} webhook deliveries.")
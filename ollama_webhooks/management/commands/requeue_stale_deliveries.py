@@ -0,0 +1,30 @@
+"""Requeue webhook deliveries which are still pending long after they were due."""
+
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ollama_webhooks import tasks
+
+
+class Command(BaseCommand):
+    """Requeue webhook deliveries which are still pending long after they were due."""
+
+    help = (
+        "Queue webhook deliveries which are still pending WEBHOOK_REQUEUE_AFTER"
+        " seconds after they were due again, in case their tasks were lost."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=1000,
+            help="Maximum number of deliveries to requeue.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Requeue deliveries."""
+        requeued = tasks.requeue_stale_deliveries(options["limit"])
+        self.stdout.write(f"Requeued {requeued} webhook deliveries.")
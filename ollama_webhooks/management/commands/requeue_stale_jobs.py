@@ -0,0 +1,30 @@
+"""Requeue jobs whose tasks were lost."""
+
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ollama_webhooks import outbox
+
+
+class Command(BaseCommand):
+    """Requeue jobs whose tasks were lost."""
+
+    help = (
+        "Queue jobs again whose tasks were lost: those which still haven't started"
+        " OUTBOX_REQUEUE_AFTER seconds after later jobs for their model did."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=1000,
+            help="Maximum number of jobs to requeue.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Requeue jobs."""
+        requeued = outbox.requeue_stale(options["limit"])
+        self.stdout.write(f"Requeued {requeued} jobs.")
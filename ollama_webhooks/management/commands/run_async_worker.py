@@ -0,0 +1,40 @@
+"""Run jobs with the asyncio worker."""
+
+import asyncio
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from ollama_webhooks import metrics
+from ollama_webhooks.async_worker import Worker
+
+
+class Command(BaseCommand):
+    """Run jobs with the asyncio worker."""
+
+    help = "Claim pending jobs and run many of them concurrently in one process."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--max-in-flight",
+            type=int,
+            default=settings.ASYNC_WORKER_MAX_IN_FLIGHT,
+            help="Maximum number of concurrent requests to each Ollama host.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.ASYNC_WORKER_POLL_INTERVAL,
+            help="Seconds to wait between checks for new jobs when idle.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Run the worker."""
+        metrics.start_worker_server()
+        worker = Worker(
+            max_in_flight=options["max_in_flight"],
+            poll_interval=options["poll_interval"],
+        )
+        asyncio.run(worker.run())
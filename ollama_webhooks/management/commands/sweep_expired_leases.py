@@ -0,0 +1,30 @@
+"""Requeue or fail running jobs whose leases have expired."""
+
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ollama_webhooks import outbox
+
+
+class Command(BaseCommand):
+    """Requeue or fail running jobs whose leases have expired."""
+
+    help = (
+        "Queue running jobs whose workers died or hung again, or fail them once"
+        " they've been run JOB_MAX_ATTEMPTS times."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=1000,
+            help="Maximum number of jobs to sweep.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Sweep jobs."""
+        requeued, failed = outbox.sweep_expired_leases(options["limit"])
+        self.stdout.write(f"Requeued {requeued} jobs and failed {failed} jobs.")
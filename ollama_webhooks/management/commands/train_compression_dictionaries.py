@@ -0,0 +1,91 @@
+"""Train zstd compression dictionaries on recent job bodies."""
+
+import datetime
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils import timezone
+
+from ollama_webhooks import bodies, models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore[assignment]
+
+
+class Command(BaseCommand):
+    """Train zstd compression dictionaries on recent job bodies."""
+
+    help = (
+        "Train a zstd compression dictionary for the request and response bodies of"
+        " each model and endpoint used recently."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add arguments."""
+        parser.add_argument(
+            "--days", type=int, default=7, help="Train on jobs from this many days."
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=1000,
+            help="Maximum number of bodies to train each dictionary on.",
+        )
+        parser.add_argument(
+            "--min-samples",
+            type=int,
+            default=100,
+            help="Don't train dictionaries on fewer bodies than this.",
+        )
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=112640,
+            help="Size of each dictionary in bytes.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Train dictionaries."""
+        if zstandard is None:
+            msg = "zstandard must be installed to train compression dictionaries."
+            raise CommandError(msg)
+
+        recent_jobs = models.Job.objects.filter(
+            created_timestamp__gte=timezone.now()
+            - datetime.timedelta(days=options["days"])
+        )
+        endpoints = (
+            recent_jobs.order_by().values_list("model", "request_path").distinct()
+        )
+        fields: list[bodies.BodyField] = ["request_body", "response_content"]
+        for model, path in endpoints:
+            for field in fields:
+                sample_jobs = recent_jobs.filter(
+                    model=model, request_path=path
+                ).order_by("-created_timestamp")[: options["samples"]]
+                samples = [
+                    sample
+                    for job in sample_jobs.iterator()
+                    if (sample := bodies.read(job, field))
+                ]
+                if len(samples) < options["min_samples"]:
+                    continue
+
+                try:
+                    trained = zstandard.train_dictionary(options["size"], samples)
+                except zstandard.ZstdError as exc:
+                    self.stderr.write(
+                        f"Unable to train dictionary for {field} of {model} {path}:"
+                        f" {exc}"
+                    )
+                    continue
+
+                dictionary = models.CompressionDictionary.objects.create(
+                    field=field,
+                    model=model,
+                    request_path=path,
+                    data=trained.as_bytes(),
+                )
+                self.stdout.write(f"Trained {dictionary} on {len(samples)} bodies.")
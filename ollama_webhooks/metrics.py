@@ -0,0 +1,151 @@
+"""Prometheus metrics.
+
+Metrics are recorded in whichever process they happen in. Under gunicorn or Celery's
+prefork pool, set PROMETHEUS_MULTIPROC_DIR to a directory shared by a host's
+processes (bin/web and bin/worker do) so they're added up across them. The web
+process serves them at /metrics, along with the number of unfinished jobs;
+workers serve them on METRICS_WORKER_PORT.
+
+Models and paths come from clients' requests, so only known ones are used as labels;
+the rest are labelled "other".
+"""
+
+import logging
+import os
+from collections import defaultdict
+from collections.abc import Iterator
+
+from django.conf import settings
+from django.db.models import Count
+
+import prometheus_client
+from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+from prometheus_client.core import GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+from ollama_webhooks import models
+
+logger = logging.getLogger(__name__)
+
+# Job latencies range from a cached response to a long generation.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = tuple(4**power for power in range(4, 14))
+OTHER_LABEL = "other"
+OLLAMA_PATHS = {
+    "/api/chat",
+    "/api/embed",
+    "/api/embeddings",
+    "/api/generate",
+    "/v1/chat/completions",
+    "/v1/completions",
+    "/v1/embeddings",
+}
+
+INTAKE_SECONDS = Histogram(
+    "ollama_webhooks_intake_seconds",
+    "Time taken to accept jobs.",
+    ["view", "status_code"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "ollama_webhooks_queue_wait_seconds",
+    "Time from a job being created to being claimed by a worker.",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+OLLAMA_SECONDS = Histogram(
+    "ollama_webhooks_ollama_seconds",
+    "Time from a job being claimed to Ollama's response being recorded.",
+    ["model", "path"],
+    buckets=LATENCY_BUCKETS,
+)
+WEBHOOK_SECONDS = Histogram(
+    "ollama_webhooks_webhook_seconds",
+    "Time taken to send a request to a webhook.",
+    ["outcome"],
+)
+BODY_BYTES = Histogram(
+    "ollama_webhooks_body_bytes",
+    "Uncompressed size of request and response bodies.",
+    ["field"],
+    buckets=SIZE_BUCKETS,
+)
+JOBS = Counter(
+    "ollama_webhooks_jobs",
+    "Jobs by what became of them.",
+    ["outcome"],
+)
+WEBHOOK_DELIVERIES = Counter(
+    "ollama_webhooks_webhook_deliveries",
+    "Webhook delivery attempts by outcome.",
+    ["outcome"],
+)
+
+
+def model_label(model: str) -> str:
+    """Get the label for a model, which is "other" unless it's in METRICS_MODELS."""
+    return model if model in settings.METRICS_MODELS else OTHER_LABEL
+
+
+def path_label(path: str) -> str:
+    """Get the label for an Ollama API path, which is "other" unless it's known."""
+    return path if path in OLLAMA_PATHS else OTHER_LABEL
+
+
+class JobsCollector(Collector):
+    """Count unfinished jobs by status and model when scraped."""
+
+    def collect(self) -> Iterator[Metric]:
+        """Collect unfinished job counts."""
+        gauge = GaugeMetricFamily(
+            "ollama_webhooks_unfinished_jobs",
+            "Jobs which are queued, running or delivering.",
+            labels=["status", "model"],
+        )
+        try:
+            rows = list(
+                models.Job.objects.filter(
+                    status__in=[
+                        models.Job.Status.QUEUED,
+                        models.Job.Status.RUNNING,
+                        models.Job.Status.DELIVERING,
+                    ]
+                )
+                .values("status", "model")
+                .annotate(count=Count("pk"))
+            )
+        except Exception:
+            logger.exception("Unable to count unfinished jobs")
+            return
+        counts: dict[tuple[str, str], int] = defaultdict(int)
+        for row in rows:
+            counts[row["status"], model_label(row["model"])] += row["count"]
+        for labels, count in counts.items():
+            gauge.add_metric(list(labels), count)
+        yield gauge
+
+
+def registry() -> CollectorRegistry:
+    """Get a registry of the metrics recorded on this host, to serve."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return prometheus_client.REGISTRY
+    scrape_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(scrape_registry)  # type: ignore[no-untyped-call]
+    return scrape_registry
+
+
+def generate() -> bytes:
+    """Render the metrics served at /metrics, including unfinished job counts."""
+    jobs_registry = CollectorRegistry()
+    jobs_registry.register(JobsCollector())
+    return prometheus_client.generate_latest(
+        registry()
+    ) + prometheus_client.generate_latest(jobs_registry)
+
+
+def start_worker_server() -> None:
+    """Serve metrics on METRICS_WORKER_PORT, if it's set."""
+    if settings.METRICS_WORKER_PORT is not None:
+        logger.info("Serving metrics on port %s", settings.METRICS_WORKER_PORT)
+        prometheus_client.start_http_server(
+            settings.METRICS_WORKER_PORT, registry=registry()
+        )
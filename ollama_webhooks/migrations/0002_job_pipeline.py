@@ -0,0 +1,301 @@
+"""Add the job pipeline's models, fields and indexes."""
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Add scheduling, outbox, delivery and body storage state."""
+
+    dependencies = [
+        ("ollama_webhooks", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompressionDictionary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "field",
+                    models.TextField(
+                        choices=[
+                            ("request_body", "Request body"),
+                            ("response_content", "Response content"),
+                        ]
+                    ),
+                ),
+                ("model", models.TextField(blank=True)),
+                ("request_path", models.TextField(blank=True)),
+                ("data", models.BinaryField()),
+                ("created_timestamp", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name_plural": "compression dictionaries",
+            },
+        ),
+        migrations.CreateModel(
+            name="OutboxEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_timestamp", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name_plural": "outbox entries",
+            },
+        ),
+        migrations.CreateModel(
+            name="WebhookDelivery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "url",
+                    models.TextField(
+                        blank=True, help_text="Empty to use the default webhook."
+                    ),
+                ),
+                (
+                    "part",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="Which part of a streamed response this is, if any.",
+                        null=True,
+                    ),
+                ),
+                (
+                    "content",
+                    models.BinaryField(
+                        blank=True,
+                        help_text="Empty to send the job's response content.",
+                    ),
+                ),
+                (
+                    "status",
+                    models.TextField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("delivered", "Delivered"),
+                            ("dead", "Dead (given up on)"),
+                        ],
+                        default="pending",
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("created_timestamp", models.DateTimeField(auto_now_add=True)),
+                ("next_attempt_timestamp", models.DateTimeField(blank=True, null=True)),
+                ("delivered_timestamp", models.DateTimeField(blank=True, null=True)),
+                (
+                    "last_status_code",
+                    models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                ("last_error", models.TextField(blank=True)),
+            ],
+            options={
+                "verbose_name_plural": "webhook deliveries",
+            },
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="How many times it's been run."
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="cache_hit",
+            field=models.BooleanField(
+                blank=True,
+                help_text=(
+                    "Whether the response was cached. Empty if it couldn't be cached."
+                ),
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="client",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="lease_expires_timestamp",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When a running job is assumed to have been abandoned.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="model",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="priority",
+            field=models.PositiveSmallIntegerField(
+                default=5, help_text="From 0 (lowest) to 9 (highest)."
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="queued_timestamp",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the job was last queued to be run.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="request_body_codec",
+            field=models.TextField(
+                blank=True, help_text="How the body is compressed, if at all."
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="request_body_hash",
+            field=models.TextField(
+                blank=True, help_text="Set if the body is kept in body storage."
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="request_body_size",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="response_content_codec",
+            field=models.TextField(
+                blank=True, help_text="How the body is compressed, if at all."
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="response_content_hash",
+            field=models.TextField(
+                blank=True, help_text="Set if the body is kept in body storage."
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="response_content_size",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="status",
+            field=models.TextField(
+                choices=[
+                    ("queued", "Queued"),
+                    ("running", "Running"),
+                    ("succeeded", "Succeeded (response recorded)"),
+                    ("failed", "Failed (no response)"),
+                    ("delivering", "Delivering to webhook"),
+                    ("delivered", "Delivered to webhook"),
+                    ("undeliverable", "Undeliverable (webhook given up on)"),
+                ],
+                default="queued",
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="webhook_url",
+            field=models.TextField(
+                blank=True, help_text="Empty to use the default webhook."
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                fields=["created_timestamp"], name="job_created_timestamp_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("status", "queued")),
+                fields=["-priority", "created_timestamp"],
+                name="job_queued_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("status", "running")),
+                fields=["lease_expires_timestamp"],
+                name="job_running_lease_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("status__in", ["queued", "running", "delivering"])),
+                fields=["status", "created_timestamp"],
+                name="job_unfinished_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("request_body_hash", ""), _negated=True),
+                fields=["request_body_hash"],
+                name="job_request_body_hash_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("response_content_hash", ""), _negated=True),
+                fields=["response_content_hash"],
+                name="job_response_content_hash_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="outboxentry",
+            name="job",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="outbox_entries",
+                to="ollama_webhooks.job",
+            ),
+        ),
+        migrations.AddField(
+            model_name="webhookdelivery",
+            name="job",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="webhook_deliveries",
+                to="ollama_webhooks.job",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+"""Record the priority jobs were queued with."""
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Add Job.queued_priority, and an index to find jobs queued after others."""
+
+    dependencies = [
+        ("ollama_webhooks", "0002_job_pipeline"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="queued_priority",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="The priority it was last queued with, after scheduling.",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("request_sent_timestamp__isnull", False)),
+                fields=["model", "queued_timestamp"],
+                name="job_model_queued_idx",
+            ),
+        ),
+    ]
@@ -9,6 +9,15 @@ from django.db import models
 class Job(models.Model):
     """An Ollama job."""
 
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded", "Succeeded (response recorded)"
+        FAILED = "failed", "Failed (no response)"
+        DELIVERING = "delivering", "Delivering to webhook"
+        DELIVERED = "delivered", "Delivered to webhook"
+        UNDELIVERABLE = "undeliverable", "Undeliverable (webhook given up on)"
+
     id = models.UUIDField(db_default=RandomUUID(), editable=False, primary_key=True)
     request_method = models.TextField(
         null=False,
@@ -19,12 +28,188 @@ class Job(models.Model):
     request_query = models.TextField(null=False, blank=True)
     request_headers = models.JSONField(null=False, blank=False, default=dict)
     request_body = models.BinaryField(null=False, blank=True)
+    request_body_hash = models.TextField(
+        null=False, blank=True, help_text="Set if the body is kept in body storage."
+    )
+    request_body_size = models.PositiveBigIntegerField(null=True, blank=True)
+    request_body_codec = models.TextField(
+        null=False, blank=True, help_text="How the body is compressed, if at all."
+    )
+    model = models.TextField(null=False, blank=True)
+    client = models.TextField(null=False, blank=True)
+    priority = models.PositiveSmallIntegerField(
+        null=False, blank=False, default=5, help_text="From 0 (lowest) to 9 (highest)."
+    )
+    webhook_url = models.TextField(
+        null=False, blank=True, help_text="Empty to use the default webhook."
+    )
+    status = models.TextField(
+        null=False, blank=False, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(
+        null=False, blank=False, default=0, help_text="How many times it's been run."
+    )
+    lease_expires_timestamp = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When a running job is assumed to have been abandoned.",
+    )
     created_timestamp = models.DateTimeField(auto_now_add=True, null=False, blank=False)
+    queued_timestamp = models.DateTimeField(
+        null=True, blank=True, help_text="When the job was last queued to be run."
+    )
+    queued_priority = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text="The priority it was last queued with, after scheduling.",
+    )
     request_sent_timestamp = models.DateTimeField(null=True, blank=True)
     response_received_timestamp = models.DateTimeField(null=True, blank=True)
     response_content = models.BinaryField(null=False, blank=True)
+    response_content_hash = models.TextField(
+        null=False, blank=True, help_text="Set if the body is kept in body storage."
+    )
+    response_content_size = models.PositiveBigIntegerField(null=True, blank=True)
+    response_content_codec = models.TextField(
+        null=False, blank=True, help_text="How the body is compressed, if at all."
+    )
     response_headers = models.JSONField(null=False, blank=False, default=dict)
+    cache_hit = models.BooleanField(
+        null=True,
+        blank=True,
+        help_text="Whether the response was cached. Empty if it couldn't be cached.",
+    )
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=["created_timestamp"], name="job_created_timestamp_idx"
+            ),
+            # Finds jobs queued after others, to tell whether their tasks were lost.
+            models.Index(
+                fields=["model", "queued_timestamp"],
+                condition=models.Q(request_sent_timestamp__isnull=False),
+                name="job_model_queued_idx",
+            ),
+            # Partial indexes stay small however many jobs have finished.
+            models.Index(
+                fields=["-priority", "created_timestamp"],
+                condition=models.Q(status="queued"),
+                name="job_queued_idx",
+            ),
+            models.Index(
+                fields=["lease_expires_timestamp"],
+                condition=models.Q(status="running"),
+                name="job_running_lease_idx",
+            ),
+            models.Index(
+                fields=["status", "created_timestamp"],
+                condition=models.Q(status__in=["queued", "running", "delivering"]),
+                name="job_unfinished_idx",
+            ),
+            # Stored bodies are only deleted once no job refers to them.
+            models.Index(
+                fields=["request_body_hash"],
+                condition=~models.Q(request_body_hash=""),
+                name="job_request_body_hash_idx",
+            ),
+            models.Index(
+                fields=["response_content_hash"],
+                condition=~models.Q(response_content_hash=""),
+                name="job_response_content_hash_idx",
+            ),
+        )
 
     def __str__(self) -> str:
         """User-friendly representation of this job."""
         return str(self.id)
+
+
+class OutboxEntry(models.Model):
+    """A job waiting to be queued for Celery by the outbox relay."""
+
+    # Jobs may be partitioned, so their IDs alone can't be referenced by a constraint.
+    job = models.ForeignKey(
+        Job,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="outbox_entries",
+    )
+    created_timestamp = models.DateTimeField(auto_now_add=True, null=False, blank=False)
+
+    class Meta:
+        verbose_name_plural = "outbox entries"
+
+    def __str__(self) -> str:
+        """User-friendly representation of this entry."""
+        return f"Queue job {self.job_id}"
+
+
+class WebhookDelivery(models.Model):
+    """A response (or part of a streamed response) to send to the webhook."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        DELIVERED = "delivered"
+        DEAD = "dead", "Dead (given up on)"
+
+    # Jobs may be partitioned, so their IDs alone can't be referenced by a constraint.
+    job = models.ForeignKey(
+        Job,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="webhook_deliveries",
+    )
+    url = models.TextField(
+        null=False, blank=True, help_text="Empty to use the default webhook."
+    )
+    part = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Which part of a streamed response this is, if any.",
+    )
+    content = models.BinaryField(
+        null=False, blank=True, help_text="Empty to send the job's response content."
+    )
+    status = models.TextField(
+        null=False, blank=False, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(null=False, blank=False, default=0)
+    created_timestamp = models.DateTimeField(auto_now_add=True, null=False, blank=False)
+    next_attempt_timestamp = models.DateTimeField(null=True, blank=True)
+    delivered_timestamp = models.DateTimeField(null=True, blank=True)
+    last_status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_error = models.TextField(null=False, blank=True)
+
+    class Meta:
+        verbose_name_plural = "webhook deliveries"
+
+    def __str__(self) -> str:
+        """User-friendly representation of this delivery."""
+        if self.part is None:
+            return f"Response to job {self.job_id}"
+        return f"Part {self.part} of response to job {self.job_id}"
+
+
+class CompressionDictionary(models.Model):
+    """A zstd dictionary trained on the bodies of one model and endpoint's jobs."""
+
+    field = models.TextField(
+        null=False,
+        blank=False,
+        choices=[
+            ("request_body", "Request body"),
+            ("response_content", "Response content"),
+        ],
+    )
+    model = models.TextField(null=False, blank=True)
+    request_path = models.TextField(null=False, blank=True)
+    data = models.BinaryField(null=False, blank=False)
+    created_timestamp = models.DateTimeField(auto_now_add=True, null=False, blank=False)
+
+    class Meta:
+        verbose_name_plural = "compression dictionaries"
+
+    def __str__(self) -> str:
+        """User-friendly representation of this dictionary."""
+        return f"{self.field} of {self.model} {self.request_path} jobs"
@@ -0,0 +1,89 @@
+"""Notifications of completed jobs, over Redis pub/sub.
+
+Workers publish each completed job's ID on a single channel. Each event loop in the
+web process subscribes to it once, however many clients are waiting, and wakes up
+whichever of them are waiting for that job.
+"""
+
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+from uuid import UUID
+
+from django.conf import settings
+
+from ollama_webhooks import factories
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "jobs-completed"
+
+
+def publish(pk: UUID) -> None:
+    """Announce that a job has completed."""
+    if settings.REDIS_URL:
+        factories.redis().publish(CHANNEL, str(pk))
+
+
+class Listener:
+    """Listen for completed jobs on behalf of everything waiting in an event loop."""
+
+    def __init__(self) -> None:
+        """Create a listener."""
+        self._waiters: defaultdict[str, set[asyncio.Event]] = defaultdict(set)
+        self._task: asyncio.Task[None] | None = None
+
+    async def wait(self, pk: UUID, seconds: float) -> bool:
+        """Wait for up to some seconds for a job to complete, returning whether it did.
+
+        Notifications published before this starts waiting are missed, so callers
+        should check the job itself too.
+        """
+        completed = asyncio.Event()
+        self._waiters[str(pk)].add(completed)
+        if settings.REDIS_URL and (
+            self._task is None or self._task.done() or self._task.cancelling()
+        ):
+            self._task = asyncio.create_task(self._listen())
+
+        try:
+            async with asyncio.timeout(seconds):
+                await completed.wait()
+        except TimeoutError:
+            return False
+        finally:
+            self._waiters[str(pk)].discard(completed)
+            if not self._waiters[str(pk)]:
+                del self._waiters[str(pk)]
+            # Don't hold a Redis connection open while nothing's waiting.
+            if not self._waiters and self._task:
+                self._task.cancel()
+        return True
+
+    async def _listen(self) -> None:
+        try:
+            async with (
+                factories.async_redis() as redis,
+                redis.pubsub() as pubsub,
+            ):
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    for completed in self._waiters.get(message["data"].decode(), ()):
+                        completed.set()
+        except Exception:
+            # Waiters will still notice their jobs complete when they check them.
+            logger.exception("Stopped listening for completed jobs")
+
+
+_listeners: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Listener]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def wait(pk: UUID, seconds: float) -> bool:
+    """Wait for up to some seconds for a job to complete, returning whether it did."""
+    listener = _listeners.setdefault(asyncio.get_running_loop(), Listener())
+    return await listener.wait(pk, seconds)
@@ -0,0 +1,203 @@
+"""Transactional outbox for queuing jobs.
+
+Jobs are saved along with an outbox entry in a single transaction, so a job is
+queued if and only if it's saved, and the web process doesn't wait on the broker.
+The relay publishes entries to Celery in batches, and only deletes them once they've
+been published. Tasks may occasionally be published twice, but a job can only be
+claimed once.
+"""
+
+import datetime
+import logging
+import time
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from ollama_webhooks import (
+    admission,
+    embeddings,
+    jobs,
+    metrics,
+    models,
+    notifications,
+    scheduling,
+    tasks,
+)
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "ollama_webhooks_outbox"
+
+# The only columns needed to queue a job.
+QUEUE_FIELDS = ("id", "model", "client", "priority")
+
+
+def notify() -> None:
+    """Wake the relay once the current transaction commits."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, '')", [CHANNEL])
+
+
+def create_jobs(new_jobs: Sequence[models.Job]) -> list[models.Job]:
+    """Save jobs, and (if they're run by Celery) add them to the outbox."""
+    with transaction.atomic():
+        created_jobs = models.Job.objects.bulk_create(new_jobs)
+        if settings.JOB_RUNNER == "celery":
+            add(created_jobs)
+    return created_jobs
+
+
+def add(queued_jobs: Sequence[models.Job]) -> None:
+    """Add jobs to the outbox."""
+    models.OutboxEntry.objects.bulk_create(
+        models.OutboxEntry(job_id=job.pk) for job in queued_jobs
+    )
+    notify()
+
+
+def relay(limit: int) -> int:
+    """Queue the jobs from up to limit outbox entries, returning how many entries.
+
+    Entries are locked while their jobs are published, so several relays can run at
+    once, and are kept if publishing fails.
+    """
+    with transaction.atomic():
+        entries = list(
+            models.OutboxEntry.objects.select_for_update(skip_locked=True)
+            .order_by("pk")
+            .values_list("pk", "job_id")[:limit]
+        )
+        if not entries:
+            return 0
+
+        job_pks = [job_pk for _, job_pk in entries]
+        queued_jobs = list(
+            models.Job.objects.filter(pk__in=job_pks).only(*QUEUE_FIELDS)
+        )
+        tasks.enqueue_jobs(queued_jobs)
+        models.OutboxEntry.objects.filter(pk__in=[pk for pk, _ in entries]).delete()
+
+    logger.info("Queued %s jobs from the outbox", len(queued_jobs))
+    return len(entries)
+
+
+def run(batch_size: int, poll_interval: float) -> None:
+    """Relay outbox entries until interrupted.
+
+    The relay sleeps until it's notified of new entries, or for poll_interval
+    seconds. If anything goes wrong, it reconnects and carries on.
+    """
+    while True:
+        try:
+            connection.ensure_connection()
+            pg_connection = connection.connection
+            pg_connection.execute(f"LISTEN {connection.ops.quote_name(CHANNEL)}")
+            while True:
+                while relay(batch_size) == batch_size:
+                    pass
+                for _ in pg_connection.notifies(timeout=poll_interval, stop_after=1):
+                    pass
+        except Exception:
+            logger.exception("Unable to relay outbox entries")
+            connection.close()
+            time.sleep(poll_interval)
+
+
+def requeue_stale(limit: int) -> int:
+    """Requeue up to limit jobs whose tasks have been lost.
+
+    A queued job's task is known to be lost once a job for the same model, queued
+    after it with no better priority, was claimed by its own task more than
+    OUTBOX_REQUEUE_AFTER seconds ago: the queue has moved past it, so it isn't
+    waiting there or held by a worker. Parked jobs have no task to lose. Jobs which
+    were never queued at all are added to the outbox once they're
+    OUTBOX_REQUEUE_AFTER seconds old; the rest are queued again directly, without
+    counting them as queued twice. Returns how many jobs.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.OUTBOX_REQUEUE_AFTER)
+    passed_over = models.Job.objects.filter(
+        model=OuterRef("model"),
+        queued_timestamp__gt=OuterRef("queued_timestamp"),
+        queued_priority__lte=OuterRef("queued_priority"),
+        request_sent_timestamp__gte=F("queued_timestamp"),
+        request_sent_timestamp__lt=cutoff,
+    )
+    if settings.EMBED_BATCH_MAX_SIZE > 1:
+        # Embedding jobs may be claimed along with others, out of queue order.
+        passed_over = passed_over.exclude(request_path=embeddings.EMBED_PATH)
+    stale_jobs = list(
+        models.Job.objects.filter(
+            Q(queued_timestamp__isnull=True, created_timestamp__lt=cutoff)
+            | Q(Exists(passed_over), queued_timestamp__lt=cutoff),
+            status=models.Job.Status.QUEUED,
+        )
+        .exclude(pk__in=models.OutboxEntry.objects.values("job_id"))
+        .only(*QUEUE_FIELDS, "queued_timestamp")[:limit]
+    )
+    never_queued = [job for job in stale_jobs if job.queued_timestamp is None]
+    parked = scheduling.parked(stale_jobs)
+    lost = [
+        job
+        for job in stale_jobs
+        if job.queued_timestamp is not None and str(job.pk) not in parked
+    ]
+
+    if never_queued:
+        with transaction.atomic():
+            add(never_queued)
+    if lost:
+        tasks.enqueue_jobs(lost, requeued=True)
+    if requeued := len(never_queued) + len(lost):
+        logger.warning("Requeued %s jobs whose tasks were lost", requeued)
+    return requeued
+
+
+def sweep_expired_leases(limit: int) -> tuple[int, int]:
+    """Requeue or fail up to limit running jobs whose leases have expired.
+
+    A job's lease expires if its worker died or hung while running it. Jobs which
+    have been run fewer than JOB_MAX_ATTEMPTS times are queued again (through the
+    outbox, if they're run by Celery); the rest are failed. Returns how many jobs
+    were requeued and failed.
+    """
+    with transaction.atomic():
+        expired = list(
+            models.Job.objects.filter(
+                status=models.Job.Status.RUNNING, lease_expires_timestamp__lt=Now()
+            )
+            .select_for_update(skip_locked=True)
+            .only("id", "model", "attempts")[:limit]
+        )
+        requeued = [job for job in expired if job.attempts < settings.JOB_MAX_ATTEMPTS]
+        failed = [job for job in expired if job.attempts >= settings.JOB_MAX_ATTEMPTS]
+
+        models.Job.objects.filter(pk__in=[job.pk for job in requeued]).update(
+            status=models.Job.Status.QUEUED,
+            lease_expires_timestamp=None,
+            request_sent_timestamp=None,
+        )
+        models.Job.objects.filter(pk__in=[job.pk for job in failed]).update(
+            status=models.Job.Status.FAILED, lease_expires_timestamp=None
+        )
+        if requeued and settings.JOB_RUNNER == "celery":
+            add(requeued)
+
+    jobs.forget_status(job.pk for job in expired)
+    admission.requeued(job.model for job in requeued)
+    admission.finished(job.model for job in failed)
+    metrics.JOBS.labels("requeued").inc(len(requeued))
+    metrics.JOBS.labels("failed").inc(len(failed))
+    for job in failed:
+        notifications.publish(job.pk)
+    if expired:
+        logger.warning(
+            "Requeued %s and failed %s jobs whose leases expired",
+            len(requeued),
+            len(failed),
+        )
+    return len(requeued), len(failed)
@@ -0,0 +1,201 @@
+"""Range partitioning of the Job table by created timestamp.
+
+Partitioning lets expired jobs be dropped a whole partition at a time rather than
+deleted row by row, which keeps vacuuming and index sizes bounded. Partitions are
+named after the start of the period they hold, e.g. ollama_webhooks_job_p20250106,
+and are created JOB_PARTITIONS_AHEAD periods in advance, as jobs can't be inserted
+outside of a partition.
+"""
+
+import datetime
+import logging
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+from ollama_webhooks import bodies, models
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = {"day": datetime.timedelta(days=1), "week": datetime.timedelta(weeks=1)}
+
+_UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def _table() -> str:
+    return models.Job._meta.db_table
+
+
+def _literal(moment: datetime.datetime) -> str:
+    return f"'{moment.isoformat()}'"
+
+
+def interval() -> datetime.timedelta:
+    """Get how long a period each partition holds."""
+    try:
+        return INTERVALS[settings.JOB_PARTITION_INTERVAL or ""]
+    except KeyError:
+        msg = f"JOB_PARTITION_INTERVAL must be one of {', '.join(INTERVALS)}."
+        raise ImproperlyConfigured(msg) from None
+
+
+def period_start(moment: datetime.datetime) -> datetime.datetime:
+    """Get the start of the period containing a moment: a day, or a week from Monday.
+
+    Periods are in UTC.
+    """
+    start = datetime.datetime.combine(
+        moment.astimezone(datetime.UTC).date(), datetime.time(), tzinfo=datetime.UTC
+    )
+    if interval() == INTERVALS["week"]:
+        start -= datetime.timedelta(days=start.weekday())
+    return start
+
+
+def is_partitioned() -> bool:
+    """Check whether the Job table is partitioned."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT FROM pg_partitioned_table"
+            " WHERE partrelid = %s::regclass)",
+            [_table()],
+        )
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def partitions() -> dict[str, datetime.datetime | None]:
+    """Get each partition of the Job table's upper bound, by name."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)"
+            " FROM pg_inherits"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " WHERE pg_inherits.inhparent = %s::regclass",
+            [_table()],
+        )
+        rows = cursor.fetchall()
+
+    bounds: dict[str, datetime.datetime | None] = {}
+    for name, bound in rows:
+        match = _UPPER_BOUND_RE.search(bound)
+        bounds[name] = datetime.datetime.fromisoformat(match[1]) if match else None
+    return bounds
+
+
+def create_partitions(now: datetime.datetime) -> list[str]:
+    """Create partitions up to JOB_PARTITIONS_AHEAD periods after the current one.
+
+    New partitions continue on from the latest existing one, so there are no gaps.
+    Returns the names of the partitions created.
+    """
+    qn = connection.ops.quote_name
+    start = max(
+        (bound for bound in partitions().values() if bound is not None),
+        default=period_start(now),
+    )
+    end = period_start(now) + interval() * (settings.JOB_PARTITIONS_AHEAD + 1)
+
+    created = []
+    while start < end:
+        name = f"{_table()}_p{start:%Y%m%d}"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} PARTITION OF {qn(_table())}"
+                f" FOR VALUES FROM ({_literal(start)})"
+                f" TO ({_literal(start + interval())})"
+            )
+        logger.info("Created job partition %s", name)
+        created.append(name)
+        start += interval()
+    return created
+
+
+def drop_expired(now: datetime.datetime) -> list[str]:
+    """Drop partitions holding only jobs older than JOB_RETENTION_DAYS.
+
+    Their jobs' outbox entries and webhook deliveries are deleted first, as nothing
+    in the database does it for them, and their bodies in body storage afterwards,
+    unless other jobs share them. Returns the names of the partitions dropped.
+    """
+    if settings.JOB_RETENTION_DAYS is None:
+        return []
+
+    qn = connection.ops.quote_name
+    cutoff = now - datetime.timedelta(days=settings.JOB_RETENTION_DAYS)
+    dropped = []
+    for name, bound in sorted(partitions().items()):
+        if bound is not None and bound <= cutoff:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT {qn('request_body_hash')} FROM {qn(name)}"  # noqa: S608
+                    f" UNION SELECT {qn('response_content_hash')} FROM {qn(name)}"
+                )
+                digests = {digest for (digest,) in cursor.fetchall() if digest}
+                for related_model in (models.OutboxEntry, models.WebhookDelivery):
+                    cursor.execute(
+                        f"DELETE FROM {qn(related_model._meta.db_table)}"  # noqa: S608
+                        f" WHERE {qn('job_id')} IN (SELECT {qn('id')} FROM {qn(name)})"
+                    )
+                cursor.execute(f"DROP TABLE {qn(name)}")
+            deleted = bodies.delete_unreferenced(digests)
+            logger.info(
+                "Dropped expired job partition %s, and %s stored bodies", name, deleted
+            )
+            dropped.append(name)
+    return dropped
+
+
+@transaction.atomic
+def convert(now: datetime.datetime) -> None:
+    """Convert the Job table into a partitioned table.
+
+    The existing table becomes the partition for every job created before the end of
+    the current period, so no rows are copied, but the table is locked while that's
+    checked and the new primary key (which must include created_timestamp) and
+    indexes are built on it.
+    """
+    qn = connection.ops.quote_name
+    table = _table()
+    legacy = f"{table}_legacy"
+    end = period_start(now) + interval()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        # Index names are shared by the whole schema, so make way for the new ones.
+        for index in models.Job._meta.indexes:
+            cursor.execute(f"DROP INDEX IF EXISTS {qn(str(index.name))}")
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(
+            "SELECT conname FROM pg_constraint"
+            " WHERE conrelid = %s::regclass AND contype = 'p'",
+            [legacy],
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(
+                f"ALTER TABLE {qn(legacy)}"
+                f" RENAME CONSTRAINT {qn(constraint)} TO {qn(f'{legacy}_pkey')}"
+            )
+
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)}"
+            " INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE"
+            f" INCLUDING COMMENTS) PARTITION BY RANGE ({qn('created_timestamp')})"
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)}"
+            f" ADD PRIMARY KEY ({qn('id')}, {qn('created_timestamp')})"
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)}"
+            f" FOR VALUES FROM (MINVALUE) TO ({_literal(end)})"
+        )
+
+    with connection.schema_editor() as editor:
+        for index in models.Job._meta.indexes:
+            editor.add_index(models.Job, index)
+
+    logger.info("Partitioned jobs, keeping existing jobs in %s", legacy)
+    create_partitions(now)
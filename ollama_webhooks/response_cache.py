@@ -0,0 +1,132 @@
+"""Cache of Ollama's responses to deterministic requests."""
+
+import hashlib
+import io
+import json
+import logging
+from collections.abc import Iterable, Mapping
+from typing import IO, Any
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.cache import caches
+
+import requests
+
+from ollama_webhooks import bodies, factories, models
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_PATHS = {"/api/chat", "/api/embed", "/api/embeddings", "/api/generate"}
+EMBEDDING_PATHS = {"/api/embed", "/api/embeddings"}
+DIGESTS_CACHE_KEY = "ollama-model-digests"
+
+
+def is_deterministic(path: str, body: Mapping[str, Any]) -> bool:
+    """Check whether Ollama will always respond to a request in the same way.
+
+    Embeddings always are. Generations are if they aren't streamed and either have a
+    temperature of zero or a fixed seed.
+    """
+    if path in EMBEDDING_PATHS:
+        return True
+
+    options = body.get("options") or {}
+    return body.get("stream") is False and (
+        options.get("temperature") == 0 or options.get("seed") is not None
+    )
+
+
+def model_digests(backend: str) -> dict[str, str]:
+    """Get the digest of each model an Ollama backend has, from /api/tags.
+
+    Digests are cached briefly in the default cache.
+    """
+    cache_key = f"{DIGESTS_CACHE_KEY}:{backend}"
+    digests: dict[str, str] | None = caches["default"].get(cache_key)
+    if digests is None:
+        response = factories.session("ollama").get(
+            urljoin(backend, "/api/tags"), timeout=settings.OLLAMA_TIMEOUT
+        )
+        response.raise_for_status()
+        digests = {
+            model["name"]: model["digest"] for model in response.json()["models"]
+        }
+        caches["default"].set(cache_key, digests, settings.RESPONSE_CACHE_DIGEST_TTL)
+    return digests
+
+
+def request_key(job: models.Job) -> str | None:
+    """Get a hash of a job's request, or None if its response can't be cached.
+
+    The request's JSON body is canonicalized, so equivalent requests hash the same.
+    """
+    if (
+        not settings.RESPONSE_CACHE_BACKEND
+        or job.request_method != "POST"
+        or job.request_path not in CACHEABLE_PATHS
+    ):
+        return None
+
+    try:
+        body = json.loads(bodies.read(job, "request_body"))
+    except ValueError:
+        return None
+    if not isinstance(body, dict) or not is_deterministic(job.request_path, body):
+        return None
+
+    request = json.dumps(
+        [job.request_method, job.request_path, job.request_query, body],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+def key(request: str, model: str, backend: str) -> str | None:
+    """Get the cache key for a backend's response to a request, given its hash.
+
+    The key includes the digest of the backend's copy of the model, so responses
+    from an updated (or different) model aren't used. It's None if the digest can't
+    be found.
+    """
+    model = model if ":" in model else f"{model}:latest"
+    try:
+        digest = model_digests(backend).get(model)
+    except requests.RequestException:
+        logger.warning("Unable to get model digests from %s, not caching", backend)
+        return None
+    if digest is None:
+        return None
+    return f"ollama-response:{request}:{digest}"
+
+
+def lookup(
+    request: str, model: str, backends: Iterable[str]
+) -> tuple[bytes, dict[str, str]] | None:
+    """Get the content and headers of a cached response to a request, given its hash.
+
+    Responses from any of the backends' copies of the model will do.
+    """
+    for cache_key in {key(request, model, backend) for backend in backends}:
+        if cache_key is None:
+            continue
+        cached: tuple[bytes, dict[str, str]] | None = caches["responses"].get(cache_key)
+        if cached is not None:
+            return cached
+    return None
+
+
+def store(
+    request: str,
+    model: str,
+    backend: str,
+    content: IO[bytes],
+    headers: Mapping[str, str],
+) -> None:
+    """Cache a backend's response to a request, unless the content is too large."""
+    if content.seek(0, io.SEEK_END) > settings.RESPONSE_CACHE_MAX_SIZE:
+        return
+    if cache_key := key(request, model, backend):
+        content.seek(0)
+        caches["responses"].set(cache_key, (content.read(), dict(headers)))
@@ -0,0 +1,119 @@
+"""Route jobs across a pool of Ollama backends.
+
+Which models each backend has loaded, how many requests each has outstanding and
+which backends have been ejected as unhealthy are shared between workers in Redis.
+Outstanding requests are held as expiring entries in a sorted set per backend, so a
+worker which dies doesn't leave its requests counted for good.
+"""
+
+import logging
+import random
+import time
+import uuid
+from urllib.parse import urljoin
+
+from django.conf import settings
+
+import requests
+
+from ollama_webhooks import factories
+
+logger = logging.getLogger(__name__)
+
+
+def _outstanding_key(backend: str) -> str:
+    return f"ollama-outstanding:{backend}"
+
+
+def _loaded_key(backend: str) -> str:
+    return f"ollama-loaded:{backend}"
+
+
+def _ejected_key(backend: str) -> str:
+    return f"ollama-ejected:{backend}"
+
+
+def candidates(model: str) -> list[str]:
+    """Get the backends to try for a model, best first.
+
+    Healthy backends which already have the model loaded are preferred, then those
+    with the fewest outstanding requests. Ejected backends are only tried last.
+    """
+    backends = list(settings.OLLAMA_URLS)
+    if len(backends) == 1:
+        return backends
+
+    redis = factories.redis()
+    now = time.time()
+    with redis.pipeline(transaction=False) as pipe:
+        for backend in backends:
+            pipe.exists(_ejected_key(backend))
+            pipe.sismember(_loaded_key(backend), model)
+            pipe.zcount(_outstanding_key(backend), now, "+inf")
+        states = pipe.execute()
+
+    random.shuffle(backends)
+    ranks = {
+        backend: (
+            bool(states[i * 3]),
+            not states[i * 3 + 1],
+            states[i * 3 + 2],
+        )
+        for i, backend in enumerate(settings.OLLAMA_URLS)
+    }
+    return sorted(backends, key=ranks.__getitem__)
+
+
+def acquire(backend: str) -> str:
+    """Count a request to a backend as outstanding, returning a token to release it."""
+    if len(settings.OLLAMA_URLS) == 1:
+        return ""
+
+    token = uuid.uuid4().hex
+    now = time.time()
+    with factories.redis().pipeline() as pipe:
+        pipe.zremrangebyscore(_outstanding_key(backend), "-inf", now)
+        # Entries expire once the job's lease would have expired anyway.
+        pipe.zadd(_outstanding_key(backend), {token: now + settings.JOB_LEASE_SECONDS})
+        pipe.expire(_outstanding_key(backend), settings.JOB_LEASE_SECONDS)
+        pipe.execute()
+    return token
+
+
+def release(backend: str, token: str) -> None:
+    """Stop counting a request to a backend as outstanding."""
+    if len(settings.OLLAMA_URLS) > 1:
+        factories.redis().zrem(_outstanding_key(backend), token)
+
+
+def eject(backend: str) -> None:
+    """Stop preferring a backend for OLLAMA_EJECT_SECONDS."""
+    logger.warning("Ejecting Ollama backend %s", backend)
+    if len(settings.OLLAMA_URLS) > 1:
+        factories.redis().set(
+            _ejected_key(backend), 1, ex=settings.OLLAMA_EJECT_SECONDS
+        )
+
+
+def poll() -> None:
+    """Check each backend's health and which models it has loaded, from /api/ps."""
+    redis = factories.redis()
+    for backend in settings.OLLAMA_URLS:
+        try:
+            response = factories.session("ollama").get(
+                urljoin(backend, "/api/ps"), timeout=settings.OLLAMA_POLL_TIMEOUT
+            )
+            response.raise_for_status()
+            models = [model["name"] for model in response.json()["models"]]
+        except (requests.RequestException, KeyError, ValueError):
+            eject(backend)
+            continue
+
+        # Models may be requested without the default ":latest" tag.
+        models += [model.removesuffix(":latest") for model in models]
+        with redis.pipeline() as pipe:
+            pipe.delete(_loaded_key(backend), _ejected_key(backend))
+            if models:
+                pipe.sadd(_loaded_key(backend), *models)
+                pipe.expire(_loaded_key(backend), settings.OLLAMA_POLL_INTERVAL * 3)
+            pipe.execute()
@@ -0,0 +1,207 @@
+"""Priority and fair-share scheduling of jobs between clients.
+
+Each client's queued and in-flight job counts are kept in Redis. A client's jobs
+lose priority as its backlog grows relative to its weight, so one client's bulk
+backfill doesn't hold up everybody else's interactive requests.
+
+Queued counts are recounted from the Job table every minute, in case they've
+drifted. Jobs in flight are held as expiring entries in a sorted set per client, so
+a worker which dies doesn't hold onto its slot for good.
+
+A job whose client is at its cap when the job's task runs is parked in another
+sorted set per client, rather than retried, so the broker only holds jobs which can
+run. Parked jobs are queued again, best first, as the client's jobs finish.
+"""
+
+import hashlib
+import logging
+import math
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterable, Sequence
+
+from django import http
+from django.conf import settings
+from django.db.models import Count
+
+from ollama_webhooks import factories, models
+
+logger = logging.getLogger(__name__)
+
+QUEUED_KEY = "scheduler-queued"
+MAX_PRIORITY = 9
+
+
+def _in_flight_key(client: str) -> str:
+    return f"scheduler-in-flight:{client}"
+
+
+def _parked_key(client: str) -> str:
+    return f"scheduler-parked:{client}"
+
+
+def client_from_request(request: http.HttpRequest) -> str:
+    """Identify the client sending a request.
+
+    Clients are identified by SCHEDULER_CLIENT_HEADER, or a hash of their API key.
+    """
+    if client := request.headers.get(settings.SCHEDULER_CLIENT_HEADER):
+        return client
+    if api_key := request.headers.get("Authorization"):
+        return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return ""
+
+
+def priority_from_request(request: http.HttpRequest) -> int:
+    """Get the priority a request asks for, from 0 (lowest) to 9 (highest)."""
+    try:
+        priority = int(request.headers.get(settings.SCHEDULER_PRIORITY_HEADER, ""))
+    except ValueError:
+        return settings.SCHEDULER_DEFAULT_PRIORITY
+    return max(0, min(priority, MAX_PRIORITY))
+
+
+def prioritize(jobs: Sequence[models.Job], *, count: bool = True) -> list[int]:
+    """Count jobs as queued, and get the priority to queue each one with.
+
+    Each doubling of a client's backlog (in multiples of the client's weight) costs
+    its next job one priority level. Jobs which are already counted as queued (as
+    they're being queued again) aren't counted unless count is true.
+    """
+    if not settings.SCHEDULER_ENABLED:
+        return [job.priority for job in jobs]
+
+    counts = Counter(job.client for job in jobs)
+    with factories.redis().pipeline(transaction=False) as pipe:
+        for client, client_count in counts.items():
+            if count:
+                pipe.hincrby(QUEUED_KEY, client, client_count)
+            else:
+                pipe.hget(QUEUED_KEY, client)
+        backlogs = {
+            client: int(total or 0) - (counts[client] if count else 0)
+            for client, total in zip(counts, pipe.execute(), strict=True)
+        }
+
+    priorities = []
+    for job in jobs:
+        weight = settings.SCHEDULER_CLIENT_WEIGHTS.get(job.client, 1)
+        penalty = int(math.log2(1 + max(backlogs[job.client], 0) / weight))
+        priorities.append(max(0, job.priority - penalty))
+        backlogs[job.client] += 1
+    return priorities
+
+
+def _count(clients: Iterable[str], sign: int) -> None:
+    if not settings.SCHEDULER_ENABLED or not (counts := Counter(clients)):
+        return
+    with factories.redis().pipeline(transaction=False) as pipe:
+        for client, count in counts.items():
+            pipe.hincrby(QUEUED_KEY, client, sign * count)
+        pipe.execute()
+
+
+def dequeued(clients: Iterable[str]) -> None:
+    """Stop counting claimed jobs of these clients as queued."""
+    _count(clients, -1)
+
+
+def requeued(clients: Iterable[str]) -> None:
+    """Count jobs of these clients which were put back in the queue as queued."""
+    _count(clients, 1)
+
+
+def acquire(client: str) -> str | None:
+    """Count one of a client's jobs as in flight, unless it's at its cap.
+
+    Returns a token to release it with, or None if the client's at its cap.
+    """
+    if not settings.SCHEDULER_ENABLED:
+        return ""
+
+    token = uuid.uuid4().hex
+    now = time.time()
+    with factories.redis().pipeline() as pipe:
+        pipe.zremrangebyscore(_in_flight_key(client), "-inf", now)
+        # Entries expire once the job's lease would have expired anyway.
+        pipe.zadd(_in_flight_key(client), {token: now + settings.JOB_LEASE_SECONDS})
+        pipe.expire(_in_flight_key(client), settings.JOB_LEASE_SECONDS)
+        pipe.zcard(_in_flight_key(client))
+        *_, in_flight = pipe.execute()
+
+    if in_flight > settings.SCHEDULER_MAX_IN_FLIGHT:
+        release(client, token)
+        return None
+    return token
+
+
+def release(client: str, token: str) -> None:
+    """Stop counting one of a client's jobs as in flight."""
+    if settings.SCHEDULER_ENABLED:
+        factories.redis().zrem(_in_flight_key(client), token)
+
+
+def park(job: models.Job) -> None:
+    """Hold a queued job until its client has room for it in flight."""
+    # Higher priority, then older, jobs have lower scores.
+    score = (MAX_PRIORITY - job.priority) * 10**10 + job.created_timestamp.timestamp()
+    factories.redis().zadd(_parked_key(job.client), {str(job.pk): score})
+
+
+def unpark(client: str) -> list[str]:
+    """Take as many of a client's parked jobs as it has room for in flight.
+
+    Returns the jobs' IDs, best first.
+    """
+    if not settings.SCHEDULER_ENABLED:
+        return []
+
+    in_flight = factories.redis().zcount(_in_flight_key(client), time.time(), "+inf")
+    room = settings.SCHEDULER_MAX_IN_FLIGHT - in_flight
+    if room <= 0:
+        return []
+    return [
+        pk.decode() for pk, _ in factories.redis().zpopmin(_parked_key(client), room)
+    ]
+
+
+def parked(jobs: Sequence[models.Job]) -> set[str]:
+    """Get the IDs of those of these jobs which are parked."""
+    if not settings.SCHEDULER_ENABLED or not jobs:
+        return set()
+
+    with factories.redis().pipeline(transaction=False) as pipe:
+        for job in jobs:
+            pipe.zscore(_parked_key(job.client), str(job.pk))
+        scores = pipe.execute()
+    return {
+        str(job.pk)
+        for job, score in zip(jobs, scores, strict=True)
+        if score is not None
+    }
+
+
+def parked_clients() -> list[str]:
+    """Get the clients which have parked jobs."""
+    prefix = _parked_key("")
+    return [
+        key.decode().removeprefix(prefix)
+        for key in factories.redis().scan_iter(match=f"{prefix}*")
+    ]
+
+
+def recount() -> None:
+    """Replace each client's queued count with its number of queued jobs."""
+    if not settings.SCHEDULER_ENABLED:
+        return
+
+    with factories.redis().pipeline() as pipe:
+        pipe.delete(QUEUED_KEY)
+        for row in (
+            models.Job.objects.filter(status=models.Job.Status.QUEUED)
+            .values("client")
+            .annotate(count=Count("pk"))
+        ):
+            pipe.hset(QUEUED_KEY, row["client"], row["count"])
+        pipe.execute()
@@ -1,5 +1,6 @@
 """Settings."""
 
+import json
 import logging
 import os
 from collections.abc import Iterable, Mapping
@@ -123,6 +124,24 @@ CELERY_WORKER_PREFETCH_MULTIPLIER = int(
     os.environ.get("CELERY_WORKER_PREFETCH_MULTIPLIER", 1)
 )
 
+CELERY_BEAT_SCHEDULE: dict[str, dict[str, Any]] = {}
+
+# Redis only supports priorities as separate lists per queue. Queues are consumed
+# round-robin, so one model's backlog doesn't hold up another's, while priorities
+# order the jobs within each queue.
+# https://docs.celeryq.dev/en/stable/userguide/routing.html#redis-message-priorities
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "priority_steps": list(range(10)),
+    "queue_order_strategy": "round_robin",
+}
+
+# Jobs for models matching these patterns go to their own queues, e.g.
+# MODEL_QUEUES="llama3.3:70b*=bulk nomic-embed-text*=embeddings". Workers can
+# subscribe to a subset of queues with CELERY_WORKER_QUEUES (see bin/worker).
+MODEL_QUEUES = dict(
+    item.split("=", 1) for item in os.environ.get("MODEL_QUEUES", "").split()
+)
+
 # Will become the default in Celery 6.
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html
 # #worker-cancel-long-running-tasks-on-connection-loss
@@ -131,6 +150,48 @@ CELERY_WORKER_CANCEL_LONG_RUNNING_TASKS_ON_CONNECTION_LOSS = bool(
 )
 
 
+# Caches
+# https://docs.djangoproject.com/en/stable/topics/cache/
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+CACHES: dict[str, dict[str, Any]] = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+        if REDIS_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    ),
+}
+
+# Opt-in cache of Ollama's responses to deterministic requests, either "redis" or
+# "database". Redis evicts according to its maxmemory-policy (e.g. allkeys-lru); the
+# database cache culls entries beyond RESPONSE_CACHE_MAX_ENTRIES, and needs
+# `manage.py createcachetable`.
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND")
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 60 * 60 * 24))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+RESPONSE_CACHE_MAX_SIZE = int(os.environ.get("RESPONSE_CACHE_MAX_SIZE", 1024 * 1024))
+RESPONSE_CACHE_DIGEST_TTL = int(os.environ.get("RESPONSE_CACHE_DIGEST_TTL", 60))
+
+match RESPONSE_CACHE_BACKEND:
+    case "redis":
+        CACHES["responses"] = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "TIMEOUT": RESPONSE_CACHE_TTL,
+        }
+    case "database":
+        CACHES["responses"] = {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "ollama_webhooks_response_cache",
+            "TIMEOUT": RESPONSE_CACHE_TTL,
+            "OPTIONS": {"MAX_ENTRIES": RESPONSE_CACHE_MAX_ENTRIES},
+        }
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/stable/ref/settings/#default-auto-field
 
@@ -258,6 +319,22 @@ if SENTRY_DSN:
     )
 
 
+# Metrics
+# Prometheus metrics are served at /metrics by the web process, requiring
+# "Authorization: Bearer $METRICS_TOKEN" if that's set, and by workers on
+# METRICS_WORKER_PORT if that's set. Metrics are only labelled with the models in
+# METRICS_MODELS (e.g. METRICS_MODELS="llama3.2 nomic-embed-text"); any others are
+# labelled "other", so clients can't add labels at will.
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_WORKER_PORT = (
+    int(os.environ["METRICS_WORKER_PORT"])
+    if "METRICS_WORKER_PORT" in os.environ
+    else None
+)
+METRICS_MODELS = set(os.environ.get("METRICS_MODELS", "").split())
+
+
 # Security
 # https://docs.djangoproject.com/en/stable/topics/security/
 
@@ -367,6 +444,46 @@ CORS_ALLOW_HEADERS = [*list(corsheaders.defaults.default_headers)]
 CORS_PREFLIGHT_MAX_AGE = 0 if DEBUG else 86400
 
 
+# Storage
+# https://docs.djangoproject.com/en/stable/ref/settings/#storages
+
+# Job bodies larger than BODY_STORAGE_THRESHOLD bytes are kept in the "bodies"
+# storage rather than the database, so they're streamed rather than held in memory
+# whole. BODY_STORAGE_BACKEND can be any Django storage backend (e.g.
+# storages.backends.s3.S3Storage for MinIO), configured with a JSON object of
+# BODY_STORAGE_OPTIONS, and must be shared by every process. Set
+# BODY_STORAGE_THRESHOLD to an empty string to keep every body in the database.
+BODY_STORAGE_THRESHOLD = (
+    None
+    if os.environ.get("BODY_STORAGE_THRESHOLD") == ""
+    else int(os.environ.get("BODY_STORAGE_THRESHOLD", 1024 * 1024))
+)
+
+STORAGES: dict[str, dict[str, Any]] = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "bodies": {
+        "BACKEND": os.environ.get(
+            "BODY_STORAGE_BACKEND", "django.core.files.storage.FileSystemStorage"
+        ),
+        "OPTIONS": json.loads(
+            os.environ.get(
+                "BODY_STORAGE_OPTIONS",
+                json.dumps({"location": str(BASE_DIR / "bodies")}),
+            )
+        ),
+    },
+}
+
+# Bodies are compressed with BODY_COMPRESSION: "zstd", "gzip" or "" for none.
+BODY_COMPRESSION = os.environ.get("BODY_COMPRESSION", "zstd")
+BODY_COMPRESSION_LEVEL = int(os.environ.get("BODY_COMPRESSION_LEVEL", 3))
+BODY_COMPRESSION_MIN_SIZE = int(os.environ.get("BODY_COMPRESSION_MIN_SIZE", 256))
+BODY_COMPRESSION_DICTIONARY_CACHE_TTL = int(
+    os.environ.get("BODY_COMPRESSION_DICTIONARY_CACHE_TTL", 300)
+)
+
+
 # Memory
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = int(
@@ -377,7 +494,251 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = int(
 # Ollama
 
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+# Jobs are routed across these backends, preferring those with the model loaded.
+OLLAMA_URLS = os.environ.get("OLLAMA_URLS", "").split() or [OLLAMA_URL]
+OLLAMA_POLL_INTERVAL = int(os.environ.get("OLLAMA_POLL_INTERVAL", 10))
+OLLAMA_POLL_TIMEOUT = float(os.environ.get("OLLAMA_POLL_TIMEOUT", 5))
+OLLAMA_EJECT_SECONDS = int(os.environ.get("OLLAMA_EJECT_SECONDS", 30))
 OLLAMA_TIMEOUT = int(os.environ.get("OLLAMA_TIMEOUT", CELERY_TASK_SOFT_TIME_LIMIT))
+
+if len(OLLAMA_URLS) > 1:
+    CELERY_BEAT_SCHEDULE["poll-ollama-backends"] = {
+        "task": "ollama_webhooks.tasks.poll_ollama_backends",
+        "schedule": OLLAMA_POLL_INTERVAL,
+    }
+
+# With OLLAMA_CONCURRENCY_ADAPTIVE (and REDIS_URL), how many requests each backend
+# is sent at once adapts to how it's coping, between OLLAMA_CONCURRENCY_MIN and
+# OLLAMA_CONCURRENCY_MAX. The limit is cut by the OLLAMA_CONCURRENCY_DECREASE factor
+# (at most once per OLLAMA_CONCURRENCY_DECREASE_INTERVAL seconds) when a backend
+# responds 429 or 503, times out or takes longer than
+# OLLAMA_CONCURRENCY_LATENCY_TARGET seconds to start responding, and raised a little
+# with every other response. Jobs wait up to OLLAMA_CONCURRENCY_MAX_WAIT seconds for
+# a backend under its limit, checking every OLLAMA_CONCURRENCY_RETRY_DELAY seconds,
+# then are queued again. Celery workers put jobs back in the queue, and give up
+# their clients' in-flight slots, while they wait.
+OLLAMA_CONCURRENCY_ADAPTIVE = bool(os.environ.get("OLLAMA_CONCURRENCY_ADAPTIVE"))
+OLLAMA_CONCURRENCY_INITIAL = float(os.environ.get("OLLAMA_CONCURRENCY_INITIAL", 4))
+OLLAMA_CONCURRENCY_MIN = float(os.environ.get("OLLAMA_CONCURRENCY_MIN", 1))
+OLLAMA_CONCURRENCY_MAX = float(os.environ.get("OLLAMA_CONCURRENCY_MAX", 64))
+OLLAMA_CONCURRENCY_DECREASE = float(os.environ.get("OLLAMA_CONCURRENCY_DECREASE", 0.7))
+OLLAMA_CONCURRENCY_DECREASE_INTERVAL = float(
+    os.environ.get("OLLAMA_CONCURRENCY_DECREASE_INTERVAL", 5)
+)
+OLLAMA_CONCURRENCY_LATENCY_TARGET = (
+    float(os.environ["OLLAMA_CONCURRENCY_LATENCY_TARGET"])
+    if "OLLAMA_CONCURRENCY_LATENCY_TARGET" in os.environ
+    else None
+)
+OLLAMA_CONCURRENCY_MAX_WAIT = float(os.environ.get("OLLAMA_CONCURRENCY_MAX_WAIT", 60))
+OLLAMA_CONCURRENCY_RETRY_DELAY = float(
+    os.environ.get("OLLAMA_CONCURRENCY_RETRY_DELAY", 0.5)
+)
+
 WEBHOOK_METHOD = os.environ.get("WEBHOOK_METHOD", "POST")
 WEBHOOK_URL = os.environ["WEBHOOK_URL"]
 WEBHOOK_TIMEOUT = float(int(os.environ.get("WEBHOOK_TIMEOUT", 5)))
+
+# Webhooks are sent by their own Celery tasks, so a slow webhook doesn't hold up
+# Ollama jobs. Point WEBHOOK_QUEUE at a queue with its own workers (see
+# CELERY_WORKER_QUEUES in bin/worker) to keep them apart entirely. Failed deliveries
+# are retried with exponential backoff and jitter, and given up on after
+# WEBHOOK_MAX_ATTEMPTS attempts until `manage.py replay_webhook_deliveries`.
+# Deliveries still pending WEBHOOK_REQUEUE_AFTER seconds after they were due (say
+# because their worker died) are queued again.
+WEBHOOK_QUEUE = os.environ.get("WEBHOOK_QUEUE", CELERY_TASK_DEFAULT_QUEUE)
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", 8))
+WEBHOOK_RETRY_BASE_DELAY = float(os.environ.get("WEBHOOK_RETRY_BASE_DELAY", 2))
+WEBHOOK_RETRY_MAX_DELAY = float(os.environ.get("WEBHOOK_RETRY_MAX_DELAY", 600))
+WEBHOOK_REQUEUE_AFTER = int(os.environ.get("WEBHOOK_REQUEUE_AFTER", 5 * 60))
+
+CELERY_BEAT_SCHEDULE["requeue-stale-deliveries"] = {
+    "task": "ollama_webhooks.tasks.call_command",
+    "args": ["requeue_stale_deliveries"],
+    "schedule": 60,
+}
+
+# High-volume webhooks can be sent many deliveries per request instead, by setting
+# WEBHOOK_BATCH_MAX_SIZE above 1. Batches are a JSON array (or NDJSON, with
+# WEBHOOK_BATCH_FORMAT="ndjson") of {"delivery", "job", "part", "content"} objects,
+# with each content base64-encoded, as responses needn't be UTF-8. They're sent
+# after waiting up to WEBHOOK_BATCH_LINGER seconds for more deliveries, with up to
+# WEBHOOK_BATCH_MAX_BYTES of content. The webhook can respond with
+# {"acknowledged": [<delivery>, ...]} to have the rest retried.
+WEBHOOK_BATCH_MAX_SIZE = int(os.environ.get("WEBHOOK_BATCH_MAX_SIZE", 1))
+WEBHOOK_BATCH_MAX_BYTES = int(os.environ.get("WEBHOOK_BATCH_MAX_BYTES", 1024 * 1024))
+WEBHOOK_BATCH_LINGER = float(os.environ.get("WEBHOOK_BATCH_LINGER", 1))
+WEBHOOK_BATCH_FORMAT = os.environ.get("WEBHOOK_BATCH_FORMAT", "json")
+
+# Jobs can ask for their response to be sent to another webhook with the
+# WEBHOOK_URL_HEADER header, if its host matches one of WEBHOOK_ALLOWED_HOSTS (e.g.
+# WEBHOOK_ALLOWED_HOSTS="hooks.example.com *.tenants.example.com"). Deliveries to
+# each host can be limited to WEBHOOK_HOST_MAX_IN_FLIGHT at once and
+# WEBHOOK_HOST_RATE_LIMIT per second (0 for no limit), waiting
+# WEBHOOK_HOST_RETRY_DELAY seconds while a host is at its limit.
+WEBHOOK_URL_HEADER = os.environ.get("WEBHOOK_URL_HEADER", "X-Webhook-Url")
+WEBHOOK_ALLOWED_HOSTS = os.environ.get("WEBHOOK_ALLOWED_HOSTS", "").split()
+WEBHOOK_HOST_MAX_IN_FLIGHT = int(os.environ.get("WEBHOOK_HOST_MAX_IN_FLIGHT", 0))
+WEBHOOK_HOST_RATE_LIMIT = int(os.environ.get("WEBHOOK_HOST_RATE_LIMIT", 0))
+WEBHOOK_HOST_RETRY_DELAY = float(os.environ.get("WEBHOOK_HOST_RETRY_DELAY", 1))
+
+# Pooled HTTP sessions used to talk to Ollama and the webhook.
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+HTTP_POOL_IDLE_TIMEOUT = float(os.environ.get("HTTP_POOL_IDLE_TIMEOUT", 60))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+HTTP_RETRY_BACKOFF_FACTOR = float(os.environ.get("HTTP_RETRY_BACKOFF_FACTOR", 0.1))
+
+# Responses larger than this are spooled to disk rather than held in memory.
+OLLAMA_RESPONSE_SPOOL_SIZE = int(
+    os.environ.get("OLLAMA_RESPONSE_SPOOL_SIZE", 1024 * 1024)
+)
+
+# Forward streamed (NDJSON) Ollama responses to the webhook as they arrive.
+WEBHOOK_STREAM = bool(os.environ.get("WEBHOOK_STREAM"))
+WEBHOOK_STREAM_BATCH_LINES = int(os.environ.get("WEBHOOK_STREAM_BATCH_LINES", 16))
+WEBHOOK_STREAM_BATCH_INTERVAL = float(
+    os.environ.get("WEBHOOK_STREAM_BATCH_INTERVAL", 1)
+)
+
+
+# Pending /api/embed jobs for the same model are sent to Ollama together, in batches
+# of up to this many jobs, after waiting this many seconds for more to arrive.
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", 32))
+EMBED_BATCH_WINDOW = float(os.environ.get("EMBED_BATCH_WINDOW", 0))
+
+
+# Scheduling
+# Clients are identified by a header (or their API key) and can ask for a priority
+# from 0 to 9 with another. With scheduling enabled, clients' priorities are lowered
+# as their backlog grows, and each client can have at most
+# SCHEDULER_MAX_IN_FLIGHT jobs running at once. Jobs beyond that are parked outside
+# the broker, and queued again as the client's running jobs finish. Scheduling only
+# applies to jobs run by Celery.
+
+SCHEDULER_ENABLED = bool(os.environ.get("SCHEDULER_ENABLED"))
+SCHEDULER_CLIENT_HEADER = os.environ.get("SCHEDULER_CLIENT_HEADER", "X-Client-Id")
+SCHEDULER_PRIORITY_HEADER = os.environ.get("SCHEDULER_PRIORITY_HEADER", "X-Priority")
+SCHEDULER_DEFAULT_PRIORITY = int(os.environ.get("SCHEDULER_DEFAULT_PRIORITY", 5))
+SCHEDULER_MAX_IN_FLIGHT = int(os.environ.get("SCHEDULER_MAX_IN_FLIGHT", 4))
+# Weights are given like SCHEDULER_CLIENT_WEIGHTS="interactive-app=10 backfill=1".
+SCHEDULER_CLIENT_WEIGHTS = {
+    client: float(weight)
+    for client, weight in (
+        item.split("=", 1)
+        for item in os.environ.get("SCHEDULER_CLIENT_WEIGHTS", "").split()
+    )
+}
+
+if SCHEDULER_ENABLED:
+    CELERY_BEAT_SCHEDULE["recount-scheduler"] = {
+        "task": "ollama_webhooks.tasks.recount_scheduler",
+        "schedule": 60,
+    }
+
+
+# Admission control
+# Given REDIS_URL, jobs for a model are refused with 503 Service Unavailable once it
+# has more than ADMISSION_MAX_BACKLOG jobs queued or running, and jobs with a
+# priority below ADMISSION_SHED_PRIORITY are refused with 429 Too Many Requests
+# once it has more than ADMISSION_SHED_BACKLOG. Both ask clients to retry after
+# ADMISSION_RETRY_AFTER seconds.
+
+ADMISSION_MAX_BACKLOG = (
+    int(os.environ["ADMISSION_MAX_BACKLOG"])
+    if "ADMISSION_MAX_BACKLOG" in os.environ
+    else None
+)
+ADMISSION_SHED_BACKLOG = (
+    int(os.environ["ADMISSION_SHED_BACKLOG"])
+    if "ADMISSION_SHED_BACKLOG" in os.environ
+    else None
+)
+ADMISSION_SHED_PRIORITY = int(
+    os.environ.get("ADMISSION_SHED_PRIORITY", SCHEDULER_DEFAULT_PRIORITY)
+)
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 30))
+
+if ADMISSION_MAX_BACKLOG is not None or ADMISSION_SHED_BACKLOG is not None:
+    CELERY_BEAT_SCHEDULE["recount-admission"] = {
+        "task": "ollama_webhooks.tasks.recount_admission",
+        "schedule": 60,
+    }
+
+
+# Job runner
+# Either "celery" to run each job in a Celery task, or "async" to leave jobs for
+# `manage.py run_async_worker` to claim.
+
+JOB_RUNNER = os.environ.get("JOB_RUNNER", "celery")
+JOB_BATCH_MAX_SIZE = int(os.environ.get("JOB_BATCH_MAX_SIZE", 1000))
+ASYNC_WORKER_MAX_IN_FLIGHT = int(os.environ.get("ASYNC_WORKER_MAX_IN_FLIGHT", 4))
+ASYNC_WORKER_POLL_INTERVAL = float(os.environ.get("ASYNC_WORKER_POLL_INTERVAL", 1))
+
+# Jobs run by Celery are queued through an outbox: each job is saved along with an
+# outbox entry, and `manage.py relay_outbox` (bin/outbox-relay) publishes entries
+# in batches. The relay is woken by Postgres notifications, and checks every
+# OUTBOX_RELAY_POLL_INTERVAL seconds anyway. Jobs which still haven't started
+# OUTBOX_REQUEUE_AFTER seconds after later jobs for their model started are queued
+# again, as their tasks must have been lost.
+OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get("OUTBOX_RELAY_BATCH_SIZE", 500))
+OUTBOX_RELAY_POLL_INTERVAL = float(os.environ.get("OUTBOX_RELAY_POLL_INTERVAL", 5))
+OUTBOX_REQUEUE_AFTER = int(os.environ.get("OUTBOX_REQUEUE_AFTER", 60 * 60))
+
+if JOB_RUNNER == "celery":
+    CELERY_BEAT_SCHEDULE["requeue-stale-jobs"] = {
+        "task": "ollama_webhooks.tasks.call_command",
+        "args": ["requeue_stale_jobs"],
+        "schedule": 5 * 60,
+    }
+
+# Claimed jobs are leased to their worker for JOB_LEASE_SECONDS, which should be
+# longer than any job can run for. Celery beat queues jobs whose leases have expired
+# (because their workers died or hung) again, until they've been run
+# JOB_MAX_ATTEMPTS times, and fails them after that. The asyncio worker gives up on
+# jobs shortly before their leases expire, as it has no task time limit.
+JOB_LEASE_SECONDS = int(
+    os.environ.get("JOB_LEASE_SECONDS", CELERY_TASK_TIME_LIMIT + 60)
+)
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+
+CELERY_BEAT_SCHEDULE["sweep-expired-leases"] = {
+    "task": "ollama_webhooks.tasks.call_command",
+    "args": ["sweep_expired_leases"],
+    "schedule": 60,
+}
+
+# Seconds to cache a job's status for, for clients polling jobs/<id>/. The cached
+# status is dropped whenever the job changes, but with the local memory cache (i.e.
+# without REDIS_URL) only in the process which changed it.
+JOB_STATUS_CACHE_TTL = int(os.environ.get("JOB_STATUS_CACHE_TTL", 5))
+
+# Clients can wait up to JOB_WAIT_MAX_TIMEOUT seconds at jobs/<id>/wait/ for a job
+# to complete. Workers announce completed jobs over Redis pub/sub (given REDIS_URL),
+# and waiting clients recheck their jobs every JOB_WAIT_RECHECK_INTERVAL seconds
+# anyway. Serve with ASGI (ollama_webhooks.asgi) so waiting clients don't each tie
+# up a worker.
+JOB_WAIT_DEFAULT_TIMEOUT = float(os.environ.get("JOB_WAIT_DEFAULT_TIMEOUT", 30))
+JOB_WAIT_MAX_TIMEOUT = float(os.environ.get("JOB_WAIT_MAX_TIMEOUT", 300))
+JOB_WAIT_RECHECK_INTERVAL = float(os.environ.get("JOB_WAIT_RECHECK_INTERVAL", 5))
+
+# Job partitioning
+# Jobs can be range partitioned by created timestamp, a "day" or "week" per
+# partition, so jobs older than JOB_RETENTION_DAYS are dropped a partition at a
+# time. Run `manage.py partition_jobs --convert` once to partition the table; Celery
+# beat then creates and drops partitions hourly.
+
+JOB_PARTITION_INTERVAL = os.environ.get("JOB_PARTITION_INTERVAL")
+JOB_PARTITIONS_AHEAD = int(os.environ.get("JOB_PARTITIONS_AHEAD", 3))
+JOB_RETENTION_DAYS = (
+    int(os.environ["JOB_RETENTION_DAYS"])
+    if "JOB_RETENTION_DAYS" in os.environ
+    else None
+)
+
+if JOB_PARTITION_INTERVAL:
+    CELERY_BEAT_SCHEDULE["partition-jobs"] = {
+        "task": "ollama_webhooks.tasks.call_command",
+        "args": ["partition_jobs"],
+        "schedule": 60 * 60,
+    }
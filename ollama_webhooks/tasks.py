@@ -1,21 +1,51 @@
 """Tasks."""
 
+import base64
+import datetime
+import fnmatch
+import io
+import json
 import logging
+import random
+import tempfile
+import time
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
 from typing import Any
-from urllib.parse import urlsplit, urlunsplit
 from uuid import UUID
 
 from django.conf import settings
 from django.core import management
+from django.core.cache import caches
 from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Now
 from django.utils import timezone
 
 import requests
+from celery import group
 
-from ollama_webhooks import celery, models
+from ollama_webhooks import (
+    admission,
+    bodies,
+    celery,
+    concurrency,
+    embeddings,
+    factories,
+    jobs,
+    metrics,
+    models,
+    response_cache,
+    routing,
+    scheduling,
+    webhooks,
+)
 
 logger = logging.getLogger(__name__)
 
+WEBHOOK_BATCH_QUEUED_KEY = "webhook-batch-queued"
+
 
 @celery.app.task(ignore_result=True)
 def call_command(*args: Any, **kwargs: Any) -> None:
@@ -24,48 +54,829 @@ def call_command(*args: Any, **kwargs: Any) -> None:
     management.call_command(*args, **kwargs)
 
 
-@celery.app.task
-def run_job(pk: UUID) -> None:
-    """Run a job."""
-    with transaction.atomic():
-        job = models.Job.objects.select_for_update().get(pk=pk)
-        job.request_sent_timestamp = timezone.now()
-        job.save()
-
-    ollama_url = urlsplit(settings.OLLAMA_URL)
-    ollama_response = requests.request(
-        job.request_method,
-        urlunsplit((
-            ollama_url.scheme,
-            ollama_url.netloc,
-            job.request_path,
-            job.request_query,
-            ollama_url.fragment,
-        )),
-        data=job.request_body,
-        headers=job.request_headers,
-        timeout=settings.OLLAMA_TIMEOUT,
+def queue_webhook(
+    job: models.Job, content: bytes = b"", part: int | None = None
+) -> None:
+    """Record a webhook delivery for a job, and queue it to be sent.
+
+    Without content, the job's response content is sent, and the job is delivering
+    until that's delivered. A job's deliveries are sent in the order they're
+    recorded, so parts of a streamed response come before the whole of it.
+    """
+    delivery = models.WebhookDelivery.objects.create(
+        job=job, url=job.webhook_url, content=content, part=part
     )
-    try:
-        ollama_response.raise_for_status()
-    except requests.HTTPError as exc:
-        exc.add_note("Response content: " + str(ollama_response.content))
+    if part is None:
+        jobs.set_status([job.pk], models.Job.Status.DELIVERING)
+    queue_deliveries([delivery.pk])
 
-    with transaction.atomic():
-        job = models.Job.objects.select_for_update().get(pk=pk)
-        job.response_received_timestamp = timezone.now()
-        job.response_content = ollama_response.content
-        job.response_headers = dict(ollama_response.headers)
-        job.save()
-
-    webhook_response = requests.request(
-        settings.WEBHOOK_METHOD,
-        settings.WEBHOOK_URL,
-        params={"job": str(job.pk)},
-        data=job.response_content,
-        timeout=settings.WEBHOOK_TIMEOUT,
+
+def queue_deliveries(pks: Sequence[int]) -> None:
+    """Queue webhook deliveries to be sent.
+
+    If WEBHOOK_BATCH_MAX_SIZE is more than one, a single task sends every pending
+    delivery in batches, after waiting WEBHOOK_BATCH_LINGER seconds for more.
+    """
+    if settings.WEBHOOK_BATCH_MAX_SIZE <= 1:
+        for pk in pks:
+            deliver_webhook.apply_async((pk,), queue=settings.WEBHOOK_QUEUE)
+        return
+
+    # Only queue the batch task if it isn't queued already. It forgets it was
+    # queued as soon as it starts; this only expires in case it's lost.
+    if caches["default"].add(
+        WEBHOOK_BATCH_QUEUED_KEY, value=True, timeout=settings.WEBHOOK_BATCH_LINGER + 60
+    ):
+        deliver_webhook_batches.apply_async(
+            countdown=settings.WEBHOOK_BATCH_LINGER, queue=settings.WEBHOOK_QUEUE
+        )
+
+
+def earlier_delivery_pending() -> Exists:
+    """Whether a delivery's job has an earlier delivery which is still pending.
+
+    Deliveries wait for those, so they arrive in order.
+    """
+    return Exists(
+        models.WebhookDelivery.objects.filter(
+            job_id=OuterRef("job_id"),
+            pk__lt=OuterRef("pk"),
+            status=models.WebhookDelivery.Status.PENDING,
+        )
     )
+
+
+def requeue_stale_deliveries(limit: int) -> int:
+    """Queue up to limit deliveries which are still pending long after they were due.
+
+    Deliveries are queued again once WEBHOOK_REQUEUE_AFTER seconds have passed since
+    they were due, in case their tasks were lost or their workers died while sending
+    them. Returns how many deliveries.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.WEBHOOK_REQUEUE_AFTER)
+    pks = list(
+        models.WebhookDelivery.objects.filter(
+            Q(next_attempt_timestamp__isnull=True, created_timestamp__lt=cutoff)
+            | Q(next_attempt_timestamp__lt=cutoff),
+            ~earlier_delivery_pending(),
+            status=models.WebhookDelivery.Status.PENDING,
+        )
+        .order_by("pk")
+        .values_list("pk", flat=True)[:limit]
+    )
+    if pks:
+        logger.warning("Requeuing %s webhook deliveries which are overdue", len(pks))
+        queue_deliveries(pks)
+    return len(pks)
+
+
+def claim_delivery(pk: int) -> bool:
+    """Claim a due delivery, so any other task sending it skips it.
+
+    Deliveries can't be claimed while an earlier delivery for their job is pending.
+    Like batches, claimed deliveries aren't due again until WEBHOOK_TIMEOUT has
+    passed twice over.
+    """
+    now = timezone.now()
+    return bool(
+        models.WebhookDelivery.objects.filter(
+            Q(next_attempt_timestamp__isnull=True) | Q(next_attempt_timestamp__lte=now),
+            ~earlier_delivery_pending(),
+            pk=pk,
+            status=models.WebhookDelivery.Status.PENDING,
+        ).update(
+            next_attempt_timestamp=now
+            + datetime.timedelta(seconds=settings.WEBHOOK_TIMEOUT * 2)
+        )
+    )
+
+
+def delivery_content(delivery: models.WebhookDelivery) -> bytes:
+    """Get the content to send for a delivery."""
+    if delivery.content or delivery.part is not None:
+        return bytes(delivery.content)
+    return bodies.read(delivery.job, "response_content")
+
+
+def request_webhook(webhook_url: str, **kwargs: Any) -> requests.Response:
+    """Send a request to a webhook, timing how long it takes."""
+    sent = time.monotonic()
+    outcome = "error"
+    try:
+        webhook_response = factories.session("webhook").request(
+            settings.WEBHOOK_METHOD,
+            webhooks.url(webhook_url),
+            timeout=settings.WEBHOOK_TIMEOUT,
+            **kwargs,
+        )
+        if webhook_response.ok:
+            outcome = "success"
+        return webhook_response
+    finally:
+        metrics.WEBHOOK_SECONDS.labels(outcome).observe(time.monotonic() - sent)
+
+
+def send_webhook(delivery: models.WebhookDelivery) -> requests.Response:
+    """Send a delivery to the webhook."""
+    params = {"job": str(delivery.job_id)}
+    if delivery.part is not None:
+        params["part"] = str(delivery.part)
+
+    with (
+        io.BytesIO(bytes(delivery.content))
+        if delivery.content or delivery.part is not None
+        else bodies.open_body(delivery.job, "response_content")
+    ) as data:
+        webhook_response = request_webhook(delivery.url, params=params, data=data)
     try:
         webhook_response.raise_for_status()
     except requests.HTTPError as exc:
         exc.add_note("Response content: " + str(webhook_response.content))
+        raise
+    return webhook_response
+
+
+def webhook_retry_delay(attempts: int) -> float:
+    """Get how many seconds to wait before retrying a delivery.
+
+    Delays grow exponentially with the number of attempts so far, up to
+    WEBHOOK_RETRY_MAX_DELAY, with "full jitter" so that retries after an outage are
+    spread out rather than all arriving at once.
+    """
+    ceiling = min(
+        settings.WEBHOOK_RETRY_MAX_DELAY,
+        settings.WEBHOOK_RETRY_BASE_DELAY * 2 ** (attempts - 1),
+    )
+    return random.uniform(0, ceiling)  # noqa: S311
+
+
+def delivery_failed(
+    delivery: models.WebhookDelivery, error: str, status_code: int | None
+) -> float | None:
+    """Record a failed delivery attempt, without saving it.
+
+    Returns how many seconds to wait before retrying, or None if the delivery has
+    been given up on after WEBHOOK_MAX_ATTEMPTS attempts.
+    """
+    delivery.last_status_code = status_code
+    delivery.last_error = error
+    if delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+        logger.error(
+            "Giving up on webhook delivery %s after %s attempts: %s",
+            delivery.pk,
+            delivery.attempts,
+            error,
+        )
+        delivery.status = models.WebhookDelivery.Status.DEAD
+        delivery.next_attempt_timestamp = None
+        metrics.WEBHOOK_DELIVERIES.labels("dead").inc()
+        return None
+
+    delay = webhook_retry_delay(delivery.attempts)
+    logger.warning(
+        "Webhook delivery %s failed, retrying in %.1f seconds: %s",
+        delivery.pk,
+        delay,
+        error,
+    )
+    delivery.next_attempt_timestamp = timezone.now() + datetime.timedelta(seconds=delay)
+    metrics.WEBHOOK_DELIVERIES.labels("retrying").inc()
+    return delay
+
+
+def delivery_succeeded(delivery: models.WebhookDelivery, status_code: int) -> None:
+    """Record a successful delivery, without saving it."""
+    delivery.status = models.WebhookDelivery.Status.DELIVERED
+    delivery.delivered_timestamp = timezone.now()
+    delivery.next_attempt_timestamp = None
+    delivery.last_status_code = status_code
+    delivery.last_error = ""
+    metrics.WEBHOOK_DELIVERIES.labels("delivered").inc()
+
+
+def deliveries_finished(deliveries: Sequence[models.WebhookDelivery]) -> None:
+    """Move jobs on once their response content has been delivered or given up on.
+
+    Any deliveries for the same jobs which were waiting for these are queued.
+    """
+    for delivery_status, job_status in (
+        (models.WebhookDelivery.Status.DELIVERED, models.Job.Status.DELIVERED),
+        (models.WebhookDelivery.Status.DEAD, models.Job.Status.UNDELIVERABLE),
+    ):
+        if job_pks := [
+            delivery.job_id
+            for delivery in deliveries
+            if delivery.part is None and delivery.status == delivery_status
+        ]:
+            jobs.set_status(job_pks, job_status)
+
+    if pks := list(
+        models.WebhookDelivery.objects.filter(
+            ~earlier_delivery_pending(),
+            job_id__in={delivery.job_id for delivery in deliveries},
+            status=models.WebhookDelivery.Status.PENDING,
+        ).values_list("pk", flat=True)
+    ):
+        queue_deliveries(pks)
+
+
+@celery.app.task(ignore_result=True)
+def deliver_webhook(pk: int) -> None:
+    """Send a pending webhook delivery, retrying later if it fails."""
+    delivery = models.WebhookDelivery.objects.filter(
+        pk=pk, status=models.WebhookDelivery.Status.PENDING
+    ).first()
+    if delivery is None:
+        logger.info("Webhook delivery %s isn't pending, skipping", pk)
+        return
+
+    webhook_host = webhooks.host(delivery.url)
+    token = webhooks.acquire(webhook_host)
+    if token is None:
+        deliver_webhook.apply_async(
+            (pk,),
+            countdown=settings.WEBHOOK_HOST_RETRY_DELAY,
+            queue=settings.WEBHOOK_QUEUE,
+        )
+        return
+
+    if not claim_delivery(pk):
+        webhooks.release(webhook_host, token)
+        logger.info(
+            "Webhook delivery %s isn't due, is being sent or is waiting for an "
+            "earlier delivery, skipping",
+            pk,
+        )
+        return
+
+    delivery.attempts += 1
+    try:
+        webhook_response = send_webhook(delivery)
+    except requests.RequestException as exc:
+        delay = delivery_failed(
+            delivery,
+            str(exc),
+            exc.response.status_code if exc.response is not None else None,
+        )
+        delivery.save()
+        if delay is not None:
+            deliver_webhook.apply_async(
+                (pk,), countdown=delay, queue=settings.WEBHOOK_QUEUE
+            )
+        else:
+            deliveries_finished([delivery])
+        return
+    finally:
+        webhooks.release(webhook_host, token)
+
+    delivery_succeeded(delivery, webhook_response.status_code)
+    delivery.save()
+    deliveries_finished([delivery])
+
+
+def claim_webhook_batch() -> list[tuple[models.WebhookDelivery, bytes]]:
+    """Claim a batch of due deliveries to the same URL, along with their content.
+
+    Only the earliest pending delivery for each job can be claimed, so a job's
+    deliveries are sent in order, one batch after another. Batches have at most
+    WEBHOOK_BATCH_MAX_SIZE deliveries and (unless a single delivery is larger)
+    WEBHOOK_BATCH_MAX_BYTES of content. Claimed deliveries aren't due again until
+    WEBHOOK_TIMEOUT has passed twice over, so other tasks leave them alone while
+    they're sent.
+    """
+    now = timezone.now()
+    due = models.WebhookDelivery.objects.filter(
+        Q(next_attempt_timestamp__isnull=True) | Q(next_attempt_timestamp__lte=now),
+        ~earlier_delivery_pending(),
+        status=models.WebhookDelivery.Status.PENDING,
+    ).order_by("pk")
+    webhook_url = due.values_list("url", flat=True).first()
+    if webhook_url is None:
+        return []
+
+    with transaction.atomic():
+        batch_due = (
+            due.filter(url=webhook_url)
+            .select_for_update(skip_locked=True, of=("self",))
+            .select_related("job")[: settings.WEBHOOK_BATCH_MAX_SIZE]
+        )
+        batch: list[tuple[models.WebhookDelivery, bytes]] = []
+        size = 0
+        for delivery in batch_due:
+            content = delivery_content(delivery)
+            if batch and size + len(content) > settings.WEBHOOK_BATCH_MAX_BYTES:
+                break
+            batch.append((delivery, content))
+            size += len(content)
+
+        models.WebhookDelivery.objects.filter(
+            pk__in=[delivery.pk for delivery, _ in batch]
+        ).update(
+            next_attempt_timestamp=now
+            + datetime.timedelta(seconds=settings.WEBHOOK_TIMEOUT * 2)
+        )
+    return batch
+
+
+def webhook_batch_payload(
+    batch: Sequence[tuple[models.WebhookDelivery, bytes]],
+) -> tuple[bytes, str]:
+    """Get the body and content type to send a batch of deliveries with.
+
+    Contents are base64-encoded, so they arrive intact whatever their encoding.
+    """
+    items = [
+        {
+            "delivery": delivery.pk,
+            "job": str(delivery.job_id),
+            "part": delivery.part,
+            "content": base64.b64encode(content).decode(),
+        }
+        for delivery, content in batch
+    ]
+    if settings.WEBHOOK_BATCH_FORMAT == "ndjson":
+        lines = (json.dumps(item).encode() + b"\n" for item in items)
+        return b"".join(lines), jobs.NDJSON_CONTENT_TYPE
+    return json.dumps(items).encode(), "application/json"
+
+
+def acknowledged_deliveries(webhook_response: requests.Response) -> set[int] | None:
+    """Get which deliveries the webhook acknowledged, if it said.
+
+    The webhook can respond with {"acknowledged": [<delivery>, ...]}; otherwise,
+    any successful response acknowledges the whole batch.
+    """
+    try:
+        acknowledged = webhook_response.json()["acknowledged"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not isinstance(acknowledged, list):
+        return None
+    return {pk for pk in acknowledged if isinstance(pk, int)}
+
+
+def send_webhook_batch(batch: Sequence[tuple[models.WebhookDelivery, bytes]]) -> None:
+    """Send a batch of deliveries to the webhook, and record how each went."""
+    deliveries = [delivery for delivery, _ in batch]
+    for delivery in deliveries:
+        delivery.attempts += 1
+
+    data, content_type = webhook_batch_payload(batch)
+    delays = []
+    try:
+        webhook_response = request_webhook(
+            deliveries[0].url, data=data, headers={"Content-Type": content_type}
+        )
+        webhook_response.raise_for_status()
+    except requests.RequestException as exc:
+        status_code = exc.response.status_code if exc.response is not None else None
+        delays = [delivery_failed(d, str(exc), status_code) for d in deliveries]
+    else:
+        acknowledged = acknowledged_deliveries(webhook_response)
+        for delivery in deliveries:
+            if acknowledged is None or delivery.pk in acknowledged:
+                delivery_succeeded(delivery, webhook_response.status_code)
+            else:
+                delays.append(
+                    delivery_failed(
+                        delivery,
+                        "Not acknowledged by the webhook.",
+                        webhook_response.status_code,
+                    )
+                )
+
+    models.WebhookDelivery.objects.bulk_update(
+        deliveries,
+        [
+            "status",
+            "attempts",
+            "next_attempt_timestamp",
+            "delivered_timestamp",
+            "last_status_code",
+            "last_error",
+        ],
+    )
+    deliveries_finished(deliveries)
+    if retry_delays := [delay for delay in delays if delay is not None]:
+        deliver_webhook_batches.apply_async(
+            countdown=min(retry_delays), queue=settings.WEBHOOK_QUEUE
+        )
+
+
+@celery.app.task(ignore_result=True)
+def deliver_webhook_batches() -> None:
+    """Send due webhook deliveries in batches, until there are none left.
+
+    Batches for hosts without room for them are put off, and another task is queued
+    once to send them after WEBHOOK_HOST_RETRY_DELAY seconds.
+    """
+    # Deliveries recorded from now on need another batch task.
+    caches["default"].delete(WEBHOOK_BATCH_QUEUED_KEY)
+    busy_hosts = set()
+    while batch := claim_webhook_batch():
+        webhook_host = webhooks.host(batch[0][0].url)
+        token = None if webhook_host in busy_hosts else webhooks.acquire(webhook_host)
+        if token is None:
+            # Leave the batch claimed until the host has room for it.
+            models.WebhookDelivery.objects.filter(
+                pk__in=[delivery.pk for delivery, _ in batch]
+            ).update(
+                next_attempt_timestamp=timezone.now()
+                + datetime.timedelta(seconds=settings.WEBHOOK_HOST_RETRY_DELAY)
+            )
+            busy_hosts.add(webhook_host)
+            continue
+
+        logger.info("Sending %s webhook deliveries in one request", len(batch))
+        try:
+            send_webhook_batch(batch)
+        finally:
+            webhooks.release(webhook_host, token)
+
+    if busy_hosts:
+        deliver_webhook_batches.apply_async(
+            countdown=settings.WEBHOOK_HOST_RETRY_DELAY, queue=settings.WEBHOOK_QUEUE
+        )
+
+
+@celery.app.task
+def run_job(pk: UUID, client: str = "") -> None:
+    """Run a job.
+
+    If the job's client already has as many jobs in flight as it's allowed, the job
+    is parked until one of them finishes. If every Ollama backend is at its
+    concurrency limit, the job is put back in the queue, and its client's slot given
+    up, while waiting for room. It's tried again every
+    OLLAMA_CONCURRENCY_RETRY_DELAY seconds, and queued again if there's still no
+    room after OLLAMA_CONCURRENCY_MAX_WAIT seconds.
+    """
+    deadline = time.monotonic() + settings.OLLAMA_CONCURRENCY_MAX_WAIT
+    while not _run_job(pk, client):
+        if time.monotonic() >= deadline:
+            if requeued := list(
+                models.Job.objects.filter(pk=pk, status=models.Job.Status.QUEUED).only(
+                    "id", "model", "client", "priority"
+                )
+            ):
+                logger.warning(
+                    "Every Ollama backend is still at its concurrency limit, "
+                    "queuing job %s again",
+                    pk,
+                )
+                enqueue_jobs(requeued, requeued=True)
+            return
+        time.sleep(settings.OLLAMA_CONCURRENCY_RETRY_DELAY)
+
+
+def _run_job(pk: UUID, client: str) -> bool:
+    """Claim and run a job, unless it's already been claimed.
+
+    Returns False if every Ollama backend was at its concurrency limit, in which
+    case the job's been put back in the queue.
+    """
+    token = scheduling.acquire(client)
+    if token is None:
+        if parked := (
+            models.Job.objects.filter(pk=pk, status=models.Job.Status.QUEUED)
+            .only("id", "client", "priority", "created_timestamp")
+            .first()
+        ):
+            logger.info("Client %r is at its cap, parking job %s", client, pk)
+            park_jobs([parked])
+        return True
+
+    try:
+        job = jobs.claim(pk)
+        if job is None:
+            logger.info("Job %s has already been claimed, skipping", pk)
+            return True
+
+        try:
+            if settings.EMBED_BATCH_MAX_SIZE > 1 and embeddings.batch_key(job):
+                run_embed_batch(job)
+            else:
+                execute(job)
+        except concurrency.SaturatedError:
+            jobs.unclaim([job])
+            return False
+        except Exception:
+            jobs.fail(job)
+            raise
+        return True
+    finally:
+        scheduling.release(client, token)
+        unpark_jobs(client)
+
+
+def park_jobs(queued_jobs: Sequence[models.Job]) -> None:
+    """Park queued jobs whose clients are at their caps, instead of queuing them.
+
+    In case one of a client's jobs finished meanwhile, any it now has room for are
+    queued again straight away.
+    """
+    for job in queued_jobs:
+        scheduling.park(job)
+    for client in {job.client for job in queued_jobs}:
+        unpark_jobs(client)
+
+
+def unpark_jobs(client: str) -> None:
+    """Queue as many of a client's parked jobs again as it has room for in flight."""
+    # Parked jobs may have been claimed along with others since.
+    if (pks := scheduling.unpark(client)) and (
+        unparked := list(
+            models.Job.objects.filter(pk__in=pks, status=models.Job.Status.QUEUED).only(
+                "id", "model", "client", "priority"
+            )
+        )
+    ):
+        enqueue_jobs(unparked, requeued=True)
+
+
+@contextmanager
+def ollama_request(
+    job: models.Job, data: bytes | None = None, *, stream: bool = False
+) -> Iterator[tuple[str, requests.Response]]:
+    """Send a job's request to the best Ollama backend for its model.
+
+    Gives the backend which responded along with its response.
+
+    If a backend can't be connected to, it's ejected and the next best is tried.
+    Backends at their concurrency limits are skipped, and if they all are,
+    concurrency.SaturatedError is raised.
+    """
+    error: requests.ConnectionError | None = None
+    for backend, token in concurrency.acquired(routing.candidates(job.model)):
+        routing_token = routing.acquire(backend)
+        try:
+            sent = time.monotonic()
+            try:
+                with (
+                    bodies.open_body(job, "request_body")
+                    if data is None
+                    else io.BytesIO(data)
+                ) as body:
+                    response = factories.session("ollama").request(
+                        job.request_method,
+                        jobs.ollama_url(job, backend),
+                        data=body,
+                        headers=job.request_headers,
+                        timeout=settings.OLLAMA_TIMEOUT,
+                        stream=stream,
+                    )
+            except requests.ConnectionError as exc:
+                routing.eject(backend)
+                error = exc
+                continue
+            except requests.Timeout:
+                concurrency.record(backend, None, None)
+                raise
+
+            concurrency.record(backend, time.monotonic() - sent, response.status_code)
+            with response:
+                yield backend, response
+            return
+        finally:
+            concurrency.release(backend, token)
+            routing.release(backend, routing_token)
+
+    if error:
+        raise error
+
+
+def run_embed_batch(job: models.Job) -> None:
+    """Run an embedding job along with other pending embedding jobs for its model.
+
+    Other jobs are claimed here, so their own tasks will skip them. They each take
+    one of their client's in-flight slots, and are parked if their client has none
+    left. If every Ollama backend is at its concurrency limit, they're all
+    queued again; if anything else goes wrong, they're all failed.
+    """
+    time.sleep(settings.EMBED_BATCH_WINDOW)
+    claimed = []
+    tokens = []
+    capped = []
+    for claimed_job in jobs.claim_pending(
+        settings.EMBED_BATCH_MAX_SIZE - 1,
+        request_path=embeddings.EMBED_PATH,
+        model=job.model,
+    ):
+        if (token := scheduling.acquire(claimed_job.client)) is not None:
+            claimed.append(claimed_job)
+            tokens.append(token)
+        else:
+            capped.append(claimed_job)
+    if unclaimed := jobs.unclaim(capped):
+        park_jobs(unclaimed)
+
+    try:
+        _run_embed_batches([job, *claimed])
+    except concurrency.SaturatedError:
+        if unclaimed := jobs.unclaim(claimed):
+            enqueue_jobs(unclaimed, requeued=True)
+        raise
+    except Exception:
+        for claimed_job in claimed:
+            jobs.fail(claimed_job)
+        raise
+    finally:
+        for claimed_job, token in zip(claimed, tokens, strict=True):
+            scheduling.release(claimed_job.client, token)
+        for client in {claimed_job.client for claimed_job in claimed}:
+            unpark_jobs(client)
+
+
+def _run_embed_batches(claimed: Sequence[models.Job]) -> None:
+    batches: dict[str | None, list[models.Job]] = defaultdict(list)
+    for claimed_job in claimed:
+        batches[embeddings.batch_key(claimed_job)].append(claimed_job)
+
+    for key, batch in batches.items():
+        if key is None or len(batch) == 1:
+            for batch_job in batch:
+                execute(batch_job)
+            continue
+
+        request_keys = {
+            batch_job.pk: response_cache.request_key(batch_job) for batch_job in batch
+        }
+        if not (
+            batch := [
+                batch_job
+                for batch_job in batch
+                if not (request_key := request_keys[batch_job.pk])
+                or not respond_from_cache(batch_job, request_key)
+            ]
+        ):
+            continue
+
+        logger.info("Sending %s embedding jobs in one request", len(batch))
+        with ollama_request(batch[0], data=embeddings.combine(batch)) as (
+            backend,
+            ollama_response,
+        ):
+            try:
+                ollama_response.raise_for_status()
+            except requests.HTTPError as exc:
+                exc.add_note("Response content: " + str(ollama_response.content))
+                raise
+            contents = embeddings.split(batch, ollama_response.content)
+            headers = dict(ollama_response.headers)
+            headers.pop("Content-Length", None)
+
+        for batch_job, content in zip(batch, contents, strict=True):
+            if request_key := request_keys[batch_job.pk]:
+                response_cache.store(
+                    request_key, batch_job.model, backend, io.BytesIO(content), headers
+                )
+            if jobs.record_response(
+                batch_job,
+                content,
+                headers,
+                cache_hit=False if request_key else None,
+            ):
+                queue_webhook(batch_job)
+
+
+def respond_from_cache(job: models.Job, request_key: str) -> bool:
+    """Record a cached response to the same request as a job's response, if any.
+
+    Returns whether there was one.
+    """
+    cached = response_cache.lookup(
+        request_key, job.model, routing.candidates(job.model)
+    )
+    if cached is None:
+        return False
+
+    logger.info("Using cached response for job %s", job.pk)
+    content, headers = cached
+    if jobs.record_response(job, content, headers, cache_hit=True):
+        queue_webhook(job)
+    return True
+
+
+def execute(job: models.Job) -> None:
+    """Send a claimed job to Ollama and its response to the webhook.
+
+    If the response cache is enabled and has a response to an identical request, it's
+    used instead. If Ollama responds with an error, requests.HTTPError is raised, so
+    the job's failed rather than its error delivered as a response.
+    """
+    request_key = response_cache.request_key(job)
+    if request_key and respond_from_cache(job, request_key):
+        return
+
+    with (
+        ollama_request(job, stream=True) as (backend, ollama_response),
+        tempfile.SpooledTemporaryFile(
+            max_size=settings.OLLAMA_RESPONSE_SPOOL_SIZE
+        ) as response_content,
+    ):
+        try:
+            ollama_response.raise_for_status()
+        except requests.HTTPError as exc:
+            exc.add_note("Response content: " + str(ollama_response.content))
+            raise
+
+        chunks = ollama_response.iter_content(chunk_size=None)
+        if settings.WEBHOOK_STREAM and jobs.is_ndjson(ollama_response.headers):
+            batcher = jobs.NDJSONBatcher(
+                max_lines=settings.WEBHOOK_STREAM_BATCH_LINES,
+                max_interval=settings.WEBHOOK_STREAM_BATCH_INTERVAL,
+            )
+            for part, batch in enumerate(batcher.batches(chunks)):
+                response_content.write(batch)
+                queue_webhook(job, batch, part=part)
+        else:
+            for chunk in chunks:
+                response_content.write(chunk)
+
+        if request_key:
+            response_cache.store(
+                request_key,
+                job.model,
+                backend,
+                response_content,
+                ollama_response.headers,
+            )
+        recorded = jobs.record_response(
+            job,
+            response_content,
+            ollama_response.headers,
+            cache_hit=False if request_key else None,
+        )
+    if recorded:
+        queue_webhook(job)
+
+
+@celery.app.task(ignore_result=True)
+def poll_ollama_backends() -> None:
+    """Check the health of Ollama backends and which models they have loaded."""
+    routing.poll()
+
+
+@celery.app.task(ignore_result=True)
+def recount_admission() -> None:
+    """Correct any drift in the job counts admission control is based on."""
+    admission.recount()
+
+
+@celery.app.task(ignore_result=True)
+def recount_scheduler() -> None:
+    """Correct any drift in the queued job counts scheduling is based on.
+
+    Parked jobs are queued again if their clients have room for them, in case the
+    jobs they were waiting on were abandoned rather than finishing.
+    """
+    scheduling.recount()
+    for client in scheduling.parked_clients():
+        unpark_jobs(client)
+
+
+def queue_for_model(model: str) -> str:
+    """Get the queue to run a model's jobs on.
+
+    The first pattern in MODEL_QUEUES which matches the model decides the queue.
+    """
+    for pattern, queue in settings.MODEL_QUEUES.items():
+        if fnmatch.fnmatchcase(model, pattern):
+            return queue
+    return settings.CELERY_TASK_DEFAULT_QUEUE
+
+
+def enqueue_jobs(queued_jobs: Sequence[models.Job], *, requeued: bool = False) -> None:
+    """Queue jobs to be run by Celery workers, on their model's queue.
+
+    Many jobs are published together as a group. Nothing is queued if jobs are left
+    for the asyncio worker to claim instead. Requeued jobs, which were counted as
+    queued when they were first queued, aren't counted again.
+
+    When and with what priority each job is queued is recorded, so lost tasks can
+    be told apart from ones still waiting in the queue.
+    """
+    if settings.JOB_RUNNER != "celery":
+        return
+
+    priorities = scheduling.prioritize(queued_jobs, count=not requeued)
+    by_priority: dict[int, list[models.Job]] = defaultdict(list)
+    for job, priority in zip(queued_jobs, priorities, strict=True):
+        by_priority[priority].append(job)
+    # Recorded before publishing, so it's always before the jobs are claimed.
+    for priority, batch in by_priority.items():
+        models.Job.objects.filter(pk__in=[job.pk for job in batch]).update(
+            queued_timestamp=Now(), queued_priority=priority
+        )
+
+    # Celery's Redis transport treats 0 as the highest priority.
+    signatures = [
+        run_job.s(job.pk, client=job.client).set(
+            queue=queue_for_model(job.model),
+            priority=scheduling.MAX_PRIORITY - priority,
+        )
+        for job, priority in zip(queued_jobs, priorities, strict=True)
+    ]
+    if len(signatures) == 1:
+        signatures[0].apply_async()
+    else:
+        group(signatures).apply_async()
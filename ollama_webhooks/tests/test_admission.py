@@ -0,0 +1,97 @@
+"""Test admission control."""
+
+from collections.abc import Iterator
+from http import HTTPStatus
+from unittest import mock
+
+from django.test import Client, override_settings
+
+import pytest
+
+from ollama_webhooks import admission, models
+
+
+def _jobs(*priorities: int, model: str = "llama3.2") -> list[models.Job]:
+    return [models.Job(model=model, priority=priority) for priority in priorities]
+
+
+@pytest.fixture
+def pipe() -> Iterator[mock.MagicMock]:
+    """Mock Redis pipeline."""
+    with (
+        override_settings(
+            REDIS_URL="redis://redis",
+            ADMISSION_MAX_BACKLOG=10,
+            ADMISSION_SHED_BACKLOG=5,
+            ADMISSION_SHED_PRIORITY=5,
+            ADMISSION_RETRY_AFTER=30,
+        ),
+        mock.patch("ollama_webhooks.factories.redis") as redis,
+    ):
+        yield redis.return_value.pipeline.return_value.__enter__.return_value
+
+
+def test_admit(pipe: mock.MagicMock) -> None:
+    """Test that jobs are counted as queued while their model has room for them."""
+    # 3 queued (including these 2) and 2 running.
+    pipe.execute.return_value = [3, [b"2"]]
+
+    admission.admit(_jobs(1, 9))
+
+    pipe.hincrby.assert_called_once_with(admission.QUEUED_KEY, "llama3.2", 2)
+
+
+def test_admit_over_max_backlog(pipe: mock.MagicMock) -> None:
+    """Test that every job is refused with 503 once the backlog is too long."""
+    pipe.execute.return_value = [9, [b"2"]]
+
+    with pytest.raises(admission.RejectedError) as exc_info:
+        admission.admit(_jobs(9))
+
+    assert exc_info.value.status == HTTPStatus.SERVICE_UNAVAILABLE
+    assert exc_info.value.retry_after == 30
+    # The refused jobs are no longer counted.
+    pipe.hincrby.assert_called_with(admission.QUEUED_KEY, "llama3.2", -1)
+
+
+@pytest.mark.parametrize(
+    ("priority", "status"), [(4, HTTPStatus.TOO_MANY_REQUESTS), (5, None)]
+)
+def test_admit_over_shed_backlog(
+    pipe: mock.MagicMock, priority: int, status: HTTPStatus | None
+) -> None:
+    """Test that only low priority jobs are refused with 429 over the shed backlog."""
+    pipe.execute.return_value = [5, [b"1"]]
+
+    if status is None:
+        admission.admit(_jobs(priority))
+    else:
+        with pytest.raises(admission.RejectedError) as exc_info:
+            admission.admit(_jobs(priority))
+        assert exc_info.value.status == status
+
+
+@pytest.mark.parametrize(
+    "status", [HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE]
+)
+@override_settings(WEBHOOK_URL="https://example.com/webhook", BODY_COMPRESSION="")
+def test_refused_response(status: HTTPStatus) -> None:
+    """Test that refused requests say when to try again, without creating jobs."""
+    with (
+        mock.patch(
+            "ollama_webhooks.admission.admit",
+            side_effect=admission.RejectedError(status, retry_after=30),
+        ),
+        mock.patch("ollama_webhooks.outbox.create_jobs") as create_jobs,
+    ):
+        response = Client().post(
+            "/api/generate",
+            b'{"model": "llama3.2", "prompt": "Hello"}',
+            content_type="application/json",
+            secure=True,
+        )
+
+    assert response.status_code == status
+    assert response.headers["Retry-After"] == "30"
+    assert response.json() == {"error": status.description}
+    create_jobs.assert_not_called()
@@ -0,0 +1,91 @@
+"""Test storage and compression of job bodies."""
+
+import io
+import json
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+
+import pytest
+import zstandard
+
+from ollama_webhooks import bodies, models
+
+BODY = json.dumps({
+    "model": "llama3.2",
+    "prompt": "Why is the sky blue? " * 100,
+}).encode()
+
+
+def _round_trip(body: bytes) -> tuple[str, bytes, bytes]:
+    compressed = io.BytesIO()
+    body_codec = bodies.compress(
+        io.BytesIO(body), compressed, "request_body", "llama3.2", "/api/generate"
+    )
+    compressed.seek(0)
+    decompressed = io.BytesIO()
+    bodies.decompress(compressed, decompressed, body_codec)
+    return body_codec, compressed.getvalue(), decompressed.getvalue()
+
+
+@pytest.mark.parametrize("body_codec", ["", "gzip", "zstd"])
+def test_round_trip(body_codec: str) -> None:
+    """Test that bodies decompress to what was compressed, with each codec."""
+    with (
+        override_settings(BODY_COMPRESSION=body_codec),
+        mock.patch.object(bodies, "dictionary", return_value=None),
+    ):
+        used_codec, compressed, decompressed = _round_trip(BODY)
+
+    assert used_codec == body_codec
+    assert decompressed == BODY
+    if body_codec:
+        assert len(compressed) < len(BODY)
+
+
+def test_round_trip_with_dictionary() -> None:
+    """Test that bodies compressed with a trained dictionary decompress with it."""
+    samples = [
+        json.dumps({"model": "llama3.2", "prompt": f"Question {i}: why?"}).encode()
+        for i in range(1000)
+    ]
+    data = zstandard.train_dictionary(1024, samples).as_bytes()
+    trained = models.CompressionDictionary(pk=123, data=data)
+    caches["default"].set("compression-dictionary-data:123", data)
+    try:
+        with (
+            override_settings(BODY_COMPRESSION="zstd"),
+            mock.patch.object(bodies, "dictionary", return_value=trained),
+        ):
+            used_codec, _, decompressed = _round_trip(samples[0])
+    finally:
+        caches["default"].delete("compression-dictionary-data:123")
+
+    assert used_codec == "zstd:123"
+    assert decompressed == samples[0]
+
+
+def test_decompress_unknown_codec() -> None:
+    """Test that bodies with an unknown codec can't be read."""
+    with pytest.raises(ValueError, match="Unknown body codec"):
+        bodies.decompress(io.BytesIO(b""), io.BytesIO(), "brotli")
+
+
+@override_settings(
+    BODY_COMPRESSION="gzip", BODY_COMPRESSION_MIN_SIZE=256, BODY_STORAGE_THRESHOLD=None
+)
+def test_fields() -> None:
+    """Test that only bodies large enough to be worth it are compressed."""
+    small = bodies.fields("request_body", b"{}", "llama3.2", "/api/generate")
+    assert small == {
+        "request_body": b"{}",
+        "request_body_hash": "",
+        "request_body_size": 2,
+        "request_body_codec": "",
+    }
+
+    large = bodies.fields("request_body", BODY, "llama3.2", "/api/generate")
+    assert large["request_body_codec"] == "gzip"
+    assert large["request_body_size"] == len(BODY)
+    assert len(large["request_body"]) < len(BODY)
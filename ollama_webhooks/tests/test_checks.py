@@ -0,0 +1,18 @@
+"""Test system checks."""
+
+from django.test import override_settings
+
+from ollama_webhooks import checks
+
+
+@override_settings(JOB_RUNNER="async", SCHEDULER_ENABLED=True)
+def test_check_job_runner() -> None:
+    """Test that scheduling is refused for the asyncio worker."""
+    messages = checks.check_job_runner(app_configs=None, databases=None)
+    assert [message.id for message in messages] == ["ollama_webhooks.W001"]
+
+
+@override_settings(JOB_RUNNER="celery", SCHEDULER_ENABLED=True)
+def test_check_job_runner_celery() -> None:
+    """Test that scheduling is allowed for Celery."""
+    assert checks.check_job_runner(app_configs=None, databases=None) == []
@@ -0,0 +1,29 @@
+"""Test adaptive concurrency limits on Ollama backends."""
+
+from unittest import mock
+
+import pytest
+
+from ollama_webhooks import concurrency
+
+
+def test_acquired_best_first() -> None:
+    """Test that backends are acquired best first, skipping those at their limits."""
+    with mock.patch(
+        "ollama_webhooks.concurrency.acquire",
+        side_effect=[None, "b-token", None, "c-token"],
+    ):
+        acquired = concurrency.acquired(["a", "b", "c"])
+        assert next(acquired) == ("b", "b-token")
+        assert next(acquired) == ("c", "c-token")
+
+
+def test_acquired_saturated() -> None:
+    """Test that callers aren't kept waiting when every backend is at its limit."""
+    with (
+        mock.patch("ollama_webhooks.concurrency.acquire", return_value=None),
+        mock.patch("time.sleep") as sleep,
+        pytest.raises(concurrency.SaturatedError),
+    ):
+        list(concurrency.acquired(["a", "b"]))
+    sleep.assert_not_called()
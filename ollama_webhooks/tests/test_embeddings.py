@@ -0,0 +1,57 @@
+"""Test coalescing embedding jobs."""
+
+import json
+from typing import Any
+
+from ollama_webhooks import embeddings, models
+
+
+def _job(body: Any, path: str = embeddings.EMBED_PATH) -> models.Job:
+    return models.Job(
+        request_method="POST",
+        request_path=path,
+        request_body=json.dumps(body).encode(),
+        model="nomic-embed-text",
+    )
+
+
+def test_batch_key() -> None:
+    """Test that jobs differing only in their inputs share a batch key."""
+    one = _job({"model": "nomic-embed-text", "input": "a"})
+    many = _job({"model": "nomic-embed-text", "input": ["b", "c"]})
+    truncated = _job({"model": "nomic-embed-text", "input": "d", "truncate": False})
+
+    assert embeddings.batch_key(one) is not None
+    assert embeddings.batch_key(one) == embeddings.batch_key(many)
+    assert embeddings.batch_key(one) != embeddings.batch_key(truncated)
+
+
+def test_batch_key_unbatchable() -> None:
+    """Test that jobs which can't be combined have no batch key."""
+    assert embeddings.batch_key(_job({"input": "a"}, path="/api/generate")) is None
+    assert embeddings.batch_key(_job({"input": [1, 2]})) is None
+    assert embeddings.batch_key(_job(["not", "an", "object"])) is None
+
+
+def test_combine_and_split() -> None:
+    """Test that combined requests' responses are split back between their jobs."""
+    batch = [
+        _job({"model": "nomic-embed-text", "input": "a"}),
+        _job({"model": "nomic-embed-text", "input": ["b", "c"]}),
+    ]
+
+    assert json.loads(embeddings.combine(batch)) == {
+        "model": "nomic-embed-text",
+        "input": ["a", "b", "c"],
+    }
+
+    response = {
+        "model": "nomic-embed-text",
+        "embeddings": [[0.1], [0.2], [0.3]],
+        "prompt_eval_count": 3,
+    }
+    contents = embeddings.split(batch, json.dumps(response).encode())
+    assert [json.loads(content) for content in contents] == [
+        {"model": "nomic-embed-text", "embeddings": [[0.1]]},
+        {"model": "nomic-embed-text", "embeddings": [[0.2], [0.3]]},
+    ]
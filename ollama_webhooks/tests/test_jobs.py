@@ -0,0 +1,153 @@
+"""Test job lifecycle helpers."""
+
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+from django.db import connection
+
+import pytest
+
+from ollama_webhooks import jobs, models
+
+T = TypeVar("T")
+
+
+def test_batcher_joins_partial_lines() -> None:
+    """Test that lines split across chunks are only batched once they're complete."""
+    batcher = jobs.NDJSONBatcher(max_lines=2, max_interval=60)
+    assert batcher.feed(b'{"a": 1}\n{"b"') is None
+    assert batcher.feed(b': 2}\n{"c": 3}') == b'{"a": 1}\n{"b": 2}\n'
+    assert batcher.flush() == b'{"c": 3}'
+    assert batcher.flush() is None
+
+
+def test_batcher_batches_a_stream() -> None:
+    """Test that a whole stream is batched by line count, with the rest at the end."""
+    batcher = jobs.NDJSONBatcher(max_lines=2, max_interval=60)
+    chunks = [b"1\n2", b"\n3\n", b"4\n5"]
+    assert list(batcher.batches(chunks)) == [b"1\n2\n3\n", b"4\n5"]
+
+
+def test_batcher_flushes_after_interval() -> None:
+    """Test that complete lines are batched once the interval has passed."""
+    batcher = jobs.NDJSONBatcher(max_lines=100, max_interval=0)
+    assert batcher.feed(b"1\n2") == b"1\n"
+    assert batcher.feed(b"") is None
+    assert batcher.feed(b"\n") == b"2\n"
+
+
+def _create_job(model: str = "llama3.2", priority: int = 5) -> models.Job:
+    return models.Job.objects.create(
+        request_method="POST",
+        request_path="/api/generate",
+        model=model,
+        priority=priority,
+    )
+
+
+@pytest.mark.django_db
+def test_claim() -> None:
+    """Test that a job can be claimed once, leasing it to the claiming worker."""
+    job = _create_job()
+
+    claimed = jobs.claim(job.pk)
+    assert claimed is not None
+    assert claimed.status == models.Job.Status.RUNNING
+    assert claimed.attempts == 1
+    assert claimed.request_sent_timestamp is not None
+    assert claimed.lease_expires_timestamp is not None
+    assert claimed.lease_expires_timestamp > claimed.request_sent_timestamp
+
+    assert jobs.claim(job.pk) is None
+
+
+def _race(func: Callable[[], T], workers: int = 4) -> list[T]:
+    """Call func in several threads at once, each with its own connection."""
+    barrier = threading.Barrier(workers)
+
+    def call() -> T:
+        try:
+            barrier.wait()
+            return func()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(call) for _ in range(workers)]
+    return [future.result() for future in futures]
+
+
+@pytest.mark.django_db
+def test_claim_sql() -> None:
+    """Test that claims only update queued jobs, without reading response content."""
+    sql = jobs._claim_sql("TRUE")  # noqa: SLF001
+
+    assert "WHERE \"status\" = 'queued' AND TRUE" in sql
+    assert '"attempts" = "attempts" + 1' in sql
+    assert '"request_body"' in sql
+    assert '"response_content",' not in sql
+    assert not sql.endswith('"response_content"')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claim_race() -> None:
+    """Test that a job claimed by several workers at once is only claimed by one."""
+    job = _create_job()
+
+    claimed = _race(lambda: jobs.claim(job.pk))
+
+    assert len([claimed_job for claimed_job in claimed if claimed_job]) == 1
+    job.refresh_from_db()
+    assert job.attempts == 1
+
+
+@pytest.mark.django_db
+def test_claim_pending() -> None:
+    """Test that pending jobs matching filters are claimed highest priority first."""
+    low = _create_job(priority=1)
+    high = _create_job(priority=9)
+    other_model = _create_job(priority=9, model="nomic-embed-text")
+
+    claimed = jobs.claim_pending(1, model="llama3.2")
+    assert [job.pk for job in claimed] == [high.pk]
+
+    claimed = jobs.claim_pending(10, model="llama3.2")
+    assert [job.pk for job in claimed] == [low.pk]
+
+    other_model.refresh_from_db()
+    assert other_model.status == models.Job.Status.QUEUED
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claim_pending_race() -> None:
+    """Test that workers claiming pending jobs at once never claim the same job."""
+    created = [_create_job() for _ in range(10)]
+
+    claimed = _race(lambda: jobs.claim_pending(3, model="llama3.2"))
+
+    pks = [job.pk for batch in claimed for job in batch]
+    assert len(pks) == len(set(pks))
+    assert models.Job.objects.filter(status=models.Job.Status.RUNNING).count() == len(
+        pks
+    )
+    assert set(pks) <= {job.pk for job in created}
+
+
+@pytest.mark.django_db
+def test_record_response_for_a_later_run() -> None:
+    """Test that a run whose job has been claimed again can't record a response."""
+    job = _create_job()
+    stale = jobs.claim(job.pk)
+    assert stale is not None
+    models.Job.objects.filter(pk=job.pk).update(status=models.Job.Status.QUEUED)
+    current = jobs.claim(job.pk)
+    assert current is not None
+
+    assert not jobs.record_response(stale, b"stale", {})
+    assert jobs.record_response(current, b"current", {})
+
+    job.refresh_from_db()
+    assert job.status == models.Job.Status.SUCCEEDED
+    assert bytes(job.response_content) == b"current"
@@ -0,0 +1,72 @@
+"""Test Prometheus metrics."""
+
+from unittest import mock
+
+from django.test import Client, override_settings
+
+import pytest
+
+from ollama_webhooks import metrics, models
+
+
+@override_settings(METRICS_MODELS={"llama3.2"})
+def test_labels() -> None:
+    """Test that only known models and paths are used as labels."""
+    assert metrics.model_label("llama3.2") == "llama3.2"
+    assert metrics.model_label("my-fine-tune") == metrics.OTHER_LABEL
+    assert metrics.path_label("/api/generate") == "/api/generate"
+    assert metrics.path_label("/api/generate/../../etc") == metrics.OTHER_LABEL
+
+
+@pytest.mark.django_db
+@override_settings(METRICS_MODELS={"llama3.2"})
+def test_jobs_collector() -> None:
+    """Test that unfinished jobs are counted by status and labelled model."""
+    for model, status in [
+        ("llama3.2", models.Job.Status.QUEUED),
+        ("llama3.2", models.Job.Status.QUEUED),
+        ("mistral", models.Job.Status.QUEUED),
+        ("qwen3", models.Job.Status.QUEUED),
+        ("llama3.2", models.Job.Status.RUNNING),
+        ("llama3.2", models.Job.Status.SUCCEEDED),
+    ]:
+        models.Job.objects.create(
+            request_method="POST", request_path="/", model=model, status=status
+        )
+
+    (gauge,) = metrics.JobsCollector().collect()
+
+    assert {
+        (sample.labels["status"], sample.labels["model"]): sample.value
+        for sample in gauge.samples
+    } == {
+        ("queued", "llama3.2"): 2,
+        ("queued", metrics.OTHER_LABEL): 2,
+        ("running", "llama3.2"): 1,
+    }
+
+
+def test_jobs_collector_database_unavailable() -> None:
+    """Test that the other metrics are still served if jobs can't be counted."""
+    with mock.patch(
+        "ollama_webhooks.models.Job.objects.filter", side_effect=RuntimeError
+    ):
+        assert list(metrics.JobsCollector().collect()) == []
+        assert b"python_info" in metrics.generate()
+
+
+@pytest.mark.parametrize(
+    ("authorization", "status_code"),
+    [("", 401), ("Bearer wrong", 401), ("Bearer secret", 200)],
+)
+@override_settings(METRICS_TOKEN="secret")  # noqa: S106
+def test_metrics_view(authorization: str, status_code: int) -> None:
+    """Test that metrics are only served with the right token."""
+    with mock.patch("ollama_webhooks.metrics.generate", return_value=b"metrics"):
+        response = Client().get(
+            "/metrics", headers={"Authorization": authorization}, secure=True
+        )
+
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert response.content == b"metrics"
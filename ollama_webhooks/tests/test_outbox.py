@@ -0,0 +1,251 @@
+"""Test queuing jobs through the outbox."""
+
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+import pytest
+
+from ollama_webhooks import models, outbox
+
+
+def _new_jobs(count: int) -> list[models.Job]:
+    return [
+        models.Job(
+            request_method="POST", request_path="/api/generate", model="llama3.2"
+        )
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.django_db
+@override_settings(JOB_RUNNER="celery", SCHEDULER_ENABLED=False)
+def test_relay() -> None:
+    """Test that created jobs are published from the outbox, oldest first, once."""
+    created = outbox.create_jobs(_new_jobs(3))
+    assert models.OutboxEntry.objects.count() == 3
+
+    with (
+        mock.patch("ollama_webhooks.tasks.run_job") as run_job,
+        mock.patch("ollama_webhooks.tasks.group") as group,
+    ):
+        assert outbox.relay(2) == 2
+        assert outbox.relay(2) == 1
+        assert outbox.relay(2) == 0
+
+    assert [call.args[0] for call in run_job.s.call_args_list] == [
+        job.pk for job in created
+    ]
+    group.return_value.apply_async.assert_called_once()
+    assert not models.OutboxEntry.objects.exists()
+    assert not models.Job.objects.filter(queued_timestamp__isnull=True).exists()
+
+
+@pytest.mark.django_db
+@override_settings(JOB_RUNNER="celery", SCHEDULER_ENABLED=False)
+def test_relay_publishing_fails() -> None:
+    """Test that outbox entries are kept if their jobs can't be published."""
+    outbox.create_jobs(_new_jobs(2))
+
+    with mock.patch("ollama_webhooks.tasks.group") as group:
+        group.return_value.apply_async.side_effect = ConnectionError
+        with pytest.raises(ConnectionError):
+            outbox.relay(10)
+
+    assert models.OutboxEntry.objects.count() == 2
+    assert not models.Job.objects.filter(queued_timestamp__isnull=False).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(JOB_RUNNER="celery", SCHEDULER_ENABLED=False)
+def test_relay_race() -> None:
+    """Test that relays running at once never publish the same entry twice."""
+    created = outbox.create_jobs(_new_jobs(20))
+    barrier = threading.Barrier(4)
+
+    def relay() -> int:
+        try:
+            barrier.wait()
+            return outbox.relay(5)
+        finally:
+            connection.close()
+
+    with (
+        mock.patch("ollama_webhooks.tasks.run_job") as run_job,
+        mock.patch("ollama_webhooks.tasks.group"),
+        ThreadPoolExecutor(4) as executor,
+    ):
+        futures = [executor.submit(relay) for _ in range(4)]
+    relayed = sum(future.result() for future in futures)
+
+    published = [call.args[0] for call in run_job.s.call_args_list]
+    assert len(published) == len(set(published)) == relayed
+    assert models.OutboxEntry.objects.count() == len(created) - relayed
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(JOB_RUNNER="celery")
+def test_create_jobs_notifies() -> None:
+    """Test that the relay's channel is notified once jobs are committed."""
+    connection.ensure_connection()
+    pg_connection = connection.connection
+    pg_connection.execute(f"LISTEN {connection.ops.quote_name(outbox.CHANNEL)}")
+
+    def create() -> None:
+        try:
+            outbox.create_jobs(_new_jobs(1))
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=create)
+    thread.start()
+    thread.join()
+
+    notifications = list(pg_connection.notifies(timeout=5, stop_after=1))
+    assert [notification.channel for notification in notifications] == [outbox.CHANNEL]
+
+
+def test_run() -> None:
+    """Test that the relay drains the outbox when notified, and recovers from errors."""
+    with (
+        mock.patch("ollama_webhooks.outbox.connection") as db_connection,
+        mock.patch("ollama_webhooks.outbox.relay") as relay,
+        mock.patch("time.sleep") as sleep,
+    ):
+        db_connection.ops.quote_name.side_effect = lambda name: f'"{name}"'
+        pg_connection = db_connection.connection
+        # Full batches are relayed straight away; otherwise the relay waits.
+        relay.side_effect = [ConnectionError, 2, 1, 0]
+        pg_connection.notifies.side_effect = [iter([]), KeyboardInterrupt]
+
+        with pytest.raises(KeyboardInterrupt):
+            outbox.run(batch_size=2, poll_interval=5)
+
+    assert relay.call_count == 4
+    pg_connection.execute.assert_has_calls([
+        mock.call('LISTEN "ollama_webhooks_outbox"'),
+        mock.call('LISTEN "ollama_webhooks_outbox"'),
+    ])
+    pg_connection.notifies.assert_called_with(timeout=5, stop_after=1)
+    db_connection.close.assert_called_once()
+    sleep.assert_called_once_with(5)
+
+
+def _queued_job(
+    model: str, hours_ago: float, priority: int = 5, *, started: bool = False
+) -> models.Job:
+    queued = timezone.now() - datetime.timedelta(hours=hours_ago)
+    job = models.Job.objects.create(
+        request_method="POST", request_path="/api/generate", model=model
+    )
+    models.Job.objects.filter(pk=job.pk).update(
+        created_timestamp=queued,
+        queued_timestamp=queued,
+        queued_priority=priority,
+        request_sent_timestamp=queued if started else None,
+        status=models.Job.Status.RUNNING if started else models.Job.Status.QUEUED,
+    )
+    return job
+
+
+@pytest.mark.django_db
+@override_settings(
+    JOB_RUNNER="celery",
+    OUTBOX_REQUEUE_AFTER=60 * 60,
+    SCHEDULER_ENABLED=False,
+    EMBED_BATCH_MAX_SIZE=1,
+)
+def test_requeue_stale() -> None:
+    """Test that only jobs which later jobs have overtaken long ago are requeued."""
+    lost = _queued_job("llama3.2", hours_ago=3)
+    _queued_job("llama3.2", hours_ago=2, started=True)
+    # Nothing's been claimed after it, so its task may still be in the queue.
+    _queued_job("mistral", hours_ago=3)
+    # The job claimed after it was queued with a better priority.
+    outranked = _queued_job("qwen3", hours_ago=3, priority=3)
+    _queued_job("qwen3", hours_ago=2, priority=7, started=True)
+    # The job claimed after it was only claimed recently.
+    _queued_job("gemma3", hours_ago=3)
+    _queued_job("gemma3", hours_ago=0.5, started=True)
+
+    with mock.patch("ollama_webhooks.tasks.run_job") as run_job:
+        assert outbox.requeue_stale(100) == 1
+
+    run_job.s.assert_called_once_with(lost.pk, client="")
+    lost.refresh_from_db()
+    assert lost.queued_timestamp is not None
+    assert lost.queued_timestamp > timezone.now() - datetime.timedelta(minutes=1)
+    outranked.refresh_from_db()
+    assert outranked.queued_timestamp is not None
+    assert outranked.queued_timestamp < timezone.now() - datetime.timedelta(hours=1)
+
+
+def _running_job(attempts: int, lease_seconds: float) -> models.Job:
+    job = models.Job.objects.create(
+        request_method="POST", request_path="/api/generate", model="llama3.2"
+    )
+    models.Job.objects.filter(pk=job.pk).update(
+        status=models.Job.Status.RUNNING,
+        attempts=attempts,
+        request_sent_timestamp=timezone.now(),
+        lease_expires_timestamp=timezone.now()
+        + datetime.timedelta(seconds=lease_seconds),
+    )
+    return job
+
+
+@pytest.mark.django_db
+@override_settings(JOB_RUNNER="celery", JOB_MAX_ATTEMPTS=3)
+def test_sweep_expired_leases() -> None:
+    """Test that abandoned jobs are requeued until they've used up their attempts."""
+    abandoned = _running_job(attempts=1, lease_seconds=-60)
+    exhausted = _running_job(attempts=3, lease_seconds=-60)
+    running = _running_job(attempts=1, lease_seconds=60)
+
+    with mock.patch("ollama_webhooks.notifications.publish") as publish:
+        assert outbox.sweep_expired_leases(100) == (1, 1)
+
+    abandoned.refresh_from_db()
+    assert abandoned.status == models.Job.Status.QUEUED
+    assert abandoned.lease_expires_timestamp is None
+    assert abandoned.request_sent_timestamp is None
+    assert list(models.OutboxEntry.objects.values_list("job_id", flat=True)) == [
+        abandoned.pk
+    ]
+    exhausted.refresh_from_db()
+    assert exhausted.status == models.Job.Status.FAILED
+    publish.assert_called_once_with(exhausted.pk)
+    running.refresh_from_db()
+    assert running.status == models.Job.Status.RUNNING
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(JOB_RUNNER="celery", JOB_MAX_ATTEMPTS=3)
+def test_sweep_expired_leases_race() -> None:
+    """Test that sweepers running at once never requeue the same job twice."""
+    for _ in range(20):
+        _running_job(attempts=1, lease_seconds=-60)
+    barrier = threading.Barrier(4)
+
+    def sweep() -> int:
+        try:
+            barrier.wait()
+            requeued, _ = outbox.sweep_expired_leases(5)
+            return requeued
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(sweep) for _ in range(4)]
+    requeued = sum(future.result() for future in futures)
+
+    job_pks = list(models.OutboxEntry.objects.values_list("job_id", flat=True))
+    assert len(job_pks) == len(set(job_pks)) == requeued
+    assert (
+        models.Job.objects.filter(status=models.Job.Status.QUEUED).count() == requeued
+    )
@@ -0,0 +1,51 @@
+"""Test caching Ollama's responses."""
+
+import json
+from typing import Any
+from unittest import mock
+
+from django.test import override_settings
+
+from ollama_webhooks import models, response_cache
+
+
+def _job(body: Any, path: str = "/api/generate") -> models.Job:
+    return models.Job(
+        request_method="POST",
+        request_path=path,
+        request_body=json.dumps(body).encode(),
+        model="llama3.2",
+    )
+
+
+@override_settings(RESPONSE_CACHE_BACKEND="redis")
+def test_request_key() -> None:
+    """Test that only deterministic requests can be cached, however they're written."""
+    seeded = {"model": "llama3.2", "stream": False, "options": {"seed": 1}}
+    reordered = {"options": {"seed": 1}, "stream": False, "model": "llama3.2"}
+
+    assert response_cache.request_key(_job(seeded)) is not None
+    assert response_cache.request_key(_job(seeded)) == response_cache.request_key(
+        _job(reordered)
+    )
+    assert response_cache.request_key(_job({"model": "llama3.2"})) is None
+    assert response_cache.request_key(_job({"input": "a"}, path="/api/embed"))
+
+
+def test_key_per_backend() -> None:
+    """Test that keys depend on the digest of each backend's copy of the model."""
+    digests = {
+        "http://one": {"llama3.2:latest": "sha256:1"},
+        "http://two": {"llama3.2:latest": "sha256:2"},
+    }
+    with mock.patch(
+        "ollama_webhooks.response_cache.model_digests", side_effect=digests.get
+    ):
+        one = response_cache.key("request", "llama3.2", "http://one")
+        two = response_cache.key("request", "llama3.2:latest", "http://two")
+        missing = response_cache.key("request", "qwen3", "http://one")
+
+    assert one is not None
+    assert two is not None
+    assert one != two
+    assert missing is None
@@ -0,0 +1,101 @@
+"""Test routing jobs across Ollama backends."""
+
+from collections.abc import Iterator
+from unittest import mock
+
+from django.test import override_settings
+
+import pytest
+import requests
+
+from ollama_webhooks import routing
+
+BACKENDS = ["http://a:11434/", "http://b:11434/", "http://c:11434/", "http://d:11434/"]
+
+
+@pytest.fixture
+def redis() -> Iterator[mock.MagicMock]:
+    """Mock Redis client."""
+    with (
+        override_settings(
+            OLLAMA_URLS=BACKENDS,
+            OLLAMA_EJECT_SECONDS=30,
+            OLLAMA_POLL_INTERVAL=10,
+            JOB_LEASE_SECONDS=300,
+        ),
+        mock.patch("ollama_webhooks.factories.redis") as redis,
+    ):
+        yield redis.return_value
+
+
+@override_settings(OLLAMA_URLS=["http://a:11434/"])
+def test_single_backend() -> None:
+    """Test that a single backend is used without tracking anything in Redis."""
+    with mock.patch("ollama_webhooks.factories.redis") as redis:
+        assert routing.candidates("llama3.2") == ["http://a:11434/"]
+        token = routing.acquire("http://a:11434/")
+        routing.release("http://a:11434/", token)
+        routing.eject("http://a:11434/")
+
+    redis.assert_not_called()
+
+
+def test_candidates(redis: mock.MagicMock) -> None:
+    """Test that healthy backends with the model loaded and the least to do go first."""
+    pipe = redis.pipeline.return_value.__enter__.return_value
+    # Whether each backend is ejected and has the model loaded, and its requests.
+    pipe.execute.return_value = [1, 1, 0, 0, 0, 0, 0, 1, 5, 0, 1, 1]
+
+    assert routing.candidates("llama3.2") == [
+        "http://d:11434/",
+        "http://c:11434/",
+        "http://b:11434/",
+        "http://a:11434/",
+    ]
+    pipe.sismember.assert_any_call("ollama-loaded:http://a:11434/", "llama3.2")
+
+
+def test_acquire_and_release(redis: mock.MagicMock) -> None:
+    """Test that outstanding requests are counted until they're released."""
+    pipe = redis.pipeline.return_value.__enter__.return_value
+    with mock.patch("time.time", return_value=1000):
+        token = routing.acquire("http://a:11434/")
+
+    pipe.zadd.assert_called_once_with(
+        "ollama-outstanding:http://a:11434/", {token: 1300}
+    )
+    routing.release("http://a:11434/", token)
+    redis.zrem.assert_called_once_with("ollama-outstanding:http://a:11434/", token)
+
+
+def test_poll(redis: mock.MagicMock) -> None:
+    """Test that loaded models are recorded, and unreachable backends ejected."""
+    pipe = redis.pipeline.return_value.__enter__.return_value
+    loaded = requests.Response()
+    loaded.status_code = 200
+    loaded._content = b'{"models": [{"name": "llama3.2:latest"}]}'  # noqa: SLF001
+    empty = requests.Response()
+    empty.status_code = 200
+    empty._content = b'{"models": []}'  # noqa: SLF001
+    broken = requests.Response()
+    broken.status_code = 500
+
+    with mock.patch("ollama_webhooks.factories.session") as session:
+        session.return_value.get.side_effect = [
+            loaded,
+            requests.ConnectionError,
+            empty,
+            broken,
+        ]
+        routing.poll()
+
+    pipe.sadd.assert_called_once_with(
+        "ollama-loaded:http://a:11434/", "llama3.2:latest", "llama3.2"
+    )
+    pipe.delete.assert_any_call(
+        "ollama-loaded:http://c:11434/", "ollama-ejected:http://c:11434/"
+    )
+    assert redis.set.call_args_list == [
+        mock.call("ollama-ejected:http://b:11434/", 1, ex=30),
+        mock.call("ollama-ejected:http://d:11434/", 1, ex=30),
+    ]
@@ -0,0 +1,75 @@
+"""Test priority and fair-share scheduling."""
+
+from collections.abc import Iterator
+from unittest import mock
+
+from django.test import override_settings
+
+import pytest
+
+from ollama_webhooks import models, scheduling
+
+
+def _jobs(*clients: str, priority: int = 5) -> list[models.Job]:
+    return [models.Job(client=client, priority=priority) for client in clients]
+
+
+@pytest.fixture
+def pipe() -> Iterator[mock.MagicMock]:
+    """Mock Redis pipeline."""
+    with mock.patch("ollama_webhooks.factories.redis") as redis:
+        yield redis.return_value.pipeline.return_value.__enter__.return_value
+
+
+@override_settings(SCHEDULER_ENABLED=False)
+def test_prioritize_disabled() -> None:
+    """Test that jobs keep their own priorities without scheduling."""
+    assert scheduling.prioritize(_jobs("a", "b", priority=7)) == [7, 7]
+
+
+@override_settings(SCHEDULER_ENABLED=True, SCHEDULER_CLIENT_WEIGHTS={})
+def test_prioritize(pipe: mock.MagicMock) -> None:
+    """Test that each doubling of a client's backlog costs a priority level."""
+    # Client a had nothing queued, and b had 3, before these jobs.
+    pipe.execute.return_value = [3, 5]
+
+    priorities = scheduling.prioritize(_jobs("a", "a", "a", "b", "b"))
+
+    pipe.hincrby.assert_has_calls([
+        mock.call(scheduling.QUEUED_KEY, "a", 3),
+        mock.call(scheduling.QUEUED_KEY, "b", 2),
+    ])
+    assert priorities == [5, 4, 4, 3, 3]
+
+
+@override_settings(SCHEDULER_ENABLED=True, SCHEDULER_CLIENT_WEIGHTS={"a": 4})
+def test_prioritize_weighted(pipe: mock.MagicMock) -> None:
+    """Test that backlogs are measured in multiples of clients' weights."""
+    pipe.execute.return_value = [7, 7]
+
+    assert scheduling.prioritize(_jobs("a", "b")) == [4, 3]
+
+
+@override_settings(SCHEDULER_ENABLED=True, SCHEDULER_CLIENT_WEIGHTS={})
+def test_prioritize_without_counting(pipe: mock.MagicMock) -> None:
+    """Test that jobs being queued again aren't counted again."""
+    pipe.execute.return_value = [b"3"]
+
+    assert scheduling.prioritize(_jobs("a"), count=False) == [3]
+    pipe.hincrby.assert_not_called()
+    pipe.hget.assert_called_once_with(scheduling.QUEUED_KEY, "a")
+
+
+@override_settings(SCHEDULER_ENABLED=True, SCHEDULER_MAX_IN_FLIGHT=4)
+def test_unpark() -> None:
+    """Test that only as many parked jobs are taken as the client has room for."""
+    with mock.patch("ollama_webhooks.factories.redis") as redis:
+        redis.return_value.zcount.return_value = 3
+        redis.return_value.zpopmin.return_value = [(b"job", 1.0)]
+
+        assert scheduling.unpark("a") == ["job"]
+        redis.return_value.zpopmin.assert_called_once_with("scheduler-parked:a", 1)
+
+        redis.return_value.zcount.return_value = 4
+        assert scheduling.unpark("a") == []
+        redis.return_value.zpopmin.assert_called_once()
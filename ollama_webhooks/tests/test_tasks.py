@@ -0,0 +1,82 @@
+"""Test tasks."""
+
+import base64
+import json
+import uuid
+from unittest import mock
+
+from django.test import override_settings
+
+import pytest
+import requests
+
+from ollama_webhooks import models, tasks
+
+
+@override_settings(WEBHOOK_RETRY_BASE_DELAY=2, WEBHOOK_RETRY_MAX_DELAY=60)
+@pytest.mark.parametrize(
+    ("attempts", "ceiling"), [(1, 2), (2, 4), (3, 8), (5, 32), (6, 60), (20, 60)]
+)
+def test_webhook_retry_delay(attempts: int, ceiling: float) -> None:
+    """Test that retry delays back off exponentially, up to a maximum, with jitter."""
+    with mock.patch("random.uniform", return_value=0.5) as uniform:
+        assert tasks.webhook_retry_delay(attempts) == 0.5
+    uniform.assert_called_once_with(0, ceiling)
+
+
+@pytest.mark.django_db
+def test_deliveries_in_order() -> None:
+    """Test that a job's deliveries can't be claimed until earlier ones are done."""
+    job = models.Job.objects.create(request_method="POST", request_path="/api/chat")
+    first, second, whole = (
+        models.WebhookDelivery.objects.create(job=job, part=part)
+        for part in (0, 1, None)
+    )
+
+    assert not tasks.claim_delivery(second.pk)
+    assert not tasks.claim_delivery(whole.pk)
+    assert tasks.claim_delivery(first.pk)
+
+    first.status = models.WebhookDelivery.Status.DEAD
+    first.save()
+    with mock.patch("ollama_webhooks.tasks.queue_deliveries") as queue_deliveries:
+        tasks.deliveries_finished([first])
+    queue_deliveries.assert_called_once_with([second.pk])
+    assert tasks.claim_delivery(second.pk)
+    assert not tasks.claim_delivery(whole.pk)
+
+
+@override_settings(RESPONSE_CACHE_BACKEND="")
+def test_execute_error_response() -> None:
+    """Test that Ollama's error responses fail jobs rather than being delivered."""
+    ollama_response = requests.Response()
+    ollama_response.status_code = 503
+    ollama_response._content = b'{"error": "Overloaded."}'  # noqa: SLF001
+    with (
+        mock.patch("ollama_webhooks.tasks.ollama_request") as ollama_request,
+        mock.patch("ollama_webhooks.jobs.record_response") as record_response,
+        mock.patch("ollama_webhooks.tasks.queue_webhook") as queue_webhook,
+    ):
+        ollama_request.return_value.__enter__.return_value = (
+            "http://ollama:11434",
+            ollama_response,
+        )
+        with pytest.raises(requests.HTTPError):
+            tasks.execute(models.Job(request_method="POST", request_path="/api/chat"))
+
+    record_response.assert_not_called()
+    queue_webhook.assert_not_called()
+
+
+@override_settings(WEBHOOK_BATCH_FORMAT="ndjson")
+def test_webhook_batch_payload() -> None:
+    """Test that batched content arrives intact, even if it isn't UTF-8."""
+    job_id = uuid.uuid4()
+    delivery = models.WebhookDelivery(pk=1, job_id=job_id, part=2)
+
+    body, content_type = tasks.webhook_batch_payload([(delivery, b"\xff\xfe")])
+
+    assert content_type == "application/x-ndjson"
+    item = json.loads(body)
+    assert item == {"delivery": 1, "job": str(job_id), "part": 2, "content": "//4="}
+    assert base64.b64decode(item["content"]) == b"\xff\xfe"
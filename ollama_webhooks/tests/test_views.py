@@ -0,0 +1,53 @@
+"""Test building jobs from requests."""
+
+from typing import Any
+
+from django.test import override_settings
+
+import pytest
+
+from ollama_webhooks import views
+
+
+@override_settings(BODY_COMPRESSION="")
+def test_job_from_dict() -> None:
+    """Test that a batch item becomes a job, with its body encoded as JSON."""
+    job = views.job_from_dict({
+        "method": "post",
+        "path": "/api/generate",
+        "query": "a=1",
+        "headers": {"Content-Type": "application/json"},
+        "body": {"model": "llama3.2", "prompt": "Hello"},
+    })
+
+    assert job.request_method == "POST"
+    assert job.request_path == "/api/generate"
+    assert job.request_query == "a=1"
+    assert job.request_headers == {"Content-Type": "application/json"}
+    assert job.model == "llama3.2"
+    assert bytes(job.request_body) == b'{"model": "llama3.2", "prompt": "Hello"}'
+
+
+@override_settings(BODY_COMPRESSION="")
+def test_job_from_dict_defaults() -> None:
+    """Test that batch items default to a POST to / with a string body as is."""
+    job = views.job_from_dict({"body": "not JSON"})
+
+    assert job.request_method == "POST"
+    assert job.request_path == "/"
+    assert job.model == ""
+    assert bytes(job.request_body) == b"not JSON"
+
+
+@pytest.mark.parametrize(
+    ("data", "error"),
+    [
+        ([], TypeError),
+        ("GET /", TypeError),
+        ({"method": "FETCH"}, ValueError),
+    ],
+)
+def test_job_from_dict_invalid(data: Any, error: type[Exception]) -> None:
+    """Test that invalid batch items are refused."""
+    with pytest.raises(error):
+        views.job_from_dict(data)
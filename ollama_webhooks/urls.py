@@ -5,7 +5,10 @@ from django.urls import path
 from ollama_webhooks import views
 
 urlpatterns = [
+    path("jobs/batch/", views.CreateJobsView.as_view(), name="jobs-batch"),
     path("jobs/<uuid:pk>/", views.JobView.as_view(), name="job"),
+    path("jobs/<uuid:pk>/wait/", views.JobWaitView.as_view(), name="job-wait"),
+    path("metrics", views.MetricsView.as_view(), name="metrics"),
     path("<path:path>", views.CreateJobView.as_view()),
     path("", views.CreateJobView.as_view()),
 ]
@@ -1,16 +1,37 @@
 """Views."""
 
+import asyncio
+import hashlib
+import hmac
+import json
 import logging
-from http import HTTPStatus
+import time
+from collections.abc import AsyncIterator
+from http import HTTPMethod, HTTPStatus
 from typing import Any
 from urllib.parse import urlencode
 
 from django import http, urls
 from django.conf import settings
 from django.http import HttpResponse
-from django.views.generic import DetailView, View
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.generic import View
 
-from ollama_webhooks import models, tasks
+import prometheus_client
+from asgiref.sync import sync_to_async
+
+from ollama_webhooks import (
+    admission,
+    bodies,
+    jobs,
+    metrics,
+    models,
+    notifications,
+    outbox,
+    scheduling,
+    webhooks,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,15 +40,33 @@ def response_from_status(status: HTTPStatus) -> http.HttpResponse:  # noqa: D103
     return HttpResponse(status.description, status=status)
 
 
+def response_from_rejection(error: admission.RejectedError) -> http.HttpResponse:
+    """Respond to jobs refused by admission control, saying when to try again."""
+    return http.JsonResponse(
+        {"error": str(error)},
+        status=error.status,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
 def job_to_dict(job: models.Job, request: http.HttpRequest) -> dict[str, Any]:
     """Convert a job to a dict."""
     job_url = request.build_absolute_uri(urls.reverse("job", args=(job.pk,)))
-    webhook_url = settings.WEBHOOK_URL + urlencode({"job": job.id})
+    webhook_url = webhooks.url(job.webhook_url) + urlencode({"job": job.id})
     return {
         "job": str(job.pk),
         "url": job_url,
         "webhook": webhook_url,
+        "status": job.status,
         "created_at": str(job.created_timestamp),
+        "sent_at": (
+            str(job.request_sent_timestamp) if job.request_sent_timestamp else None
+        ),
+        "received_at": (
+            str(job.response_received_timestamp)
+            if job.response_received_timestamp
+            else None
+        ),
         "message": (
             "You have sent a request to Ollama webhooks. Your request has entered a"
             f" queue. Once it has been processed, an HTTP {settings.WEBHOOK_METHOD}"
@@ -47,9 +86,21 @@ def job_to_dict(job: models.Job, request: http.HttpRequest) -> dict[str, Any]:
 class CreateJobView(View):
     """Create job to pass on to Ollama."""
 
-    def dispatch(
+    # Every method is handled by dispatch, asynchronously.
+    view_is_async = True
+
+    async def dispatch(  # type: ignore[override]
         self, request: http.HttpRequest, *args: Any, **kwargs: Any
     ) -> http.HttpResponse:
+        """Create an Ollama job from this request, timing how long that takes."""
+        started = time.monotonic()
+        response = await self.create_job(request)
+        metrics.INTAKE_SECONDS.labels("job", response.status_code).observe(
+            time.monotonic() - started
+        )
+        return response
+
+    async def create_job(self, request: http.HttpRequest) -> http.HttpResponse:
         """Create an Ollama job from this request.
 
         Also, simulate an Ollama response to this request so that this can be used with
@@ -59,14 +110,34 @@ class CreateJobView(View):
             msg = "Request doesn't have a method, unable to create job."
             raise AssertionError(msg)
 
-        job = models.Job.objects.create(
+        try:
+            webhook_url = webhooks.url_from_request(request)
+        except ValueError as exc:
+            return http.JsonResponse({"error": str(exc)}, status=HTTPStatus.BAD_REQUEST)
+
+        model = jobs.model_from_body(request.body)
+        body_fields = await sync_to_async(bodies.fields)(
+            "request_body", request.body, model=model, path=request.path
+        )
+        new_job = models.Job(
             request_method=request.method,
             request_path=request.path,
             request_query=request.GET.urlencode(),
             request_headers=dict(request.headers),
-            request_body=request.body,
+            model=model,
+            **body_fields,
+            client=scheduling.client_from_request(request),
+            priority=scheduling.priority_from_request(request),
+            webhook_url=webhook_url,
         )
-        tasks.run_job.delay(job.pk)
+        try:
+            await sync_to_async(admission.admit)([new_job])
+        except admission.RejectedError as exc:
+            return response_from_rejection(exc)
+
+        # The job and its outbox entry are saved in a transaction, which the async
+        # ORM can't do.
+        (job,) = await sync_to_async(outbox.create_jobs)([new_job])
 
         # Send job details, along with a minimal simulation of a request to this
         # endpoint.
@@ -97,14 +168,220 @@ class CreateJobView(View):
         return http.JsonResponse(job_details)
 
 
-class JobView(DetailView[models.Job]):
-    """View details of a job."""
+def job_from_dict(data: Any) -> models.Job:
+    """Build an unsaved job from a batch item.
+
+    Items look like {"method": ..., "path": ..., "query": ..., "headers": ...,
+    "body": ...}, where body may be a string or any JSON value.
+    """
+    if not isinstance(data, dict):
+        msg = "Each job must be a JSON object."
+        raise TypeError(msg)
+
+    method = str(data.get("method", HTTPMethod.POST)).upper()
+    if method not in HTTPMethod.__members__:
+        msg = f"{method} is not a valid HTTP method."
+        raise ValueError(msg)
+
+    body = data.get("body", b"")
+    if isinstance(body, str):
+        body = body.encode()
+    elif body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+
+    body = body or b""
+    model = jobs.model_from_body(body)
+    path = str(data.get("path", "/"))
+    return models.Job(
+        request_method=method,
+        request_path=path,
+        request_query=str(data.get("query", "")),
+        request_headers=dict(data.get("headers", {})),
+        model=model,
+        **bodies.fields("request_body", body, model=model, path=path),
+    )
+
+
+def jobs_from_request(request: http.HttpRequest) -> list[models.Job]:
+    """Build unsaved jobs from a JSON array or NDJSON request body."""
+    if request.content_type == jobs.NDJSON_CONTENT_TYPE:
+        items = [json.loads(line) for line in request.body.splitlines() if line]
+    else:
+        items = json.loads(request.body)
+
+    if not isinstance(items, list):
+        msg = "Expected a JSON array of jobs."
+        raise TypeError(msg)
+
+    if len(items) > settings.JOB_BATCH_MAX_SIZE:
+        msg = f"At most {settings.JOB_BATCH_MAX_SIZE} jobs can be sent at once."
+        raise ValueError(msg)
+
+    webhook_url = webhooks.url_from_request(request)
+    new_jobs = [job_from_dict(item) for item in items]
+    for job in new_jobs:
+        job.client = scheduling.client_from_request(request)
+        job.priority = scheduling.priority_from_request(request)
+        job.webhook_url = webhook_url
+    return new_jobs
+
+
+class CreateJobsView(View):
+    """Create many jobs to pass on to Ollama in one request."""
+
+    async def post(
+        self, request: http.HttpRequest, *args: Any, **kwargs: Any
+    ) -> http.HttpResponse:
+        """Create Ollama jobs, timing how long that takes."""
+        started = time.monotonic()
+        response = await self.create_jobs(request)
+        metrics.INTAKE_SECONDS.labels("batch", response.status_code).observe(
+            time.monotonic() - started
+        )
+        return response
+
+    async def create_jobs(self, request: http.HttpRequest) -> http.HttpResponse:
+        """Create Ollama jobs, inserting and queuing them all at once."""
+        try:
+            new_jobs = await sync_to_async(jobs_from_request)(request)
+        except (TypeError, ValueError) as exc:
+            return http.JsonResponse({"error": str(exc)}, status=HTTPStatus.BAD_REQUEST)
+
+        try:
+            await sync_to_async(admission.admit)(new_jobs)
+        except admission.RejectedError as exc:
+            return response_from_rejection(exc)
+
+        created_jobs = await sync_to_async(outbox.create_jobs)(new_jobs)
+        return http.JsonResponse({
+            "jobs": [job_to_dict(job, request) for job in created_jobs]
+        })
 
-    model = models.Job
 
-    def render_to_response(self, *args: Any, **kwargs: Any) -> http.HttpResponse:
-        """Show details of this job.
+class JobView(View):
+    """View details of a job.
+
+    Clients poll this while they wait, so only the job's status columns are loaded,
+    and those are cached briefly (until the job changes). Responses have an ETag,
+    so unchanged polls get an empty 304 response.
+    """
+
+    async def get(
+        self, request: http.HttpRequest, *args: Any, **kwargs: Any
+    ) -> http.HttpResponse:
+        """Show details of this job, unless the client already has them.
 
         Note that this response needs to be Ollama-like to work with Ollama clients.
         """
-        return http.JsonResponse(job_to_dict(self.object, self.request))
+        try:
+            job = await jobs.astatus(kwargs["pk"])
+        except models.Job.DoesNotExist as exc:
+            raise http.Http404 from exc
+
+        data = job_to_dict(job, request)
+        etag = quote_etag(
+            hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        )
+        response = get_conditional_response(request, etag=etag) or http.JsonResponse(
+            data
+        )
+        response.headers["ETag"] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+def server_sent_event(event: str, data: Any) -> str:
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class JobWaitView(View):
+    """Wait for a job to complete.
+
+    Responds with the job's details once it has completed, or once ?timeout= seconds
+    have passed. Clients which accept text/event-stream get server-sent events
+    instead: a "status" event each time the job changes, then a "completed" event.
+    """
+
+    async def get(
+        self, request: http.HttpRequest, *args: Any, **kwargs: Any
+    ) -> http.HttpResponseBase:
+        """Wait for this job to complete."""
+        try:
+            timeout = min(
+                float(request.GET.get("timeout", settings.JOB_WAIT_DEFAULT_TIMEOUT)),
+                settings.JOB_WAIT_MAX_TIMEOUT,
+            )
+        except ValueError:
+            return response_from_status(HTTPStatus.BAD_REQUEST)
+
+        try:
+            job = await jobs.astatus(kwargs["pk"])
+        except models.Job.DoesNotExist as exc:
+            raise http.Http404 from exc
+
+        if "text/event-stream" in request.headers.get("Accept", ""):
+            return http.StreamingHttpResponse(
+                self.events(job, timeout),
+                content_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        async for job_status in self.statuses(job, timeout):
+            job = job_status
+        return http.JsonResponse(job_to_dict(job, request))
+
+    async def statuses(
+        self, job: models.Job, seconds: float
+    ) -> AsyncIterator[models.Job]:
+        """Check a job's status until it completes, or for some seconds.
+
+        Jobs are checked when notified that they've completed, and every
+        JOB_WAIT_RECHECK_INTERVAL seconds in case the notification is missed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+        while not jobs.is_complete(job) and (remaining := deadline - loop.time()) > 0:
+            await notifications.wait(
+                job.pk, min(remaining, settings.JOB_WAIT_RECHECK_INTERVAL)
+            )
+            job = await jobs.astatus(job.pk)
+            yield job
+
+    async def events(self, job: models.Job, seconds: float) -> AsyncIterator[str]:
+        """Stream server-sent events as a job's status changes."""
+        details = job_to_dict(job, self.request)
+        yield server_sent_event("status", details)
+        async for job_status in self.statuses(job, seconds):
+            job = job_status
+            if (new_details := job_to_dict(job, self.request)) != details:
+                details = new_details
+                yield server_sent_event("status", details)
+            else:
+                # Keep the connection from looking idle to proxies.
+                yield ": keep-alive\n\n"
+        if jobs.is_complete(job):
+            yield server_sent_event("completed", details)
+
+
+class MetricsView(View):
+    """Prometheus metrics.
+
+    If METRICS_TOKEN is set, it must be given as a bearer token.
+    """
+
+    def get(
+        self, request: http.HttpRequest, *args: Any, **kwargs: Any
+    ) -> http.HttpResponse:
+        """Render metrics."""
+        if settings.METRICS_TOKEN and not hmac.compare_digest(
+            request.headers.get("Authorization", ""),
+            f"Bearer {settings.METRICS_TOKEN}",
+        ):
+            return response_from_status(HTTPStatus.UNAUTHORIZED)
+
+        response = HttpResponse(
+            metrics.generate(), content_type=prometheus_client.CONTENT_TYPE_LATEST
+        )
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -0,0 +1,106 @@
+"""Webhook destinations: per-job webhook URLs and per-host delivery limits.
+
+How many deliveries are in flight to each host, and how many have been sent to it in
+the current second, are shared between workers in Redis. Deliveries in flight are
+held as expiring entries in a sorted set per host, so a worker which dies doesn't
+hold onto its slot for good.
+"""
+
+import fnmatch
+import logging
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django import http
+from django.conf import settings
+
+from ollama_webhooks import factories
+
+logger = logging.getLogger(__name__)
+
+
+def _in_flight_key(host: str) -> str:
+    return f"webhook-in-flight:{host}"
+
+
+def _sent_key(host: str) -> str:
+    return f"webhook-sent:{host}:{int(time.time())}"
+
+
+def url(webhook_url: str) -> str:
+    """Get the URL to send a job's webhook to, defaulting to WEBHOOK_URL."""
+    return webhook_url or settings.WEBHOOK_URL
+
+
+def host(webhook_url: str) -> str:
+    """Get the host a webhook is sent to."""
+    return urlsplit(url(webhook_url)).netloc
+
+
+def is_allowed(webhook_url: str) -> bool:
+    """Check whether jobs may ask for their response to be sent to a URL.
+
+    The URL's host must match one of WEBHOOK_ALLOWED_HOSTS.
+    """
+    parts = urlsplit(webhook_url)
+    return parts.scheme in {"http", "https"} and any(
+        fnmatch.fnmatchcase(parts.hostname or "", pattern)
+        for pattern in settings.WEBHOOK_ALLOWED_HOSTS
+    )
+
+
+def url_from_request(request: http.HttpRequest) -> str:
+    """Get the webhook URL a request asks for, from WEBHOOK_URL_HEADER, if any.
+
+    Raises ValueError if the URL isn't allowed.
+    """
+    webhook_url = request.headers.get(settings.WEBHOOK_URL_HEADER, "")
+    if webhook_url and not is_allowed(webhook_url):
+        msg = f"Sending responses to {webhook_url} isn't allowed."
+        raise ValueError(msg)
+    return webhook_url
+
+
+def acquire(webhook_host: str) -> str | None:
+    """Count a delivery to a host as in flight, unless the host is at a limit.
+
+    Hosts are limited to WEBHOOK_HOST_MAX_IN_FLIGHT deliveries at once and
+    WEBHOOK_HOST_RATE_LIMIT per second. Deliveries only count towards the rate
+    limit once they're within the concurrency limit. Returns a token to release the
+    delivery with, or None if the host is at a limit.
+    """
+    token = ""
+    if settings.WEBHOOK_HOST_MAX_IN_FLIGHT:
+        token = uuid.uuid4().hex
+        now = time.time()
+        # Entries expire once claimed batches would be due again anyway.
+        expires = settings.WEBHOOK_TIMEOUT * 2
+        with factories.redis().pipeline() as pipe:
+            pipe.zremrangebyscore(_in_flight_key(webhook_host), "-inf", now)
+            pipe.zadd(_in_flight_key(webhook_host), {token: now + expires})
+            pipe.expire(_in_flight_key(webhook_host), int(expires) + 1)
+            pipe.zcard(_in_flight_key(webhook_host))
+            *_, in_flight = pipe.execute()
+        if in_flight > settings.WEBHOOK_HOST_MAX_IN_FLIGHT:
+            release(webhook_host, token)
+            logger.debug("Webhook host %s is at its concurrency limit", webhook_host)
+            return None
+
+    if settings.WEBHOOK_HOST_RATE_LIMIT:
+        with factories.redis().pipeline() as pipe:
+            pipe.incr(_sent_key(webhook_host))
+            pipe.expire(_sent_key(webhook_host), 2)
+            sent, _ = pipe.execute()
+        if sent > settings.WEBHOOK_HOST_RATE_LIMIT:
+            release(webhook_host, token)
+            logger.debug("Webhook host %s is at its rate limit", webhook_host)
+            return None
+
+    return token
+
+
+def release(webhook_host: str, token: str) -> None:
+    """Stop counting a delivery to a host as in flight."""
+    if settings.WEBHOOK_HOST_MAX_IN_FLIGHT:
+        factories.redis().zrem(_in_flight_key(webhook_host), token)